@@ -20,6 +20,8 @@
 
 import re
 import struct
+import sys
+from array import array
 
 
 class element_spec(object):
@@ -33,10 +35,83 @@ class element_spec(object):
         self.count = count
         self.properties = []
 
-    def load(self, format, stream):
+    def is_fixed(self):
+        return all(p.list_type is None and p.numeric_type != 's' for p in self.properties)
+
+    def load(self, format, data, offset):
+        """
+        Load the element from data (the file body) at offset (a line index in ascii).
+
+        Returns (columns, offset): one sequence per property (an array for plain
+        properties, a list of tuples for lists) and the offset after the element.
+        """
         if format == b'ascii':
-            stream = stream.readline().split()
-        return [x.load(format, stream) for x in self.properties]
+            if self.is_fixed():
+                columns = self.load_ascii_fixed(data, offset)
+                if columns is not None:
+                    return columns, offset + self.count
+            return self.load_ascii(data, offset)
+        else:
+            if self.is_fixed():
+                return self.load_binary_fixed(format, data, offset)
+            elif len(self.properties) == 1 and self.properties[0].list_type in {'b', 'B'}:
+                columns = self.properties[0].load_uniform_list(format, data, offset, self.count)
+                if columns is not None:
+                    return columns
+            return self.load_binary(format, data, offset)
+
+    def load_ascii_fixed(self, lines, offset):
+        # all the values at once, then every n-th token is one property
+        tokens = b' '.join(lines[offset:offset + self.count]).split()
+        stride = len(self.properties)
+        if len(tokens) != stride * self.count:
+            return None
+        return [p.load_ascii_column(tokens[i::stride]) for i, p in enumerate(self.properties)]
+
+    def load_ascii(self, lines, offset):
+        columns = [[] for p in self.properties]
+        for line in lines[offset:offset + self.count]:
+            tokens = line.split()
+            pos = 0
+            for p, column in zip(self.properties, columns):
+                value, pos = p.load_ascii(tokens, pos)
+                column.append(value)
+        columns = [c if p.list_type is not None or p.numeric_type == 's' else array(p.numeric_type, c)
+                   for p, c in zip(self.properties, columns)]
+        return columns, offset + self.count
+
+    def load_binary_fixed(self, format, data, offset):
+        # elements are records of the same size, each property is a strided slice
+        sizes = [struct.calcsize(format + p.numeric_type) for p in self.properties]
+        stride = sum(sizes)
+        end = offset + stride * self.count
+        block = data[offset:end]
+        if len(block) != stride * self.count:
+            raise EOFError("Unexpected end of file in element %r" % self.name)
+
+        columns = []
+        position = 0
+        for p, size in zip(self.properties, sizes):
+            if size == stride:
+                column_data = block
+            else:
+                column_data = bytearray(size * self.count)
+                for i in range(size):
+                    column_data[i::size] = block[position + i::stride]
+            columns.append(p.column(format, column_data))
+            position += size
+
+        return columns, end
+
+    def load_binary(self, format, data, offset):
+        columns = [[] for p in self.properties]
+        for i in range(self.count):
+            for p, column in zip(self.properties, columns):
+                value, offset = p.load_binary(format, data, offset)
+                column.append(value)
+        columns = [c if p.list_type is not None or p.numeric_type == 's' else array(p.numeric_type, c)
+                   for p, c in zip(self.properties, columns)]
+        return columns, offset
 
     def index(self, name):
         for i, p in enumerate(self.properties):
@@ -56,49 +131,84 @@ class property_spec(object):
         self.list_type = list_type
         self.numeric_type = numeric_type
 
-    def read_format(self, format, count, num_type, stream):
-        if format == b'ascii':
-            if num_type == 's':
-                ans = []
-                for i in range(count):
-                    s = stream[i]
-                    if len(s) < 2 or s[0] != '"' or s[-1] != '"':
-                        print('Invalid string', s)
-                        print('Note: ply_import.py does not handle whitespace in strings')
-                        return None
+    def mapper(self):
+        return float if self.numeric_type in {'f', 'd'} else int
+
+    def column(self, format, column_data):
+        column = array(self.numeric_type)
+        column.frombytes(column_data)
+        if (format == '<') != (sys.byteorder == 'little'):
+            column.byteswap()
+        return column
+
+    def load_ascii_column(self, tokens):
+        return array(self.numeric_type, map(self.mapper(), tokens))
+
+    def load_ascii(self, tokens, pos):
+        if self.list_type is not None:
+            count = int(tokens[pos])
+            pos += 1
+        else:
+            count = 1
+
+        if self.numeric_type == 's':
+            ans = []
+            for s in tokens[pos:pos + count]:
+                if len(s) < 2 or s[:1] != b'"' or s[-1:] != b'"':
+                    print('Invalid string', s)
+                    print('Note: ply_import.py does not handle whitespace in strings')
+                    ans.append(b'')
+                else:
                     ans.append(s[1:-1])
-                stream[:count] = []
-                return ans
-            if num_type == 'f' or num_type == 'd':
-                mapper = float
-            else:
-                mapper = int
-            ans = [mapper(x) for x in stream[:count]]
-            stream[:count] = []
-            return ans
         else:
-            if num_type == 's':
-                ans = []
-                for i in range(count):
-                    fmt = format + 'i'
-                    data = stream.read(struct.calcsize(fmt))
-                    length = struct.unpack(fmt, data)[0]
-                    fmt = '%s%is' % (format, length)
-                    data = stream.read(struct.calcsize(fmt))
-                    s = struct.unpack(fmt, data)[0]
-                    ans.append(s[:-1])  # strip the NULL
-                return ans
-            else:
-                fmt = '%s%i%s' % (format, count, num_type)
-                data = stream.read(struct.calcsize(fmt))
-                return struct.unpack(fmt, data)
+            ans = tuple(map(self.mapper(), tokens[pos:pos + count]))
 
-    def load(self, format, stream):
+        if self.list_type is None:
+            ans = ans[0]
+        return ans, pos + count
+
+    def load_binary(self, format, data, offset):
         if self.list_type is not None:
-            count = int(self.read_format(format, 1, self.list_type, stream)[0])
-            return self.read_format(format, count, self.numeric_type, stream)
+            count = struct.unpack_from(format + self.list_type, data, offset)[0]
+            offset += struct.calcsize(format + self.list_type)
+        else:
+            count = 1
+
+        if self.numeric_type == 's':
+            ans = []
+            for i in range(count):
+                length = struct.unpack_from(format + 'i', data, offset)[0]
+                offset += 4
+                ans.append(data[offset:offset + length - 1])  # strip the NULL
+                offset += length
         else:
-            return self.read_format(format, 1, self.numeric_type, stream)[0]
+            fmt = '%s%i%s' % (format, count, self.numeric_type)
+            ans = struct.unpack_from(fmt, data, offset)
+            offset += struct.calcsize(fmt)
+
+        if self.list_type is None:
+            ans = ans[0]
+        return ans, offset
+
+    def load_uniform_list(self, format, data, offset, count):
+        """
+        Fast path for lists with a one byte length (face 'list uchar int'),
+        when all of them have the same length (all triangles or all quads).
+        """
+        if self.numeric_type == 's' or count == 0 or offset >= len(data):
+            return None
+
+        length = data[offset]
+        if self.list_type == 'b' and length > 127:
+            return None
+        stride = 1 + length * struct.calcsize(format + self.numeric_type)
+        end = offset + stride * count
+        block = data[offset:end]
+        if len(block) != stride * count or block[::stride] != bytes((length,)) * count:
+            return None
+
+        record = struct.Struct('%sx%i%s' % (format, length, self.numeric_type))
+        return [list(record.iter_unpack(block))], end
 
 
 class object_spec(object):
@@ -108,20 +218,15 @@ class object_spec(object):
     def __init__(self):
         self.specs = []
 
-    def load(self, format, stream):
-        return dict([(i.name, [i.load(format, stream) for j in range(i.count)]) for i in self.specs])
+    def load(self, format, data):
+        if format == b'ascii':
+            data = data.splitlines()
 
-        '''
-        # Longhand for above LC
         answer = {}
+        offset = 0
         for i in self.specs:
-            answer[i.name] = []
-            for j in range(i.count):
-                if not j % 100 and meshtools.show_progress:
-                    Blender.Window.DrawProgressBar(float(j) / i.count, 'Loading ' + i.name)
-                answer[i.name].append(i.load(format, stream))
+            answer[i.name], offset = i.load(format, data, offset)
         return answer
-            '''
 
 
 def read(filepath):
@@ -205,11 +310,22 @@ def read(filepath):
             print("Invalid header ('end_header' line not found!)")
             return invalid_ply
 
-        obj = obj_spec.load(format_specs[format], plyf)
+        obj = obj_spec.load(format_specs[format], plyf.read())
 
     return obj_spec, obj, texture
 
 
+def interleave(typecode, *columns):
+    """Flat array of the columns values, element after element"""
+    stride = len(columns)
+    ans = array(typecode, bytes(array(typecode).itemsize * stride * len(columns[0])))
+    for i, column in enumerate(columns):
+        if not isinstance(column, array) or column.typecode != typecode:
+            column = array(typecode, column)
+        ans[i::stride] = column
+    return ans
+
+
 import bpy
 
 
@@ -255,11 +371,11 @@ def load_ply_mesh(filepath, ply_name):
     def add_face(vertices, indices, uvindices, colindices):
         mesh_faces.append(indices)
         if uvindices:
-            mesh_uvs.append([(vertices[index][uvindices[0]], vertices[index][uvindices[1]]) for index in indices])
+            mesh_uvs.append([(vertices[uvindices[0]][index], vertices[uvindices[1]][index]) for index in indices])
         if colindices:
-            mesh_colors.append([(vertices[index][colindices[0]] * colmultiply[0],
-                                 vertices[index][colindices[1]] * colmultiply[1],
-                                 vertices[index][colindices[2]] * colmultiply[2],
+            mesh_colors.append([(vertices[colindices[0]][index] * colmultiply[0],
+                                 vertices[colindices[1]][index] * colmultiply[1],
+                                 vertices[colindices[2]][index] * colmultiply[2],
                                  ) for index in indices])
 
     if uvindices or colindices:
@@ -277,11 +393,11 @@ def load_ply_mesh(filepath, ply_name):
 
             add_face_simple(vertices, indices, uvindices, colindices)
 
+    # elements are loaded as columns, one per property
     verts = obj[b'vertex']
 
     if b'face' in obj:
-        for f in obj[b'face']:
-            ind = f[findex]
+        for ind in obj[b'face'][findex]:
             len_ind = len(ind)
             if len_ind <= 4:
                 add_face(verts, ind, uvindices, colindices)
@@ -291,21 +407,20 @@ def load_ply_mesh(filepath, ply_name):
                     add_face(verts, (ind[0], ind[j + 1], ind[j + 2]), uvindices, colindices)
 
     if b'tristrips' in obj:
-        for t in obj[b'tristrips']:
-            ind = t[trindex]
+        for ind in obj[b'tristrips'][trindex]:
             len_ind = len(ind)
             for j in range(len_ind - 2):
                 add_face(verts, (ind[j], ind[j + 1], ind[j + 2]), uvindices, colindices)
 
     mesh = bpy.data.meshes.new(name=ply_name)
 
-    mesh.vertices.add(len(obj[b'vertex']))
-
-    mesh.vertices.foreach_set("co", [a for v in obj[b'vertex'] for a in (v[vindices_x], v[vindices_y], v[vindices_z])])
+    mesh.vertices.add(len(verts[vindices_x]))
+    mesh.vertices.foreach_set("co", interleave('f', verts[vindices_x], verts[vindices_y], verts[vindices_z]))
 
     if b'edge' in obj:
-        mesh.edges.add(len(obj[b'edge']))
-        mesh.edges.foreach_set("vertices", [a for e in obj[b'edge'] for a in (e[eindex1], e[eindex2])])
+        edges = obj[b'edge']
+        mesh.edges.add(len(edges[eindex1]))
+        mesh.edges.foreach_set("vertices", interleave('i', edges[eindex1], edges[eindex2]))
 
     if mesh_faces:
         mesh.tessfaces.add(len(mesh_faces))
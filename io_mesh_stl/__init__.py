@@ -106,9 +106,9 @@ class ImportSTL(Operator, ImportHelper):
         if bpy.ops.object.select_all.poll():
             bpy.ops.object.select_all(action='DESELECT')
 
-        for path in paths:
+        # files are read in worker processes, meshes are created here
+        for path, (tris, pts) in stl_utils.read_stl_batch(paths):
             objName = bpy.path.display_name(os.path.basename(path))
-            tris, pts = stl_utils.read_stl(path)
             blender_utils.create_and_link_mesh(objName, tris, pts)
 
         return {'FINISHED'}
@@ -19,20 +19,32 @@
 # <pep8 compliant>
 
 import bpy
+from array import array
 
 
 def create_and_link_mesh(name, faces, points):
     """
-    Create a blender mesh and object called name from a list of
-    *points* and *faces* and link it in the current scene.
+    Create a blender mesh and object called name from flat arrays of
+    *points* (3 coordinates each) and *faces* (3 point indices each, see
+    stl_utils.read_stl) and link it in the current scene.
     """
 
+    nbr_tris = len(faces) // 3
+
     mesh = bpy.data.meshes.new(name)
-    mesh.from_pydata(points, [], faces)
+    mesh.vertices.add(len(points) // 3)
+    mesh.vertices.foreach_set("co", points)
+
+    mesh.loops.add(len(faces))
+    mesh.loops.foreach_set("vertex_index", faces)
+
+    mesh.polygons.add(nbr_tris)
+    mesh.polygons.foreach_set("loop_start", array('i', range(0, nbr_tris * 3, 3)))
+    mesh.polygons.foreach_set("loop_total", array('i', (3,)) * nbr_tris)
 
     # update mesh to allow proper display
     mesh.validate()
-    mesh.update()
+    mesh.update(calc_edges=True)
 
     scene = bpy.context.scene
 
@@ -67,24 +79,24 @@ def faces_from_mesh(ob, global_matrix, use_mesh_modifiers=False, triangulate=Tru
 
     mesh.transform(global_matrix * ob.matrix_world)
 
-    if triangulate:
-        # From a list of faces, return the face triangulated if needed.
-        def iter_face_index():
-            for face in mesh.tessfaces:
-                vertices = face.vertices[:]
-                if len(vertices) == 4:
-                    yield vertices[0], vertices[1], vertices[2]
-                    yield vertices[2], vertices[3], vertices[0]
-                else:
-                    yield vertices
-    else:
-        def iter_face_index():
-            for face in mesh.tessfaces:
-                yield face.vertices[:]
-
-    vertices = mesh.vertices
-
-    for indexes in iter_face_index():
-        yield [vertices[index].co.copy() for index in indexes]
+    # read all coordinates and faces at once, faces are built from them
+    co = array('f', (0.0,)) * (len(mesh.vertices) * 3)
+    mesh.vertices.foreach_get("co", co)
+    vertices = [tuple(co[i:i + 3]) for i in range(0, len(co), 3)]
+
+    # 4 indices per face, the last one is 0 for triangles
+    faces = array('i', (0,)) * (len(mesh.tessfaces) * 4)
+    mesh.tessfaces.foreach_get("vertices_raw", faces)
+
+    for i in range(0, len(faces), 4):
+        v1, v2, v3, v4 = faces[i:i + 4]
+        if not v4:
+            yield [vertices[v1], vertices[v2], vertices[v3]]
+        elif triangulate:
+            # Split the quad into two triangles
+            yield [vertices[v1], vertices[v2], vertices[v3]]
+            yield [vertices[v3], vertices[v4], vertices[v1]]
+        else:
+            yield [vertices[v1], vertices[v2], vertices[v3], vertices[v4]]
 
     bpy.data.meshes.remove(mesh)
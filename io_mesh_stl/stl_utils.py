@@ -30,9 +30,8 @@ import struct
 import mmap
 import contextlib
 import itertools
-from mathutils.geometry import normal
-
-# TODO: endien
+import sys
+from array import array
 
 
 @contextlib.contextmanager
@@ -55,37 +54,12 @@ def mmap_file(filepath):
         mem_map.close()
 
 
-class ListDict(dict):
-    """
-    Set struct with order.
-
-    You can:
-       - insert data into without doubles
-       - get the list of data in insertion order with self.list
-
-    Like collections.OrderedDict, but quicker, can be replaced if
-    ODict is optimised.
-    """
-
-    def __init__(self):
-        dict.__init__(self)
-        self.list = []
-        self._len = 0
-
-    def add(self, item):
-        """
-        Add a value to the Set, return its position in it.
-        """
-        value = self.setdefault(item, self._len)
-        if value == self._len:
-            self.list.append(item)
-            self._len += 1
-
-        return value
-
 BINARY_HEADER = 80
 BINARY_STRIDE = 12 * 4 + 2
 
+# triangles read/written with a single struct call
+BINARY_CHUNK = 4096
+
 
 def _header_version():
     import bpy
@@ -115,18 +89,25 @@ def _binary_read(data):
     #   - 9 * 4 bytes of coordinate (3*3 floats)
     #   - 2 bytes of garbage (usually 0)
 
-    # OFFSET for the first byte of coordinate (headers + first normal bytes)
-    # STRIDE between each triangle (first normal + coordinates + garbage)
-    OFFSET = BINARY_HEADER + 4 + 12
+    # OFFSET for the first byte of the first triangle (headers)
+    OFFSET = BINARY_HEADER + 4
 
     # read header size, ignore description
     size = struct.unpack_from('<I', data, BINARY_HEADER)[0]
-    unpack = struct.Struct('<9f').unpack_from
 
-    for i in range(size):
-        # read the points coordinates of each triangle
-        pt = unpack(data, OFFSET + BINARY_STRIDE * i)
-        yield pt[:3], pt[3:6], pt[6:]
+    # returns the raw bytes of each point (3 little endian floats), without
+    # converting them, BINARY_CHUNK triangles at a time.
+    def unpack_struct(count):
+        return struct.Struct('<' + '12x12s12s12s2x' * count).unpack_from
+
+    unpack = unpack_struct(BINARY_CHUNK)
+
+    for offset in range(0, size - BINARY_CHUNK + 1, BINARY_CHUNK):
+        yield from unpack(data, OFFSET + BINARY_STRIDE * offset)
+
+    rest = size % BINARY_CHUNK
+    if rest:
+        yield from unpack_struct(rest)(data, OFFSET + BINARY_STRIDE * (size - rest))
 
 
 def _ascii_read(data):
@@ -153,11 +134,44 @@ def _ascii_read(data):
         # if we encounter a vertex, read next 2
         l = l.lstrip()
         if l.startswith(b'vertex'):
-            yield [tuple(map(float, l_item.split()[1:]))
-                   for l_item in (l, data.readline(), data.readline())]
+            for l_item in (l, data.readline(), data.readline()):
+                # same point representation as binary files
+                yield pack_point(*map(float, l_item.split()[1:]))
+
+
+pack_point = struct.Struct('<3f').pack
+unpack_point = struct.Struct('<3f').unpack
+
+# bytes of a little endian -0.0 float
+NEGATIVE_ZERO = struct.pack('<f', -0.0)
+
+
+def _merge_negative_zero(tris, index):
+    # -0.0 and 0.0 are equal points, but their bytes aren't: merge the points
+    # only differing by the sign of their zeros, keeping the first one seen.
+    if not any(NEGATIVE_ZERO in pt for pt in index):
+        return tris, index
+
+    # index values are in order of first appearance, so are the merged ones
+    merged = {}
+    remap = [None] * len(index)
+    for pt, i in sorted(index.items(), key=lambda item: item[1]):
+        key = pack_point(*[v + 0.0 for v in unpack_point(pt)]) if NEGATIVE_ZERO in pt else pt
+        remap[i] = merged.setdefault(key, len(merged))
+
+    if len(merged) == len(index):
+        return tris, index
+
+    index_merged = {}
+    for pt, i in index.items():
+        index_merged.setdefault(remap[i], pt)
+
+    return array('i', map(remap.__getitem__, tris)), {pt: i for i, pt in index_merged.items()}
 
 
 def _binary_write(filepath, faces):
+    from mathutils.geometry import normal
+
     with open(filepath, 'wb') as data:
         fw = data.write
         # header
@@ -165,19 +179,34 @@ def _binary_write(filepath, faces):
         # call len(list(faces)) which may be expensive
         fw(struct.calcsize('<80sI') * b'\0')
 
-        # 3 vertex == 9f
-        pack = struct.Struct('<9f').pack
+        # normal + 3 vertex == 12f, attribute byte count (unused) is left to 0
+        def pack_struct(count):
+            return struct.Struct('<' + '12f2x' * count).pack
+
+        pack = pack_struct(BINARY_CHUNK)
 
         # number of vertices written
         nb = 0
 
-        for face in faces:
-            # calculate face normal
-            # write normal + vertexes + pad as attributes
-            fw(struct.pack('<3f', *normal(*face)) + pack(*itertools.chain.from_iterable(face)))
-            # attribute byte count (unused)
-            fw(b'\0\0') 
-            nb += 1
+        faces = iter(faces)
+        while True:
+            chunk = list(itertools.islice(faces, BINARY_CHUNK))
+            if not chunk:
+                break
+
+            values = []
+            for face in chunk:
+                # calculate face normal
+                values.extend(normal(*face))
+                for vert in face:
+                    values.extend(vert)
+
+            # one buffer for the whole chunk
+            if len(chunk) == BINARY_CHUNK:
+                fw(pack(*values))
+            else:
+                fw(pack_struct(len(chunk))(*values))
+            nb += len(chunk)
 
         # header, with correct value now
         data.seek(0)
@@ -185,6 +214,8 @@ def _binary_write(filepath, faces):
 
 
 def _ascii_write(filepath, faces):
+    from mathutils.geometry import normal
+
     with open(filepath, 'w') as data:
         fw = data.write
         header = _header_version()
@@ -223,42 +254,78 @@ def read_stl(filepath):
     """
     Return the triangles and points of an stl binary file.
 
-    Please note that this process can take lot of time if the file is
-    huge (~1m30 for a 1 Go stl file on an quad core i7).
-
     - returns a tuple(triangles, points).
 
       triangles
-          A list of triangles, each triangle as a tuple of 3 index of
-          point in *points*.
+          A flat array of point indices in *points*, 3 per triangle.
 
       points
-          An indexed list of points, each point is a tuple of 3 float
-          (xyz).
+          A flat array of coordinates, 3 float (xyz) per point.
 
     Example of use:
 
-       >>> tris, pts = read_stl(filepath, lambda x:)
-       >>> pts = list(pts)
+       >>> tris, pts = read_stl(filepath)
        >>>
        >>> # print the coordinate of the triangle n
-       >>> print(pts[i] for i in tris[n])
+       >>> print([pts[i * 3:i * 3 + 3] for i in tris[n * 3:n * 3 + 3]])
     """
 
-    tris, pts = [], ListDict()
-
     with mmap_file(filepath) as data:
         # check for ascii or binary
         gen = _ascii_read if _is_ascii_file(data) else _binary_read
 
-        for pt in gen(data):
-            # Add the triangle and the point.
-            # If the point is allready in the list of points, the
-            # index returned by pts.add() will be the one from the
-            # first equal point inserted.
-            tris.append([pts.add(p) for p in pt])
+        # Points are compared on their packed bytes, if a point is
+        # allready known, the index is the one from the first equal
+        # point inserted (len(index) is evaluated before insertion).
+        index = {}
+        tris = array('i', [index.setdefault(pt, len(index)) for pt in gen(data)])
+
+    tris, index = _merge_negative_zero(tris, index)
+
+    # points in insertion order
+    pts_data = [None] * len(index)
+    for pt, i in index.items():
+        pts_data[i] = pt
+
+    pts = array('f')
+    pts.frombytes(b''.join(pts_data))
+    if sys.byteorder != 'little':
+        pts.byteswap()
+
+    return tris, pts
+
+
+def read_stl_batch(filepaths, processes=None):
+    """
+    Read many stl files, in worker processes when possible.
+
+    - returns an iterator over a tuple(filepath, (triangles, points)) per
+      file (see read_stl), in *filepaths* order. Each result is available
+      as soon as its file is read, so meshes can be created while the
+      following files are still being read.
+
+    Reading is pure python (no bpy), workers are forked, on systems
+    without fork files are read one after the other. So are they when
+    run inside Blender: forking it (and its threads) isn't safe, and
+    workers can't be spawned, the add-on needs bpy.
+    """
+    import multiprocessing
+
+    context = None
+    if "bpy" not in sys.modules:
+        try:
+            context = multiprocessing.get_context("fork")
+        except (AttributeError, ValueError):
+            # no get_context before python 3.4, no fork on some systems
+            pass
+
+    if context is None or len(filepaths) < 2:
+        for filepath in filepaths:
+            yield filepath, read_stl(filepath)
+        return
 
-    return tris, pts.list
+    with context.Pool(processes) as pool:
+        yield from zip(filepaths, pool.imap(read_stl, filepaths))
 
 
 if __name__ == '__main__':
@@ -268,8 +335,7 @@ if __name__ == '__main__':
 
     filepaths = sys.argv[sys.argv.index('--') + 1:]
 
-    for filepath in filepaths:
+    for filepath, (tris, pts) in read_stl_batch(filepaths):
         objName = bpy.path.display_name(filepath)
-        tris, pts = read_stl(filepath)
 
         blender_utils.create_and_link_mesh(objName, tris, pts)
@@ -46,6 +46,7 @@ if "bpy" in locals():
 import bpy
 from bpy.props import (StringProperty,
                        BoolProperty,
+                       IntProperty,
                        FloatProperty,
                        EnumProperty,
                        )
@@ -284,9 +285,10 @@ class ExportFBX(bpy.types.Operator, ExportHelper):
     )
     bake_anim_simplify_factor = FloatProperty(
         name="Simplify",
-        description=("How much to simplify baked values (0.0 to disable, the higher the more simplified"),
-        min=0.0, max=10.0,  # No simplification to up to 0.05 slope/100 max_frame_step.
-        default=1.0,  # default: min slope: 0.005, max frame step: 10.
+        description=("How much to simplify baked values, i.e. the error tolerated when removing keyframes "
+                     "(in thousandths of each channel's range of values, 0.0 to disable)"),
+        min=0.0, max=10.0,
+        default=1.0,  # default: 0.1% of channel's range.
     )
     # Anim - 6.1
     use_anim = BoolProperty(
@@ -325,6 +327,22 @@ class ExportFBX(bpy.types.Operator, ExportHelper):
         description="Embed textures in FBX binary file (only for \"Copy\" path mode!)",
         default=False,
     )
+    # 7.4 only
+    compression_level = IntProperty(
+        name="Compression",
+        description="Compression level of arrays data (0 to disable compression, 9 for smallest files)",
+        min=0, max=9,
+        default=1,
+    )
+    # 7.4 only
+    compression_threshold = IntProperty(
+        name="Compression Threshold",
+        description="Only compress arrays bigger than this size (in bytes)",
+        min=0,
+        soft_max=1024 * 1024,
+        default=128,
+        subtype='UNSIGNED',
+    )
     batch_mode = EnumProperty(
         name="Batch Mode",
         items=(('OFF', "Off", "Active scene to file"),
@@ -386,6 +404,10 @@ class ExportFBX(bpy.types.Operator, ExportHelper):
             col = layout.column()
             col.enabled = (self.path_mode == 'COPY')
             col.prop(self, "embed_textures")
+            layout.prop(self, "compression_level")
+            col = layout.column()
+            col.enabled = (self.compression_level != 0)
+            col.prop(self, "compression_threshold")
         layout.prop(self, "batch_mode")
         layout.prop(self, "use_batch_own_dir")
 
@@ -25,8 +25,9 @@ try:
 except:
     import data_types
 
-from struct import pack
+from struct import pack, pack_into
 import array
+import mmap
 import zlib
 
 _BLOCK_SENTINEL_LENGTH = 13
@@ -45,15 +46,38 @@ _FOOT_ID = b'\xfa\xbc\xab\x09\xd0\xc8\xd4\x66\xb1\x76\xfb\x83\x1c\xf7\x26\x7e'
 # Awful exceptions: those "classes" of elements seem to need block sentinel even when having no children and some props.
 _ELEMS_ID_ALWAYS_BLOCK_SENTINEL = {b"AnimationStack", b"AnimationLayer"}
 
+# Arrays compression settings, see init_write().
+_compression_level = 1
+_compression_threshold = 128
+_compression_executor = None
+
+
+def init_write(compression_level=1, compression_threshold=128, use_threads=True):
+    """
+    Call before adding data to elements, arrays bigger than compression_threshold (in bytes)
+    get compressed with given zlib level (0 disables compression),
+    in a pool of threads when use_threads is enabled.
+    """
+    global _compression_level, _compression_threshold, _compression_executor
+
+    _compression_level = compression_level
+    _compression_threshold = compression_threshold
+
+    if _compression_executor is not None:
+        _compression_executor.shutdown()
+        _compression_executor = None
+    if use_threads and compression_level != 0:
+        import os
+        from concurrent.futures import ThreadPoolExecutor
+        _compression_executor = ThreadPoolExecutor(max_workers=os.cpu_count() or 1)
+
+
 class FBXElem:
     __slots__ = (
         "id",
         "props",
         "props_type",
         "elems",
-
-        "_props_length",  # combine length of props
-        "_end_offset",  # byte offset from the start of the file.
         )
 
     def __init__(self, id):
@@ -62,8 +86,6 @@ class FBXElem:
         self.props = []
         self.props_type = bytearray()
         self.elems = []
-        self._end_offset = -1
-        self._props_length = -1
 
     def add_bool(self, data):
         assert(isinstance(data, bool))
@@ -138,19 +160,21 @@ class FBXElem:
         if _IS_BIG_ENDIAN:
             data = data[:]
             data.byteswap()
-        data = data.tobytes()
 
         # mimic behavior of fbxconverter (also common sense)
-        # we could make this configurable.
-        encoding = 0 if len(data) <= 128 else 1
+        # see init_write() to configure this.
+        data_size = len(data) * data.itemsize
+        encoding = 0 if (_compression_level == 0 or data_size <= _compression_threshold) else 1
         if encoding == 0:
-            pass
-        elif encoding == 1:
-            data = zlib.compress(data, 1)
-
-        comp_len = len(data)
-
-        data = pack('<3I', length, encoding, comp_len) + data
+            data = pack('<3I', length, encoding, data_size) + data.tobytes()
+        elif _compression_executor is not None:
+            # compressed in the background, resolved when writing.
+            # Copy, since caller may modify its array in the mean time.
+            if not _IS_BIG_ENDIAN:
+                data = data[:]
+            data = _compression_executor.submit(_array_compress, data, length)
+        else:
+            data = _array_compress(data, length)
 
         self.props_type.append(prop_type)
         self.props.append(data)
@@ -188,71 +212,64 @@ class FBXElem:
     # -------------------------
     # internal helper functions
 
-    def _calc_offsets(self, offset, is_last):
+    def _write(self, write, tell, is_last, end_offsets):
         """
-        Call before writing, calculates fixed offsets.
+        Write this element in a single pass, its end offset is written directly when it has no children,
+        otherwise it is stored in end_offsets as an (offset, end_offset) pair, to be patched afterwards.
         """
-        assert(self._end_offset == -1)
-        assert(self._props_length == -1)
-
-        offset += 12  # 3 uints
-        offset += 1 + len(self.id)  # len + idname
-
+        props = self.props
         props_length = 0
-        for data in self.props:
+        for i, data in enumerate(props):
+            if type(data) is not bytes:
+                # compression still pending.
+                props[i] = data = data.result()
             # 1 byte for the prop type
             props_length += 1 + len(data)
-        self._props_length = props_length
-        offset += props_length
 
-        offset = self._calc_offsets_children(offset, is_last)
+        offset = tell()
+        end_offset = 0
+        if not self.elems:
+            end_offset = offset + 12 + 1 + len(self.id) + props_length
+            if (not props or self.id in _ELEMS_ID_ALWAYS_BLOCK_SENTINEL) and not is_last:
+                end_offset += _BLOCK_SENTINEL_LENGTH
 
-        self._end_offset = offset
-        return offset
-
-    def _calc_offsets_children(self, offset, is_last):
-        if self.elems:
-            elem_last = self.elems[-1]
-            for elem in self.elems:
-                offset = elem._calc_offsets(offset, (elem is elem_last))
-            offset += _BLOCK_SENTINEL_LENGTH
-        elif not self.props or self.id in _ELEMS_ID_ALWAYS_BLOCK_SENTINEL:
-            if not is_last:
-                offset += _BLOCK_SENTINEL_LENGTH
-
-        return offset
-
-    def _write(self, write, tell, is_last):
-        assert(self._end_offset != -1)
-        assert(self._props_length != -1)
-
-        write(pack('<3I', self._end_offset, len(self.props), self._props_length))
+        write(pack('<3I', end_offset, len(props), props_length))
 
         write(bytes((len(self.id),)))
         write(self.id)
 
-        for i, data in enumerate(self.props):
+        for i, data in enumerate(props):
             write(bytes((self.props_type[i],)))
             write(data)
 
-        self._write_children(write, tell, is_last)
+        self._write_children(write, tell, is_last, end_offsets)
+
+        # written, no need to keep (potentially big) data around anymore.
+        props.clear()
 
-        if tell() != self._end_offset:
+        if end_offset == 0:
+            end_offsets.append((offset, tell()))
+        elif tell() != end_offset:
             raise IOError("scope length not reached, "
                           "something is wrong (%d)" % (end_offset - tell()))
 
-    def _write_children(self, write, tell, is_last):
+    def _write_children(self, write, tell, is_last, end_offsets):
         if self.elems:
             elem_last = self.elems[-1]
             for elem in self.elems:
                 assert(elem.id != b'')
-                elem._write(write, tell, (elem is elem_last))
+                elem._write(write, tell, (elem is elem_last), end_offsets)
             write(_BLOCK_SENTINEL_DATA)
         elif not self.props or self.id in _ELEMS_ID_ALWAYS_BLOCK_SENTINEL:
             if not is_last:
                 write(_BLOCK_SENTINEL_DATA)
 
 
+def _array_compress(data, length):
+    data = zlib.compress(data, _compression_level)
+    return pack('<3I', length, 1, len(data)) + data
+
+
 def _write_timedate_hack(elem_root):
     # perform 2 changes
     # - set the FileID
@@ -285,9 +302,17 @@ def _write_timedate_hack(elem_root):
 
 
 def write(fn, elem_root, version):
+    """
+    Write the whole elem_root tree, note that properties' data is released once written.
+    """
+    global _compression_executor
+
     assert(elem_root.id == b'')
 
-    with open(fn, 'wb') as f:
+    # (offset, end_offset) of elements with children, only known once their children have been written.
+    end_offsets = []
+
+    with open(fn, 'w+b') as f:
         write = f.write
         tell = f.tell
 
@@ -298,8 +323,7 @@ def write(fn, elem_root, version):
         # ideally we would _not_ modify this data.
         _write_timedate_hack(elem_root)
 
-        elem_root._calc_offsets_children(tell(), False)
-        elem_root._write_children(write, tell, False)
+        elem_root._write_children(write, tell, False, end_offsets)
 
         write(_FOOT_ID)
         write(b'\x00' * 4)
@@ -318,3 +342,13 @@ def write(fn, elem_root, version):
         # unknown magic (always the same)
         write(b'\0' * 120)
         write(b'\xf8\x5a\x8c\x6a\xde\xf5\xd9\x7e\xec\xe9\x0c\xe3\x75\x8f\x29\x0b')
+
+        # back-patch end offsets, through a mapping to avoid flushing file buffer for each of them.
+        f.flush()
+        with mmap.mmap(f.fileno(), 0) as buf:
+            for offset, end_offset in end_offsets:
+                pack_into('<I', buf, offset, end_offset)
+
+    if _compression_executor is not None:
+        _compression_executor.shutdown()
+        _compression_executor = None
@@ -50,7 +50,7 @@ from .fbx_utils import (
     FBX_LIGHT_TYPES, FBX_LIGHT_DECAY_TYPES,
     RIGHT_HAND_AXES, FBX_FRAMERATES,
     # Miscellaneous utils.
-    units_convert, units_convert_iter, matrix_to_array, similar_values,
+    units_convert, units_convert_iter, matrix_to_array, similar_values, array_unique_indexed,
     # UUID from key.
     get_fbx_uuid_from_key,
     # Key generators.
@@ -68,6 +68,8 @@ from .fbx_utils import (
     elem_data_single_float32_array, elem_data_single_float64_array, elem_data_vec_float64,
     # FBX element properties.
     elem_properties, elem_props_set, elem_props_compound,
+    # Animation.
+    AnimationCurveBaker,
     # FBX element properties handling templates.
     elem_props_template_init, elem_props_template_set, elem_props_template_finalize,
     # Templates.
@@ -659,11 +661,6 @@ def fbx_data_mesh_elements(root, me_obj, scene_data, done_meshes):
     """
     Write the Mesh (Geometry) data block.
     """
-    # Ugly helper... :/
-    def _infinite_gen(val):
-        while 1:
-            yield val
-
     me_key, me, _free = scene_data.data_meshes[me_obj]
 
     # In case of multiple instances of same mesh, only write it once!
@@ -718,7 +715,7 @@ def fbx_data_mesh_elements(root, me_obj, scene_data, done_meshes):
     # Note we have to process Edges in the same time, as they are based on poly's loops...
     loop_nbr = len(me.loops)
     t_pvi = array.array(data_types.ARRAY_INT32, (0,)) * loop_nbr
-    t_ls = [None] * len(me.polygons)
+    t_ls = array.array(data_types.ARRAY_INT32, (0,)) * len(me.polygons)
 
     me.loops.foreach_get("vertex_index", t_pvi)
     me.polygons.foreach_get("loop_start", t_ls)
@@ -739,18 +736,18 @@ def fbx_data_mesh_elements(root, me_obj, scene_data, done_meshes):
     #       We also have to store a mapping from real edges to their indices in this array, for edge-mapped data
     #       (like e.g. crease).
     t_eli = array.array(data_types.ARRAY_INT32)
+    t_ev = array.array(data_types.ARRAY_INT32, (0,)) * len(me.edges) * 2
+    me.edges.foreach_get("vertices", t_ev)
     edges_map = {}
     edges_nbr = 0
     if t_ls and t_pvi:
-        t_ls = set(t_ls)
-        todo_edges = [None] * len(me.edges) * 2
-        me.edges.foreach_get("vertices", todo_edges)
-        todo_edges = set((v1, v2) if v1 < v2 else (v2, v1) for v1, v2 in zip(*(iter(todo_edges),) * 2))
+        t_ls_set = set(t_ls)
+        todo_edges = set((v1, v2) if v1 < v2 else (v2, v1) for v1, v2 in zip(t_ev[0::2], t_ev[1::2]))
 
         li = 0
         vi = vi_start = t_pvi[0]
         for li_next, vi_next in enumerate(t_pvi[1:] + t_pvi[:1], start=1):
-            if li_next in t_ls:  # End of a poly's loop.
+            if li_next in t_ls_set:  # End of a poly's loop.
                 vi2 = vi_start
                 vi_start = vi_next
             else:
@@ -765,6 +762,7 @@ def fbx_data_mesh_elements(root, me_obj, scene_data, done_meshes):
 
             vi = vi_next
             li = li_next
+        del t_ls_set
     # End of edges!
 
     # We have to ^-1 last index of each loop.
@@ -790,11 +788,15 @@ def fbx_data_mesh_elements(root, me_obj, scene_data, done_meshes):
             _map = b"ByPolygon"
         else:  # EDGE
             # Write Edge Smoothing.
+            t_es = array.array(data_types.ARRAY_INT32, (0,)) * len(me.edges)
+            me.edges.foreach_get("use_edge_sharp", t_es)
             t_ps = array.array(data_types.ARRAY_INT32, (0,)) * edges_nbr
-            for e in me.edges:
-                if e.key not in edges_map:
+            for v1, v2, sharp in zip(t_ev[0::2], t_ev[1::2], t_es):
+                e_idx = edges_map.get((v1, v2) if v1 < v2 else (v2, v1))
+                if e_idx is None:
                     continue  # Only loose edges, in theory!
-                t_ps[edges_map[e.key]] = not e.use_edge_sharp
+                t_ps[e_idx] = not sharp
+            del t_es
             _map = b"ByEdge"
         lay_smooth = elem_data_single_int32(geom, b"LayerElementSmoothing", 0)
         elem_data_single_int32(lay_smooth, b"Version", FBX_GEOMETRY_SMOOTHING_VERSION)
@@ -808,6 +810,7 @@ def fbx_data_mesh_elements(root, me_obj, scene_data, done_meshes):
 
     # And we are done with edges!
     del edges_map
+    del t_ev
 
     # Loop normals.
     # NOTE: this is not supported by importer currently.
@@ -818,15 +821,17 @@ def fbx_data_mesh_elements(root, me_obj, scene_data, done_meshes):
     def _nortuples_gen(raw_nors, m):
         # Great, now normals are also expected 4D!
         # XXX Back to 3D normals for now!
-        #gen = zip(*(iter(raw_nors),) * 3 + (_infinite_gen(1.0),))
         gen = zip(*(iter(raw_nors),) * 3)
         return gen if m is None else (m * Vector(v) for v in gen)
 
+    def _nor_array(raw_nors, m):
+        # Flat array can be used as-is when there is no transform.
+        return raw_nors if m is None else chain(*_nortuples_gen(raw_nors, m))
+
     t_ln = array.array(data_types.ARRAY_FLOAT64, (0.0,)) * len(me.loops) * 3
     me.loops.foreach_get("normal", t_ln)
-    t_ln = _nortuples_gen(t_ln, geom_mat_no)
     if 0:
-        t_ln = tuple(t_ln)  # No choice... :/
+        t_ln = tuple(_nortuples_gen(t_ln, geom_mat_no))  # No choice... :/
 
         lay_nor = elem_data_single_int32(geom, b"LayerElementNormal", 0)
         elem_data_single_int32(lay_nor, b"Version", FBX_GEOMETRY_NORMAL_VERSION)
@@ -851,7 +856,7 @@ def fbx_data_mesh_elements(root, me_obj, scene_data, done_meshes):
         elem_data_single_string(lay_nor, b"Name", b"")
         elem_data_single_string(lay_nor, b"MappingInformationType", b"ByPolygonVertex")
         elem_data_single_string(lay_nor, b"ReferenceInformationType", b"Direct")
-        elem_data_single_float64_array(lay_nor, b"Normals", chain(*t_ln))
+        elem_data_single_float64_array(lay_nor, b"Normals", _nor_array(t_ln, geom_mat_no))
         # Normal weights, no idea what it is.
         #t_ln = array.array(data_types.ARRAY_FLOAT64, (0.0,)) * len(me.loops)
         #elem_data_single_float64_array(lay_nor, b"NormalsW", t_ln)
@@ -875,7 +880,7 @@ def fbx_data_mesh_elements(root, me_obj, scene_data, done_meshes):
                 elem_data_single_string_unicode(lay_nor, b"Name", name)
                 elem_data_single_string(lay_nor, b"MappingInformationType", b"ByPolygonVertex")
                 elem_data_single_string(lay_nor, b"ReferenceInformationType", b"Direct")
-                elem_data_single_float64_array(lay_nor, b"Binormals", chain(*_nortuples_gen(t_ln, geom_mat_no)))
+                elem_data_single_float64_array(lay_nor, b"Binormals", _nor_array(t_ln, geom_mat_no))
                 # Binormal weights, no idea what it is.
                 #elem_data_single_float64_array(lay_nor, b"BinormalsW", t_lnw)
 
@@ -887,7 +892,7 @@ def fbx_data_mesh_elements(root, me_obj, scene_data, done_meshes):
                 elem_data_single_string_unicode(lay_nor, b"Name", name)
                 elem_data_single_string(lay_nor, b"MappingInformationType", b"ByPolygonVertex")
                 elem_data_single_string(lay_nor, b"ReferenceInformationType", b"Direct")
-                elem_data_single_float64_array(lay_nor, b"Tangents", chain(*_nortuples_gen(t_ln, geom_mat_no)))
+                elem_data_single_float64_array(lay_nor, b"Tangents", _nor_array(t_ln, geom_mat_no))
                 # Tangent weights, no idea what it is.
                 #elem_data_single_float64_array(lay_nor, b"TangentsW", t_lnw)
 
@@ -897,40 +902,37 @@ def fbx_data_mesh_elements(root, me_obj, scene_data, done_meshes):
 
     me.free_normals_split()
     del _nortuples_gen
+    del _nor_array
 
     # Write VertexColor Layers
     # note, no programs seem to use this info :/
     vcolnumber = len(me.vertex_colors)
     if vcolnumber:
-        def _coltuples_gen(raw_cols):
-            return zip(*(iter(raw_cols),) * 3 + (_infinite_gen(1.0),))  # We need a fake alpha...
-
         t_lc = array.array(data_types.ARRAY_FLOAT64, (0.0,)) * len(me.loops) * 3
+        # We need a fake alpha...
+        t_lc4 = array.array(data_types.ARRAY_FLOAT64, (1.0,)) * len(me.loops) * 4
         for colindex, collayer in enumerate(me.vertex_colors):
             collayer.data.foreach_get("color", t_lc)
+            for i in range(3):
+                t_lc4[i::4] = t_lc[i::3]
             lay_vcol = elem_data_single_int32(geom, b"LayerElementColor", colindex)
             elem_data_single_int32(lay_vcol, b"Version", FBX_GEOMETRY_VCOLOR_VERSION)
             elem_data_single_string_unicode(lay_vcol, b"Name", collayer.name)
             elem_data_single_string(lay_vcol, b"MappingInformationType", b"ByPolygonVertex")
             elem_data_single_string(lay_vcol, b"ReferenceInformationType", b"IndexToDirect")
 
-            col2idx = tuple(set(_coltuples_gen(t_lc)))
-            elem_data_single_float64_array(lay_vcol, b"Colors", chain(*col2idx))  # Flatten again...
-
-            col2idx = {col: idx for idx, col in enumerate(col2idx)}
-            elem_data_single_int32_array(lay_vcol, b"ColorIndex", (col2idx[c] for c in _coltuples_gen(t_lc)))
-            del col2idx
+            t_col, t_coli = array_unique_indexed(t_lc4, 4)
+            elem_data_single_float64_array(lay_vcol, b"Colors", t_col)
+            elem_data_single_int32_array(lay_vcol, b"ColorIndex", t_coli)
+            del t_col, t_coli
         del t_lc
-        del _coltuples_gen
+        del t_lc4
 
     # Write UV layers.
     # Note: LayerElementTexture is deprecated since FBX 2011 - luckily!
     #       Textures are now only related to materials, in FBX!
     uvnumber = len(me.uv_layers)
     if uvnumber:
-        def _uvtuples_gen(raw_uvs):
-            return zip(*(iter(raw_uvs),) * 2)
-
         t_luv = array.array(data_types.ARRAY_FLOAT64, (0.0,)) * len(me.loops) * 2
         for uvindex, uvlayer in enumerate(me.uv_layers):
             uvlayer.data.foreach_get("uv", t_luv)
@@ -940,14 +942,11 @@ def fbx_data_mesh_elements(root, me_obj, scene_data, done_meshes):
             elem_data_single_string(lay_uv, b"MappingInformationType", b"ByPolygonVertex")
             elem_data_single_string(lay_uv, b"ReferenceInformationType", b"IndexToDirect")
 
-            uv2idx = tuple(set(_uvtuples_gen(t_luv)))
-            elem_data_single_float64_array(lay_uv, b"UV", chain(*uv2idx))  # Flatten again...
-
-            uv2idx = {uv: idx for idx, uv in enumerate(uv2idx)}
-            elem_data_single_int32_array(lay_uv, b"UVIndex", (uv2idx[uv] for uv in _uvtuples_gen(t_luv)))
-            del uv2idx
+            t_uv, t_uvi = array_unique_indexed(t_luv, 2)
+            elem_data_single_float64_array(lay_uv, b"UV", t_uv)
+            elem_data_single_int32_array(lay_uv, b"UVIndex", t_uvi)
+            del t_uv, t_uvi
         del t_luv
-        del _uvtuples_gen
 
     # Face's materials.
     me_fbxmats_idx = None
@@ -1575,60 +1574,12 @@ def fbx_skeleton_from_armature(scene, settings, arm_obj, objects, data_meshes,
     objects.update(bones)
 
 
-def fbx_animations_simplify(scene_data, animdata):
-    """
-    Simplifies FCurves!
-    """
-    fac = scene_data.settings.bake_anim_simplify_factor
-    step = scene_data.settings.bake_anim_step
-    # So that, with default factor and step values (1), we get:
-    max_frame_diff = step * fac * 10  # max step of 10 frames.
-    value_diff_fac = fac / 1000  # min value evolution: 0.1% of whole range.
-    min_significant_diff = 1.0e-6
-
-    for keys in animdata.values():
-        if not keys:
-            continue
-        extremums = [(min(values), max(values)) for values in zip(*(k[1] for k in keys))]
-        min_diffs = [max((mx - mn) * value_diff_fac, min_significant_diff) for mn, mx in extremums]
-        p_currframe, p_key, p_key_write = keys[0]
-        p_keyed = [(p_currframe - max_frame_diff, val) for val in p_key]
-        are_keyed = [False] * len(p_key)
-        for currframe, key, key_write in keys:
-            for idx, (val, p_val) in enumerate(zip(key, p_key)):
-                p_keyedframe, p_keyedval = p_keyed[idx]
-                if val == p_val:
-                    # Never write keyframe when value is exactly the same as prev one!
-                    continue
-                if abs(val - p_val) >= min_diffs[idx]:
-                    # If enough difference from previous sampled value, key this value *and* the previous one!
-                    key_write[idx] = True
-                    p_key_write[idx] = True
-                    p_keyed[idx] = (currframe, val)
-                    are_keyed[idx] = True
-                else:
-                    frame_diff = currframe - p_keyedframe
-                    val_diff = abs(val - p_keyedval)
-                    if ((val_diff >= min_diffs[idx]) or
-                        ((val_diff >= min_significant_diff) and (frame_diff >= max_frame_diff))):
-                        # Else, if enough difference from previous keyed value
-                        # (or any significant difference and max gap between keys is reached),
-                        # key this value only!
-                        key_write[idx] = True
-                        p_keyed[idx] = (currframe, val)
-                        are_keyed[idx] = True
-            p_currframe, p_key, p_key_write = currframe, key, key_write
-        # If we did key something, ensure first and last sampled values are keyed as well.
-        for idx, is_keyed in enumerate(are_keyed):
-            if is_keyed:
-                keys[0][2][idx] = keys[-1][2][idx] = True
-
-
 def fbx_animations_objects_do(scene_data, ref_id, f_start, f_end, start_zero, objects=None, force_keep=False):
     """
     Generate animation data (a single AnimStack) from objects, for a given frame range.
     """
     bake_step = scene_data.settings.bake_anim_step
+    simplify_fac = scene_data.settings.bake_anim_simplify_factor
     scene = scene_data.scene
 
     if objects is not None:
@@ -1654,7 +1605,8 @@ def fbx_animations_objects_do(scene_data, ref_id, f_start, f_end, start_zero, ob
     )
 
     back_currframe = scene.frame_current
-    animdata = OrderedDict((obj, []) for obj in objects)
+    # One curve baker per channel, keyframes are reduced while sampling.
+    animdata = OrderedDict((obj, tuple(AnimationCurveBaker(simplify_fac) for _n in fbx_names)) for obj in objects)
 
     p_rots = {}
 
@@ -1671,26 +1623,21 @@ def fbx_animations_objects_do(scene_data, ref_id, f_start, f_end, start_zero, ob
             loc, rot, scale, _m, _mr = ob_obj.fbx_object_tx(scene_data, rot_euler_compat=p_rot)
             p_rots[ob_obj] = rot
             tx = tuple(loc) + tuple(units_convert_iter(rot, "radian", "degree")) + tuple(scale)
-            animdata[ob_obj].append((real_currframe, tx, [False] * len(tx)))
+            for baker, val in zip(animdata[ob_obj], tx):
+                baker.add(real_currframe, val)
         for ob_obj in objects:
             ob_obj.dupli_list_clear()
         currframe += bake_step
 
     scene.frame_set(back_currframe, 0.0)
 
-    fbx_animations_simplify(scene_data, animdata)
-
     animations = OrderedDict()
 
     # And now, produce final data (usable by FBX export code)...
-    for ob_obj, keys in animdata.items():
-        if not keys:
+    for ob_obj, bakers in animdata.items():
+        curves = [baker.finish() for baker in bakers]
+        if not any(curves):
             continue
-        curves = [[] for k in keys[0][1]]
-        for currframe, key, key_write in keys:
-            for idx, (val, wrt) in enumerate(zip(key, key_write)):
-                if wrt:
-                    curves[idx].append((currframe, val))
 
         obj_key = ob_obj.key
         # Get PoseBone from bone...
@@ -2467,6 +2414,8 @@ def save_single(operator, scene, filepath="",
                 embed_textures=False,
                 use_custom_properties=False,
                 bake_space_transform=False,
+                compression_level=1,
+                compression_threshold=128,
                 **kwargs
                 ):
 
@@ -2515,6 +2464,9 @@ def save_single(operator, scene, filepath="",
     # Generate some data about exported scene...
     scene_data = fbx_data_from_scene(scene, settings)
 
+    # Arrays get compressed in background threads while we build the elements tree.
+    encode_bin.init_write(compression_level, compression_threshold)
+
     root = elem_empty(None, b"")  # Root element has no id, as it is not saved per se!
 
     # Mostly FBXHeaderExtension and GlobalSettings.
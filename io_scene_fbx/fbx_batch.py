@@ -0,0 +1,406 @@
+#!/usr/bin/env python3
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+# Script copyright (C) 2014 Blender Foundation
+
+"""
+Usage
+=====
+
+   fbx_batch [OPTIONS] [FILES_OR_DIRS]...
+
+Convert many binary FBX/JSON files without Blender, using a pool of worker processes.
+
+Directories are searched recursively for ``.fbx`` and ``.json`` files.
+Binary FBX files are converted to JSON (see json2fbx for the format),
+unless ``--to fbx`` is given, in which case they are re-written as binary FBX
+(useful together with ``--version`` or the ``--strip-*`` options).
+JSON files are always converted to binary FBX.
+
+Inputs which are the output of another input of the same batch (e.g. JSON files written by a previous run)
+are skipped, binary FBX inputs taking precedence over JSON ones. Existing files are never overwritten,
+unless ``--overwrite`` is given.
+
+Options
+=======
+
+--to {json,fbx}         Output format for binary FBX inputs (default: json).
+--output DIR            Write results in DIR (default: next to each input file).
+--version VERSION       Write binary FBX with this version (7100 to 7400).
+--strip-takes           Remove takes not matching any animation stack.
+--strip-textures        Remove textures not used by any material (and videos not used by any remaining texture).
+--compression LEVEL     zlib level used for arrays in binary FBX (0 to 9, default: 1).
+--jobs N                Number of worker processes (default: number of CPUs).
+--overwrite             Replace existing output files.
+"""
+
+import os
+import sys
+import time
+
+try:
+    from . import data_types, encode_bin, parse_fbx, json2fbx
+except:
+    import data_types
+    import encode_bin
+    import parse_fbx
+    import json2fbx
+
+
+FBX_VERSIONS = (7100, 7200, 7300, 7400)
+
+
+# ----------------------------------------------------------------------------
+# Parsed tree -> encode_bin tree
+
+def elem_to_encode_bin(elem):
+    enc_elem = encode_bin.FBXElem(elem.id)
+    for data, data_type in zip(elem.props, elem.props_type):
+        if data_type == data_types.BOOL:
+            enc_elem.add_bool(data)
+        elif data_type == data_types.INT16:
+            enc_elem.add_int16(data)
+        elif data_type == data_types.INT32:
+            enc_elem.add_int32(data)
+        elif data_type == data_types.INT64:
+            enc_elem.add_int64(data)
+        elif data_type == data_types.FLOAT32:
+            enc_elem.add_float32(data)
+        elif data_type == data_types.FLOAT64:
+            enc_elem.add_float64(data)
+        elif data_type == data_types.BYTES:
+            enc_elem.add_bytes(data)
+        elif data_type == data_types.STRING:
+            enc_elem.add_string(data)
+        elif data_type == data_types.INT32_ARRAY:
+            enc_elem.add_int32_array(data)
+        elif data_type == data_types.INT64_ARRAY:
+            enc_elem.add_int64_array(data)
+        elif data_type == data_types.FLOAT32_ARRAY:
+            enc_elem.add_float32_array(data)
+        elif data_type == data_types.FLOAT64_ARRAY:
+            enc_elem.add_float64_array(data)
+        elif data_type == data_types.BOOL_ARRAY:
+            enc_elem.add_bool_array(data)
+        elif data_type == data_types.BYTE_ARRAY:
+            enc_elem.add_byte_array(data)
+        else:
+            raise IOError("unknown property type %r" % chr(data_type))
+
+    enc_elem.elems.extend(elem_to_encode_bin(child) for child in elem.elems)
+    return enc_elem
+
+
+# ----------------------------------------------------------------------------
+# Parsed tree -> JSON (same layout as read by json2fbx)
+
+def elem_to_json(elem):
+    data_json = []
+    for data, data_type in zip(elem.props, elem.props_type):
+        if data_type == data_types.STRING:
+            data = data.replace(b"\x00\x01", b"::").decode('utf-8')
+        elif data_type == data_types.BYTES:
+            # json2fbx evaluates it as the content of a bytes literal.
+            data = "".join("\\x%02x" % c for c in data)
+        elif data_type in {data_types.INT32_ARRAY, data_types.INT64_ARRAY,
+                           data_types.FLOAT32_ARRAY, data_types.FLOAT64_ARRAY,
+                           data_types.BOOL_ARRAY, data_types.BYTE_ARRAY}:
+            data = data.tolist()
+        data_json.append(data)
+
+    return [elem.id.decode('utf-8'), data_json, elem.props_type.decode('ascii'),
+            [elem_to_json(child) for child in elem.elems]]
+
+
+# ----------------------------------------------------------------------------
+# Tree cleanup
+
+def elem_find_first(elem, id_search):
+    for fbx_item in elem.elems:
+        if fbx_item.id == id_search:
+            return fbx_item
+    return None
+
+
+def elem_name(elem):
+    return elem.props[-2].split(b"\x00\x01")[0] if len(elem.props) >= 2 else b""
+
+
+def strip_takes(elem_root):
+    """
+    Remove takes which do not match any animation stack, return the number of removed takes.
+    """
+    fbx_takes = elem_find_first(elem_root, b"Takes")
+    if fbx_takes is None:
+        return 0
+    fbx_nodes = elem_find_first(elem_root, b"Objects")
+    stacks = set()
+    if fbx_nodes is not None:
+        stacks = {elem_name(fbx_obj) for fbx_obj in fbx_nodes.elems if fbx_obj.id == b"AnimationStack"}
+
+    elems = fbx_takes.elems
+    elems_keep = [e for e in elems if e.id != b"Take" or (e.props and e.props[0] in stacks)]
+    nbr_removed = len(elems) - len(elems_keep)
+    elems[:] = elems_keep
+    return nbr_removed
+
+
+def strip_textures(elem_root):
+    """
+    Remove textures not connected to any material, and videos not connected to any remaining texture,
+    together with their connections. Return the number of removed objects.
+    """
+    fbx_nodes = elem_find_first(elem_root, b"Objects")
+    fbx_connections = elem_find_first(elem_root, b"Connections")
+    if fbx_nodes is None or fbx_connections is None:
+        return 0
+
+    nodes = {fbx_obj.props[0]: fbx_obj for fbx_obj in fbx_nodes.elems if fbx_obj.props}
+    links = [(fbx_link.props[1], fbx_link.props[2], fbx_link) for fbx_link in fbx_connections.elems
+             if fbx_link.props_type[1:3] == b'LL']
+
+    def used_uuids(id_src, id_dst):
+        return {c_src for c_src, c_dst, _l in links
+                if c_src in nodes and c_dst in nodes and
+                nodes[c_src].id == id_src and nodes[c_dst].id == id_dst}
+
+    removed = set()
+    textures_used = used_uuids(b"Texture", b"Material")
+    removed |= {uuid for uuid, fbx_obj in nodes.items() if fbx_obj.id == b"Texture" and uuid not in textures_used}
+    for uuid in removed:
+        del nodes[uuid]
+    videos_used = used_uuids(b"Video", b"Texture")
+    videos_removed = {uuid for uuid, fbx_obj in nodes.items() if fbx_obj.id == b"Video" and uuid not in videos_used}
+    removed |= videos_removed
+
+    if not removed:
+        return 0
+
+    fbx_nodes.elems[:] = [fbx_obj for fbx_obj in fbx_nodes.elems if not fbx_obj.props or
+                          fbx_obj.props[0] not in removed]
+    links_removed = {id(l) for c_src, c_dst, l in links if c_src in removed or c_dst in removed}
+    fbx_connections.elems[:] = [fbx_link for fbx_link in fbx_connections.elems if id(fbx_link) not in links_removed]
+
+    # Keep objects count of definitions in sync.
+    fbx_defs = elem_find_first(elem_root, b"Definitions")
+    if fbx_defs is not None:
+        nbr_removed = {b"Texture": len(removed) - len(videos_removed), b"Video": len(videos_removed)}
+        for fbx_def in fbx_defs.elems:
+            if fbx_def.id == b"ObjectType" and fbx_def.props[0] in nbr_removed:
+                fbx_count = elem_find_first(fbx_def, b"Count")
+                if fbx_count is not None:
+                    fbx_count.props[0] -= nbr_removed[fbx_def.props[0]]
+
+    return len(removed)
+
+
+def version_set(elem_root, version):
+    fbx_header = elem_find_first(elem_root, b"FBXHeaderExtension")
+    if fbx_header is not None:
+        fbx_version = elem_find_first(fbx_header, b"FBXVersion")
+        if fbx_version is not None:
+            fbx_version.props[0] = version
+
+
+# ----------------------------------------------------------------------------
+# Conversion of a single file (runs in worker processes)
+
+def convert_file(args):
+    fn, fn_out, options = args
+    time_start = time.time()
+    info = []
+
+    try:
+        if fn.lower().endswith(".json"):
+            import json
+            with open(fn) as f_json:
+                json_root = json.load(f_json)
+            fbx_root, fbx_version = json2fbx.parse_json(json_root)
+            if options["version"]:
+                fbx_version = options["version"]
+            elif not fbx_version:
+                raise IOError("no FBXVersion found in %r, give one with --version" % fn)
+            encode_bin.init_write(options["compression"], use_threads=False)
+            encode_bin.write(fn_out, fbx_root, fbx_version)
+            info.append("version %d" % fbx_version)
+        else:
+            elem_root, fbx_version = parse_fbx.parse(fn, use_threads=False)
+
+            if options["strip_takes"]:
+                info.append("%d takes stripped" % strip_takes(elem_root))
+            if options["strip_textures"]:
+                info.append("%d textures/videos stripped" % strip_textures(elem_root))
+
+            if options["to"] == 'json':
+                import json
+                with open(fn_out, 'w') as f_json:
+                    json.dump([elem_to_json(elem) for elem in elem_root.elems], f_json)
+            else:
+                if options["version"]:
+                    fbx_version = options["version"]
+                    version_set(elem_root, fbx_version)
+                encode_bin.init_write(options["compression"], use_threads=False)
+                fbx_root = elem_to_encode_bin(elem_root)
+                encode_bin.write(fn_out, fbx_root, fbx_version)
+                info.append("version %d" % fbx_version)
+    except Exception:
+        import traceback
+        return fn, fn_out, False, time.time() - time_start, traceback.format_exc()
+
+    return fn, fn_out, True, time.time() - time_start, ", ".join(info)
+
+
+def files_collect(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            for dirpath, dirnames, filenames in os.walk(path):
+                dirnames.sort()
+                for fn in sorted(filenames):
+                    if os.path.splitext(fn)[1].lower() in {".fbx", ".json"}:
+                        yield os.path.join(dirpath, fn)
+        else:
+            yield path
+
+
+def output_path(fn, options):
+    base, ext = os.path.splitext(fn)
+    if ext.lower() == ".json" or options["to"] == 'fbx':
+        ext_out = ".fbx"
+    else:
+        ext_out = ".json"
+    if options["output"]:
+        base = os.path.join(options["output"], os.path.basename(base))
+    fn_out = base + ext_out
+    if os.path.abspath(fn_out) == os.path.abspath(fn):
+        # Never overwrite input file.
+        fn_out = base + "_out" + ext_out
+    return fn_out
+
+
+def files_plan(fns, options):
+    """
+    Return the (input, output) pairs to convert, and the list of errors preventing the conversion.
+
+    Inputs which are the output of another input are skipped (binary FBX first, so that JSON
+    files written by a previous run are not converted back onto their original), as well as
+    inputs whose output is another input, or already exists unless overwriting is allowed.
+    Two inputs sharing an output is an error.
+    """
+    fns_abs = {}
+    for fn in fns:
+        fns_abs.setdefault(os.path.abspath(fn), fn)
+
+    # Stable sort, binary FBX inputs before JSON ones.
+    fns = sorted(fns_abs.values(), key=lambda fn: fn.lower().endswith(".json"))
+
+    sources = {}
+    fns_keep = []
+    for fn in fns:
+        fn_abs = os.path.abspath(fn)
+        if fn_abs in sources:
+            print("Skipping %r, output of %r" % (fn, sources[fn_abs]))
+            continue
+        fn_out = output_path(fn, options)
+        sources.setdefault(os.path.abspath(fn_out), fn)
+        fns_keep.append((fn, fn_abs, fn_out))
+
+    inputs = {fn_abs for fn, fn_abs, fn_out in fns_keep}
+    plan = []
+    errors = []
+    outputs = {}
+    for fn, fn_abs, fn_out in fns_keep:
+        fn_out_abs = os.path.abspath(fn_out)
+        if fn_out_abs in inputs:
+            print("Skipping %r, its output %r is another input" % (fn, fn_out))
+            continue
+        if fn_out_abs in outputs:
+            errors.append("%r and %r would both be written to %r" % (outputs[fn_out_abs], fn, fn_out))
+            continue
+        outputs[fn_out_abs] = fn
+        if not options["overwrite"] and os.path.exists(fn_out):
+            print("Skipping %r, %r already exists (use --overwrite to replace it)" % (fn, fn_out))
+            continue
+        plan.append((fn, fn_out))
+
+    return plan, errors
+
+
+# ----------------------------------------------------------------------------
+# Command Line
+
+def main():
+    import argparse
+    import multiprocessing
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="+")
+    parser.add_argument("--to", choices=('json', 'fbx'), default='json')
+    parser.add_argument("--output", default="")
+    parser.add_argument("--version", type=int, choices=FBX_VERSIONS, default=0)
+    parser.add_argument("--strip-takes", action="store_true")
+    parser.add_argument("--strip-textures", action="store_true")
+    parser.add_argument("--compression", type=int, choices=range(10), default=1)
+    parser.add_argument("--jobs", type=int, default=0)
+    parser.add_argument("--overwrite", action="store_true")
+    args = parser.parse_args()
+
+    options = {
+        "to": args.to,
+        "output": args.output,
+        "version": args.version,
+        "strip_takes": args.strip_takes,
+        "strip_textures": args.strip_textures,
+        "compression": args.compression,
+        "overwrite": args.overwrite,
+    }
+
+    if options["output"] and not os.path.exists(options["output"]):
+        os.makedirs(options["output"])
+
+    plan, errors = files_plan(files_collect(args.paths), options)
+    if errors:
+        for error in errors:
+            print("Error: %s" % error)
+        print("Nothing converted")
+        sys.exit(1)
+
+    todo = [(fn, fn_out, options) for fn, fn_out in plan]
+    if not todo:
+        print("No file to convert")
+        return
+
+    time_start = time.time()
+    nbr_failed = 0
+    with multiprocessing.Pool(args.jobs or None) as pool:
+        for i, (fn, fn_out, ok, duration, info) in enumerate(pool.imap_unordered(convert_file, todo), 1):
+            if ok:
+                print("[%d/%d] %r -> %r (%s) in %.3f sec" % (i, len(todo), fn, fn_out, info, duration))
+            else:
+                nbr_failed += 1
+                print("[%d/%d] Failed to convert %r, error:\n%s" % (i, len(todo), fn, info))
+
+    print("Converted %d files (%d failed) in %.3f sec" % (len(todo) - nbr_failed, nbr_failed, time.time() - time_start))
+    if nbr_failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -21,6 +21,7 @@
 # Script copyright (C) Campbell Barton, Bastien Montagne
 
 
+import array
 import math
 
 from collections import namedtuple, OrderedDict
@@ -184,6 +185,19 @@ def similar_values(v1, v2, e=1e-6):
     return ((abs(v1 - v2) / max(abs(v1), abs(v2))) <= e)
 
 
+def array_unique_indexed(data, stride):
+    """
+    Deduplicate stride-sized items of flat array data,
+    return (unique items as a flat array of same type, int32 array of indices into those items).
+    """
+    items = zip(*(data[i::stride] for i in range(stride)))
+    item2idx = {}
+    indices = array.array(data_types.ARRAY_INT32, (item2idx.setdefault(it, len(item2idx)) for it in items))
+    # dict is not ordered, get back unique items in their index order.
+    uniques = array.array(data.typecode, chain.from_iterable(sorted(item2idx, key=item2idx.__getitem__)))
+    return uniques, indices
+
+
 ##### UIDs code. #####
 
 # ID class (mere int).
@@ -881,6 +895,93 @@ def fbx_name_class(name, cls):
     return FBX_NAME_CLASS_SEP.join((name, cls))
 
 
+##### Animation curves baking. #####
+
+class AnimationCurveBaker:
+    """
+    Receives the baked values of a single animated channel one frame after the other, and only keeps the keyframes
+    needed to reproduce them (using linear interpolation) within a given error.
+
+    This is the "swinging door" algorithm: from the last keyframe, we track the range of slopes which keep all samples
+    seen since within tolerance; as soon as a new sample falls out of that range, previous sample gets keyed.
+    Tolerance is relative to the range of values seen so far (simplify factor / 1000 of it),
+    a null simplify factor keeps all samples.
+    """
+    __slots__ = (
+        "frames", "values",  # Keyframes.
+        "_fac", "_min", "_max", "_tol",
+        "_slope_min", "_slope_max", "_prev",
+        )
+
+    def __init__(self, simplify_fac):
+        self.frames = array.array(data_types.ARRAY_FLOAT64)
+        self.values = array.array(data_types.ARRAY_FLOAT64)
+        self._fac = simplify_fac / 1000
+        self._min = self._max = None
+        self._tol = self.MIN_SIGNIFICANT_DIFF
+        self._slope_min = self._slope_max = 0.0
+        self._prev = None  # Last sample, if not keyed.
+
+    MIN_SIGNIFICANT_DIFF = 1.0e-6
+
+    def _slopes(self, frame, value):
+        k_frame, k_value = self.frames[-1], self.values[-1]
+        d_frame = frame - k_frame
+        return ((value - self._tol - k_value) / d_frame,
+                (value + self._tol - k_value) / d_frame,
+                (value - k_value) / d_frame)
+
+    def add(self, frame, value):
+        if self._min is None:
+            self._min = self._max = value
+            self.frames.append(frame)
+            self.values.append(value)
+            return
+
+        if value < self._min or value > self._max:
+            if value < self._min:
+                self._min = value
+            else:
+                self._max = value
+            self._tol = max((self._max - self._min) * self._fac, self.MIN_SIGNIFICANT_DIFF)
+
+        if not self._fac:
+            # No simplification, every sample is a keyframe.
+            self.frames.append(frame)
+            self.values.append(value)
+            return
+
+        if self._prev is not None:
+            slope_min, slope_max, slope = self._slopes(frame, value)
+            if self._slope_min <= slope <= self._slope_max:
+                # Door still open, previous sample is not needed.
+                self._slope_min = max(self._slope_min, slope_min)
+                self._slope_max = min(self._slope_max, slope_max)
+                self._prev = (frame, value)
+                return
+            # Key previous sample, and restart from it.
+            self.frames.append(self._prev[0])
+            self.values.append(self._prev[1])
+
+        self._slope_min, self._slope_max, _slope = self._slopes(frame, value)
+        self._prev = (frame, value)
+
+    def finish(self):
+        """
+        Key the last sample, return keyframes as a list of (frame, value) pairs
+        (empty if value never changed, or no sample was added).
+        """
+        if self._min is None:
+            return []
+        if self._prev is not None:
+            self.frames.append(self._prev[0])
+            self.values.append(self._prev[1])
+            self._prev = None
+        if self._max - self._min < self.MIN_SIGNIFICANT_DIFF:
+            return []
+        return list(zip(self.frames, self.values))
+
+
 ##### Top-level FBX data container. #####
 
 # Helper sub-container gathering all exporter settings related to media (texture files).
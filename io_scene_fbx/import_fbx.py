@@ -31,9 +31,15 @@ import bpy
 # global singleton, assign on execution
 fbx_elem_nil = None
 
+# global lookup tables, filled by elem_index_build() on execution
+# id(elem) -> {child_id: [child, ...]}
+fbx_elem_index_children = {}
+# id(Properties70 elem) -> {prop_name: P elem}
+fbx_elem_index_props = {}
+
 # -----
 # Utils
-from .parse_fbx import data_types, FBXElem
+from .parse_fbx import data_types, FBXElem, array_resolve
 
 
 def tuple_deg_to_rad(eul):
@@ -42,7 +48,46 @@ def tuple_deg_to_rad(eul):
             eul[2] / 57.295779513)
 
 
+def elem_index_build(elem_root):
+    """
+    Index children of all elements by their id, and properties of all Properties70 elements by their name,
+    so that lookups don't have to scan (potentially huge) children lists.
+    Elements without children are not indexed (lookups fall back to scanning for non-indexed elements).
+    """
+    fbx_elem_index_children.clear()
+    fbx_elem_index_props.clear()
+
+    todo = [elem_root]
+    while todo:
+        elem = todo.pop()
+        if not elem.elems:
+            continue
+        children = {}
+        for fbx_item in elem.elems:
+            children.setdefault(fbx_item.id, []).append(fbx_item)
+        fbx_elem_index_children[id(elem)] = children
+
+        if elem.id == b'Properties70':
+            props = {}
+            for subelem in elem.elems:
+                assert(subelem.id == b'P')
+                props.setdefault(subelem.props[0], subelem)
+            fbx_elem_index_props[id(elem)] = props
+
+        todo.extend(elem.elems)
+
+
+def elem_index_clear():
+    fbx_elem_index_children.clear()
+    fbx_elem_index_props.clear()
+
+
 def elem_find_first(elem, id_search, default=None):
+    children = fbx_elem_index_children.get(id(elem))
+    if children is not None:
+        fbx_items = children.get(id_search)
+        return fbx_items[0] if fbx_items else default
+
     for fbx_item in elem.elems:
         if fbx_item.id == id_search:
             return fbx_item
@@ -50,9 +95,11 @@ def elem_find_first(elem, id_search, default=None):
 
 
 def elem_find_iter(elem, id_search):
-    for fbx_item in elem.elems:
-        if fbx_item.id == id_search:
-            yield fbx_item
+    children = fbx_elem_index_children.get(id(elem))
+    if children is not None:
+        return iter(children.get(id_search, ()))
+
+    return (fbx_item for fbx_item in elem.elems if fbx_item.id == id_search)
 
 
 def elem_find_first_string(elem, id_search):
@@ -104,7 +151,7 @@ def elem_uuid(elem):
 
 
 def elem_prop_first(elem):
-    return elem.props[0] if (elem is not None) and elem.props else None
+    return array_resolve(elem.props[0]) if (elem is not None) and elem.props else None
 
 
 # ----
@@ -126,6 +173,10 @@ def elem_props_find_first(elem, elem_prop_id):
         assert(len(elem) > 0)
         return None
 
+    props = fbx_elem_index_props.get(id(elem))
+    if props is not None:
+        return props.get(elem_prop_id)
+
     for subelem in elem.elems:
         assert(subelem.id == b'P')
         if subelem.props[0] == elem_prop_id:
@@ -357,6 +408,42 @@ def blen_read_geom_layerinfo(fbx_layer):
         )
 
 
+def blen_read_geom_array_gen_direct(fbx_data, stride, item_size, xform):
+    # Flat array of item_size values per element, out of stride-spaced fbx_data.
+    if stride == item_size:
+        data = fbx_data
+    else:
+        # trailing values not making a whole element are ignored
+        end = len(fbx_data) // stride * stride
+        data = fbx_data[:len(fbx_data) // stride * item_size]
+        for i in range(item_size):
+            data[i::item_size] = fbx_data[i:end:stride]
+    return data if xform is None else list(map(xform, data))
+
+
+def blen_read_geom_array_gen_indexed(fbx_data, fbx_index, stride, item_size, xform):
+    # Resolve the index array by gathering each component, no per-item python code.
+    import array
+    comps = [array.array(fbx_data.typecode, map(fbx_data[i::stride].__getitem__, fbx_index))
+             for i in range(item_size)]
+    if item_size == 1:
+        data = comps[0]
+    else:
+        data = array.array(fbx_data.typecode, (0,)) * (len(fbx_index) * item_size)
+        for i, comp in enumerate(comps):
+            data[i::item_size] = comp
+    return data if xform is None else list(map(xform, data))
+
+
+def blen_read_geom_array_foreach_set(blen_data, blend_attr, data, item_size, descr):
+    data_len = len(blen_data) * item_size
+    if len(data) < data_len:
+        print("warning layer %r has %d items, expected %d" % (descr, len(data) // item_size, len(blen_data)))
+        return False
+    blen_data.foreach_set(blend_attr, data[:data_len] if len(data) > data_len else data)
+    return True
+
+
 def blen_read_geom_array_mapped_vert(
         mesh, blen_data, blend_attr,
         fbx_layer_data, fbx_layer_index,
@@ -368,10 +455,8 @@ def blen_read_geom_array_mapped_vert(
         if fbx_layer_ref == b'Direct':
             assert(fbx_layer_index is None)
             # TODO, more generic support for mapping types
-            for i, blen_data_item in enumerate(blen_data):
-                setattr(blen_data_item, blend_attr,
-                        fbx_layer_data[(i * stride): (i * stride) + item_size])
-            return True
+            data = blen_read_geom_array_gen_direct(fbx_layer_data, stride, item_size, None)
+            return blen_read_geom_array_foreach_set(blen_data, blend_attr, data, item_size, descr)
         else:
             print("warning layer %r ref type unsupported: %r" % (descr, fbx_layer_ref))
     else:
@@ -389,25 +474,8 @@ def blen_read_geom_array_mapped_edge(
         ):
     if fbx_layer_mapping == b'ByEdge':
         if fbx_layer_ref == b'Direct':
-            if stride == 1:
-                if xform is None:
-                    for i, blen_data_item in enumerate(blen_data):
-                        setattr(blen_data_item, blend_attr,
-                                fbx_layer_data[i])
-                else:
-                    for i, blen_data_item in enumerate(blen_data):
-                        setattr(blen_data_item, blend_attr,
-                                xform(fbx_layer_data[i]))
-            else:
-                if xform is None:
-                    for i, blen_data_item in enumerate(blen_data):
-                        setattr(blen_data_item, blend_attr,
-                                fbx_layer_data[(i * stride): (i * stride) + item_size])
-                else:
-                    for i, blen_data_item in enumerate(blen_data):
-                        setattr(blen_data_item, blend_attr,
-                                xform(fbx_layer_data[(i * stride): (i * stride) + item_size]))
-            return True
+            data = blen_read_geom_array_gen_direct(fbx_layer_data, stride, item_size, xform)
+            return blen_read_geom_array_foreach_set(blen_data, blend_attr, data, item_size, descr)
         else:
             print("warning layer %r ref type unsupported: %r" % (descr, fbx_layer_ref))
     else:
@@ -425,25 +493,14 @@ def blen_read_geom_array_mapped_polygon(
         ):
     if fbx_layer_mapping == b'ByPolygon':
         if fbx_layer_ref == b'IndexToDirect':
-            if stride == 1:
-                for i, blen_data_item in enumerate(blen_data):
-                    setattr(blen_data_item, blend_attr,
-                            fbx_layer_data[i])
-            else:
-                for i, blen_data_item in enumerate(blen_data):
-                    setattr(blen_data_item, blend_attr,
-                            fbx_layer_data[(i * stride): (i * stride) + item_size])
-            return True
+            # no index array here, data is directly per polygon.
+            data = blen_read_geom_array_gen_direct(fbx_layer_data, stride, item_size, None)
+            return blen_read_geom_array_foreach_set(blen_data, blend_attr, data, item_size, descr)
         elif fbx_layer_ref == b'Direct':
             # looks like direct may have different meanings!
             assert(stride == 1)
-            if xform is None:
-                for i in range(len(fbx_layer_data)):
-                    setattr(blen_data[i], blend_attr, fbx_layer_data[i])
-            else:
-                for i in range(len(fbx_layer_data)):
-                    setattr(blen_data[i], blend_attr, xform(fbx_layer_data[i]))
-            return True
+            data = blen_read_geom_array_gen_direct(fbx_layer_data, 1, 1, xform)
+            return blen_read_geom_array_foreach_set(blen_data, blend_attr, data, 1, descr)
         else:
             print("warning layer %r ref type unsupported: %r" % (descr, fbx_layer_ref))
     else:
@@ -461,23 +518,25 @@ def blen_read_geom_array_mapped_polyloop(
     if fbx_layer_mapping == b'ByPolygonVertex':
         if fbx_layer_ref == b'IndexToDirect':
             assert(fbx_layer_index is not None)
-            for i, j in enumerate(fbx_layer_index):
-                if j != -1:
-                    setattr(blen_data[i], blend_attr,
-                            fbx_layer_data[(j * stride): (j * stride) + item_size])
-            return True
+            if -1 in fbx_layer_index:
+                # Undefined items keep their default value, no way to do this in bulk.
+                for i, j in enumerate(fbx_layer_index):
+                    if j != -1:
+                        setattr(blen_data[i], blend_attr,
+                                fbx_layer_data[(j * stride): (j * stride) + item_size])
+                return True
+            data = blen_read_geom_array_gen_indexed(fbx_layer_data, fbx_layer_index, stride, item_size, None)
+            return blen_read_geom_array_foreach_set(blen_data, blend_attr, data, item_size, descr)
         else:
             print("warning layer %r ref type unsupported: %r" % (descr, fbx_layer_ref))
     elif fbx_layer_mapping == b'ByVertice':
         if fbx_layer_ref == b'Direct':
             assert(fbx_layer_index is None)
-            loops = mesh.loops
-            polygons = mesh.polygons
-            for p in polygons:
-                for i in p.loop_indices:
-                    j = loops[i].vertex_index
-                    setattr(blen_data[i], blend_attr,
-                            fbx_layer_data[(j * stride): (j * stride) + item_size])
+            import array
+            loops_vert_index = array.array('i', (0,)) * len(mesh.loops)
+            mesh.loops.foreach_get("vertex_index", loops_vert_index)
+            data = blen_read_geom_array_gen_indexed(fbx_layer_data, loops_vert_index, stride, item_size, None)
+            return blen_read_geom_array_foreach_set(blen_data, blend_attr, data, item_size, descr)
         else:
             print("warning layer %r ref type unsupported: %r" % (descr, fbx_layer_ref))
     else:
@@ -527,7 +586,7 @@ def blen_read_geom_layer_uv(fbx_obj, mesh):
 
             uv_tex = mesh.uv_textures.new(name=fbx_layer_name)
             uv_lay = mesh.uv_layers[-1]
-            blen_data = uv_lay.data[:]
+            blen_data = uv_lay.data
 
             # some valid files omit this data
             if fbx_layer_data is None:
@@ -556,7 +615,7 @@ def blen_read_geom_layer_color(fbx_obj, mesh):
             fbx_layer_index = elem_prop_first(elem_find_first(fbx_layer, b'ColorIndex'))
 
             color_lay = mesh.vertex_colors.new(name=fbx_layer_name)
-            blen_data = color_lay.data[:]
+            blen_data = color_lay.data
 
             # some valid files omit this data
             if fbx_layer_data is None:
@@ -664,17 +723,11 @@ def blen_read_geom(fbx_tmpl, fbx_obj):
 
     if fbx_polys:
         mesh.loops.add(len(fbx_polys))
-        poly_loop_starts = []
-        poly_loop_totals = []
-        poly_loop_prev = 0
-        for i, l in enumerate(mesh.loops):
-            index = fbx_polys[i]
-            if index < 0:
-                poly_loop_starts.append(poly_loop_prev)
-                poly_loop_totals.append((i - poly_loop_prev) + 1)
-                poly_loop_prev = i + 1
-                index ^= -1
-            l.vertex_index = index
+        # negative index marks the last vertex of a polygon.
+        poly_loop_ends = [i + 1 for i, index in enumerate(fbx_polys) if index < 0]
+        poly_loop_starts = [0] + poly_loop_ends[:-1]
+        poly_loop_totals = [e - s for s, e in zip(poly_loop_starts, poly_loop_ends)]
+        mesh.loops.foreach_set("vertex_index", [index ^ -1 if index < 0 else index for index in fbx_polys])
 
         mesh.polygons.add(len(poly_loop_starts))
         mesh.polygons.foreach_set("loop_start", poly_loop_starts)
@@ -919,12 +972,7 @@ def load(operator, context, filepath="",
     global fbx_elem_nil
     fbx_elem_nil = FBXElem('', (), (), ())
 
-    import os
-    from bpy_extras.io_utils import axis_conversion
-    from mathutils import Matrix
-
     from . import parse_fbx
-    from .fbx_utils import RIGHT_HAND_AXES, FBX_FRAMERATES
 
     # detect ascii files
     if is_ascii(filepath, 24):
@@ -932,7 +980,8 @@ def load(operator, context, filepath="",
         return {'CANCELLED'}
 
     try:
-        elem_root, version = parse_fbx.parse(filepath)
+        # arrays are only decoded when needed (unused takes, layers... are never decompressed).
+        elem_root, version = parse_fbx.parse(filepath, use_lazy=True)
     except:
         import traceback
         traceback.print_exc()
@@ -944,6 +993,38 @@ def load(operator, context, filepath="",
         operator.report({'ERROR'}, "Version %r unsupported, must be %r or later" % (version, 7100))
         return {'CANCELLED'}
 
+    elem_index_build(elem_root)
+    try:
+        return _load(operator, context, filepath, elem_root,
+                     use_manual_orientation,
+                     axis_forward,
+                     axis_up,
+                     global_scale,
+                     use_cycles,
+                     use_image_search,
+                     use_alpha_decals,
+                     decal_offset)
+    finally:
+        # the index keeps the whole parsed tree alive, always release it
+        elem_index_clear()
+
+
+def _load(operator, context, filepath, elem_root,
+          use_manual_orientation,
+          axis_forward,
+          axis_up,
+          global_scale,
+          use_cycles,
+          use_image_search,
+          use_alpha_decals,
+          decal_offset):
+    import os
+    from bpy_extras.io_utils import axis_conversion
+    from mathutils import Matrix
+
+    from . import parse_fbx
+    from .fbx_utils import RIGHT_HAND_AXES, FBX_FRAMERATES
+
     if bpy.ops.object.mode_set.poll():
         bpy.ops.object.mode_set(mode='OBJECT', toggle=False)
 
@@ -1077,6 +1158,10 @@ def load(operator, context, filepath="",
     def _():
         fbx_tmpl = fbx_template_get((b'Geometry', b'KFbxMesh'))
 
+        # inflate all geometry arrays at once, using all cores.
+        parse_fbx.arrays_decode([fbx_obj for fbx_obj, _blen_data in fbx_table_nodes.values()
+                                 if fbx_obj.id == b'Geometry'])
+
         for fbx_uuid, fbx_item in fbx_table_nodes.items():
             fbx_obj, blen_data = fbx_item
             if fbx_obj.id != b'Geometry':
@@ -1144,18 +1229,30 @@ def load(operator, context, filepath="",
 
     # ----
     # Connections
-    def connection_filter_ex(fbx_uuid, fbx_id, dct):
-        return [(c_found[0], c_found[1], c_type)
+
+    # Connections resolved to their table item and filtered by element id, built on first use.
+    # (fbx_uuid, fbx_id) -> [(table item, connection elem), ...]
+    fbx_connection_filter_map = {}
+    fbx_connection_filter_map_reverse = {}
+
+    def connection_filter_ex(fbx_uuid, fbx_id, dct, dct_filter):
+        key = (fbx_uuid, fbx_id)
+        c_items = dct_filter.get(key)
+        if c_items is None:
+            c_items = dct_filter[key] = [
+                (c_found, c_type)
                 for (c_uuid, c_type) in dct.get(fbx_uuid, ())
                 # 0 is used for the root node, which isnt in fbx_table_nodes
-                for c_found in (() if c_uuid is 0 else (fbx_table_nodes[c_uuid],))
+                for c_found in (() if c_uuid == 0 else (fbx_table_nodes[c_uuid],))
                 if (fbx_id is None) or (c_found[0].id == fbx_id)]
+        # Blender data of table items may have been loaded in between, read it now.
+        return [(c_found[0], c_found[1], c_type) for (c_found, c_type) in c_items]
 
     def connection_filter_forward(fbx_uuid, fbx_id):
-        return connection_filter_ex(fbx_uuid, fbx_id, fbx_connection_map)
+        return connection_filter_ex(fbx_uuid, fbx_id, fbx_connection_map, fbx_connection_filter_map)
 
     def connection_filter_reverse(fbx_uuid, fbx_id):
-        return connection_filter_ex(fbx_uuid, fbx_id, fbx_connection_map_reverse)
+        return connection_filter_ex(fbx_uuid, fbx_id, fbx_connection_map_reverse, fbx_connection_filter_map_reverse)
 
     def _():
         fbx_tmpl = fbx_template_get((b'Model', b'KFbxNode'))
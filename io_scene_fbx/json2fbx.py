@@ -65,7 +65,10 @@ ensured to be unique.
 """
 
 
-import encode_bin
+try:
+    from . import encode_bin
+except:
+    import encode_bin
 
 
 def elem_empty(elem, name):
@@ -110,9 +113,9 @@ def parse_json_rec(fbx_root, json_node):
         elif dt == "d":
             e.add_float64_array(d)
         elif dt == "b":
-            e.add_byte_array(d)
-        elif dt == "c":
             e.add_bool_array(d)
+        elif dt == "c":
+            e.add_byte_array(d)
 
     if name == "FBXVersion":
         assert(data_types == "I")
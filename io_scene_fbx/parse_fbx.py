@@ -26,13 +26,19 @@ __all__ = (
     "data_types",
     "parse_version",
     "FBXElem",
+    "FBXArrayLazy",
+    "arrays_decode",
     )
 
 from struct import unpack
 import array
+import mmap
 import zlib
 
-from . import data_types
+try:
+    from . import data_types
+except:
+    import data_types
 
 # at the end of each nested block, there is a NUL record to indicate
 # that the sub-scope exists (i.e. to distinguish between P: and P : {})
@@ -60,13 +66,7 @@ def read_string_ubyte(read):
     return data
 
 
-def unpack_array(read, array_type, array_stride, array_byteswap):
-    length = read_uint(read)
-    encoding = read_uint(read)
-    comp_len = read_uint(read)
-
-    data = read(comp_len)
-
+def decode_array(data, encoding, length, array_type, array_stride, array_byteswap):
     if encoding == 0:
         pass
     elif encoding == 1:
@@ -80,6 +80,136 @@ def unpack_array(read, array_type, array_stride, array_byteswap):
     return data_array
 
 
+def unpack_array(read, array_type, array_stride, array_byteswap):
+    length = read_uint(read)
+    encoding = read_uint(read)
+    comp_len = read_uint(read)
+
+    data = read(comp_len)
+
+    return decode_array(data, encoding, length, array_type, array_stride, array_byteswap)
+
+
+class FBXArrayLazy:
+    """
+    Array property which only records where its payload is in the (memory-mapped) file,
+    the payload is decompressed the first time the array is accessed.
+    """
+    __slots__ = (
+        "_buf", "_offset", "_comp_len", "_encoding", "_length",
+        "_array_type", "_array_stride", "_array_byteswap", "_array",
+        )
+
+    def __init__(self, buf, offset, comp_len, encoding, length, array_type, array_stride, array_byteswap):
+        self._buf = buf
+        self._offset = offset
+        self._comp_len = comp_len
+        self._encoding = encoding
+        self._length = length
+        self._array_type = array_type
+        self._array_stride = array_stride
+        self._array_byteswap = array_byteswap
+        self._array = None
+
+    def _array_get(self):
+        if self._array is None:
+            data = self._buf[self._offset:self._offset + self._comp_len]
+            self._array = decode_array(data, self._encoding, self._length,
+                                       self._array_type, self._array_stride, self._array_byteswap)
+            # we don't need the file anymore, allows the mmap to be released once all arrays are decoded.
+            self._buf = None
+        return self._array
+    array = property(_array_get)
+
+    def is_decoded(self):
+        return self._array is not None
+
+    def __len__(self):
+        # known from the header, no need to decode anything.
+        return self._length
+
+    def __getitem__(self, index):
+        return self.array[index]
+
+    def __iter__(self):
+        return iter(self.array)
+
+    def __repr__(self):
+        return "<FBXArrayLazy %r[%d]%s>" % (self._array_type, self._length,
+                                            "" if self._array is None else " (decoded)")
+
+
+def unpack_array_lazy(buf, array_type, array_stride, array_byteswap):
+    read = buf.read
+    length = read_uint(read)
+    encoding = read_uint(read)
+    comp_len = read_uint(read)
+
+    offset = buf.tell()
+    buf.seek(comp_len, 1)
+
+    return FBXArrayLazy(buf, offset, comp_len, encoding, length, array_type, array_stride, array_byteswap)
+
+
+# Arrays smaller than this are not worth a round-trip to a worker thread.
+_ARRAY_THREADED_MIN_SIZE = 1024 * 64
+
+
+def _elem_arrays_lazy(elems, arrays):
+    for elem in elems:
+        for data in elem[1]:
+            if type(data) is FBXArrayLazy and not data.is_decoded():
+                arrays.append(data)
+        _elem_arrays_lazy(elem[3], arrays)
+
+
+def arrays_decode(elems, use_threads=True):
+    """
+    Decode all lazy arrays of given elements (and their children).
+
+    zlib releases the GIL while inflating, so big arrays are decoded
+    by a pool of threads when use_threads is enabled.
+    """
+    arrays = []
+    _elem_arrays_lazy(elems, arrays)
+
+    arrays_threaded = []
+    for data in arrays:
+        if use_threads and data._comp_len >= _ARRAY_THREADED_MIN_SIZE and data._encoding == 1:
+            arrays_threaded.append(data)
+        else:
+            data.array
+
+    if len(arrays_threaded) > 1:
+        import os
+        from concurrent.futures import ThreadPoolExecutor
+
+        # biggest first, gives a better balance between workers.
+        arrays_threaded.sort(key=lambda data: data._comp_len, reverse=True)
+        with ThreadPoolExecutor(max_workers=min(len(arrays_threaded), os.cpu_count() or 1)) as executor:
+            for _ in executor.map(FBXArrayLazy._array_get, arrays_threaded):
+                pass
+    else:
+        for data in arrays_threaded:
+            data.array
+
+
+def _elem_arrays_replace(elems):
+    for elem in elems:
+        props = elem[1]
+        for i, data in enumerate(props):
+            if type(data) is FBXArrayLazy:
+                props[i] = data.array
+        _elem_arrays_replace(elem[3])
+
+
+def array_resolve(data):
+    """
+    Return data itself, or the decoded array if data is a lazy array.
+    """
+    return data.array if type(data) is FBXArrayLazy else data
+
+
 read_data_dict = {
     b'Y'[0]: lambda read: unpack(b'<h', read(2))[0],  # 16 bit int
     b'C'[0]: lambda read: unpack(b'?', read(1))[0],   # 1 bit bool (yes/no)
@@ -98,7 +228,23 @@ read_data_dict = {
     }
 
 
-def read_elem(read, tell, use_namedtuple):
+def read_data_dict_lazy(buf):
+    """
+    Same as read_data_dict, but arrays are not read, only their location in buf is stored.
+    """
+    read_data = read_data_dict.copy()
+    read_data.update({
+        b'f'[0]: lambda read: unpack_array_lazy(buf, data_types.ARRAY_FLOAT32, 4, False),
+        b'i'[0]: lambda read: unpack_array_lazy(buf, data_types.ARRAY_INT32, 4, True),
+        b'd'[0]: lambda read: unpack_array_lazy(buf, data_types.ARRAY_FLOAT64, 8, False),
+        b'l'[0]: lambda read: unpack_array_lazy(buf, data_types.ARRAY_INT64, 8, True),
+        b'b'[0]: lambda read: unpack_array_lazy(buf, data_types.ARRAY_BOOL, 1, False),
+        b'c'[0]: lambda read: unpack_array_lazy(buf, data_types.ARRAY_BYTE, 1, False),
+        })
+    return read_data
+
+
+def read_elem(read, tell, use_namedtuple, read_data=read_data_dict):
     # [0] the offset at which this block ends
     # [1] the number of properties in the scope
     # [2] the length of the property list
@@ -116,12 +262,12 @@ def read_elem(read, tell, use_namedtuple):
 
     for i in range(prop_count):
         data_type = read(1)[0]
-        elem_props_data[i] = read_data_dict[data_type](read)
+        elem_props_data[i] = read_data[data_type](read)
         elem_props_type[i] = data_type
 
     if tell() < end_offset:
         while tell() < (end_offset - _BLOCK_SENTINEL_LENGTH):
-            elem_subtree.append(read_elem(read, tell, use_namedtuple))
+            elem_subtree.append(read_elem(read, tell, use_namedtuple, read_data))
 
         if read(_BLOCK_SENTINEL_LENGTH) != _BLOCK_SENTINEL_DATA:
             raise IOError("failed to read nested block sentinel, "
@@ -148,12 +294,24 @@ def parse_version(fn):
         return read_uint(read)
 
 
-def parse(fn, use_namedtuple=True):
+def parse(fn, use_namedtuple=True, use_lazy=False, use_threads=True):
+    """
+    Parse a binary FBX file, return (root_elem, fbx_version).
+
+    When use_lazy is enabled, array properties are returned as FBXArrayLazy,
+    only decompressed when first accessed (see also arrays_decode).
+    Otherwise all arrays are decompressed once the structure is read,
+    in parallel when use_threads is enabled.
+    """
     root_elems = []
 
     with open(fn, 'rb') as f:
-        read = f.read
-        tell = f.tell
+        # The mapping stays valid after the file is closed,
+        # it's released once the last lazy array referencing it is decoded.
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        read = buf.read
+        tell = buf.tell
+        read_data = read_data_dict_lazy(buf)
 
         if read(len(_HEAD_MAGIC)) != _HEAD_MAGIC:
             raise IOError("Invalid header")
@@ -161,10 +319,14 @@ def parse(fn, use_namedtuple=True):
         fbx_version = read_uint(read)
 
         while True:
-            elem = read_elem(read, tell, use_namedtuple)
+            elem = read_elem(read, tell, use_namedtuple, read_data)
             if elem is None:
                 break
             root_elems.append(elem)
 
+    if not use_lazy:
+        arrays_decode(root_elems, use_threads)
+        _elem_arrays_replace(root_elems)
+
     args = (b'', [], bytearray(0), root_elems)
     return FBXElem(*args) if use_namedtuple else args, fbx_version
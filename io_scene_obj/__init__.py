@@ -98,6 +98,19 @@ class ImportOBJ(bpy.types.Operator, ImportHelper):
             default=False,
             )
 
+    use_animation_cache = BoolProperty(
+            name="Animation Cache",
+            description="Animate the vertices with the point cache (.pc2) "
+                        "written next to the OBJ file, if there is one",
+            default=True,
+            )
+    use_animation_cache_copy = BoolProperty(
+            name="Copy Scattered Caches",
+            description="Also animate split objects whose vertices are scattered in the OBJ file, "
+                        "copying their points from the point cache (Warning, may be slow)",
+            default=False,
+            )
+
     use_image_search = BoolProperty(
             name="Image Search",
             description="Search subdirs for any associated images "
@@ -197,6 +210,9 @@ class ImportOBJ(bpy.types.Operator, ImportHelper):
         layout.prop(self, "axis_up")
 
         layout.prop(self, "use_image_search")
+        layout.prop(self, "use_animation_cache")
+        if self.use_animation_cache and self.split_mode == 'ON':
+            layout.prop(self, "use_animation_cache_copy")
 
 
 class ExportOBJ(bpy.types.Operator, ExportHelper):
@@ -223,6 +239,12 @@ class ExportOBJ(bpy.types.Operator, ExportHelper):
             description="Write out an OBJ for each frame",
             default=False,
             )
+    use_animation_cache = BoolProperty(
+            name="Animation Cache",
+            description="With Animation, write one OBJ and the vertex positions "
+                        "of each frame to a point cache (.pc2) next to it",
+            default=False,
+            )
 
     # object group
     use_mesh_modifiers = BoolProperty(
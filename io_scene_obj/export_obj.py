@@ -19,7 +19,11 @@
 # <pep8 compliant>
 
 import os
+import sys
 import time
+import struct
+from array import array
+from itertools import repeat
 
 import bpy
 import mathutils
@@ -176,6 +180,21 @@ def test_nurbs_compat(ob):
     return False
 
 
+def nurb_points(ob, ob_mat):
+    """The points write_nurb writes, in the same order"""
+    for nu in ob.data.splines:
+        if nu.type == 'POLY':
+            DEG_ORDER_U = 1
+        else:
+            DEG_ORDER_U = nu.order_u - 1
+
+        if nu.type == 'BEZIER' or nu.point_count_v > 1 or len(nu.points) <= DEG_ORDER_U:
+            continue
+
+        for pt in nu.points:
+            yield ob_mat * pt.co.to_3d()
+
+
 def write_nurb(fw, ob, ob_mat):
     tot_verts = 0
     cu = ob.data
@@ -242,6 +261,103 @@ def write_nurb(fw, ob, ob_mat):
     return tot_verts
 
 
+def export_objects(objects, scene):
+    """(object, matrix) pairs to export, dupli children instead of their parent"""
+    for ob_main in objects:
+
+        # ignore dupli children
+        if ob_main.parent and ob_main.parent.dupli_type in {'VERTS', 'FACES'}:
+            # XXX
+            print(ob_main.name, 'is a dupli child - ignoring')
+            continue
+
+        obs = []
+        if ob_main.dupli_type != 'NONE':
+            # XXX
+            print('creating dupli_list on', ob_main.name)
+            ob_main.dupli_list_create(scene)
+
+            obs = [(dob.object, dob.matrix) for dob in ob_main.dupli_list]
+
+            # XXX debug print
+            print(ob_main.name, 'has', len(obs), 'dupli children')
+        else:
+            obs = [(ob_main, ob_main.matrix_world)]
+
+        yield from obs
+
+        if ob_main.dupli_type != 'NONE':
+            ob_main.dupli_list_clear()
+
+
+def write_pc2_header(file, points, frame_start, samples):
+    """Point cache (.pc2) header, the positions of every point follow, one sample after another"""
+    file.seek(0)
+    file.write(struct.pack('<12siiffi', b'POINTCACHE2\0', 1, points, frame_start, 1.0, samples))
+
+
+def write_pc2_sample(file, objects, scene,
+                     EXPORT_APPLY_MODIFIERS=True,
+                     EXPORT_CURVE_AS_NURBS=True,
+                     EXPORT_GLOBAL_MATRIX=None,
+                     ):
+    """
+    Append the positions of the vertices write_file would write for the current frame
+    to a point cache, returns their count.
+    """
+    if EXPORT_GLOBAL_MATRIX is None:
+        EXPORT_GLOBAL_MATRIX = mathutils.Matrix()
+
+    tot_points = 0
+
+    for ob, ob_mat in export_objects(objects, scene):
+        if EXPORT_CURVE_AS_NURBS and test_nurbs_compat(ob):
+            co = array('f', [c for pt in nurb_points(ob, EXPORT_GLOBAL_MATRIX * ob_mat) for c in pt])
+        else:
+            try:
+                me = ob.to_mesh(scene, EXPORT_APPLY_MODIFIERS, 'PREVIEW', calc_tessface=False)
+            except RuntimeError:
+                me = None
+
+            if me is None:
+                continue
+
+            me.transform(EXPORT_GLOBAL_MATRIX * ob_mat)
+            co = array('f', [0.0]) * (len(me.vertices) * 3)
+            me.vertices.foreach_get("co", co)
+            bpy.data.meshes.remove(me)
+
+        if sys.byteorder != 'little':
+            co.byteswap()
+        co.tofile(file)
+        tot_points += len(co) // 3
+
+    return tot_points
+
+
+OBJ_WRITE_BLOCK = 4096  # records formatted at once
+OBJ_WRITE_BUFFER = 1 << 20
+
+
+def write_block(fw, fmt, values, stride):
+    """Write values formatted with fmt, stride values per record, a block of records at a time"""
+    count = len(values) // stride
+    for start in range(0, count, OBJ_WRITE_BLOCK):
+        end = min(start + OBJ_WRITE_BLOCK, count)
+        fw((fmt * (end - start)) % tuple(values[start * stride:end * stride]))
+
+
+def unique_keys(keys):
+    """
+    Deduplicate keys in order of first appearance, returns
+    the positions of the first occurrence of each unique key and the unique index of every key.
+    """
+    first = dict(zip(reversed(keys), range(len(keys) - 1, -1, -1)))
+    first = sorted(first.values())
+    index = {keys[i]: n for n, i in enumerate(first)}
+    return first, list(map(index.__getitem__, keys))
+
+
 def write_file(filepath, objects, scene,
                EXPORT_TRI=False,
                EXPORT_EDGES=False,
@@ -270,13 +386,12 @@ def write_file(filepath, objects, scene,
     if EXPORT_GLOBAL_MATRIX is None:
         EXPORT_GLOBAL_MATRIX = mathutils.Matrix()
 
-    def veckey3d(v):
-        return round(v.x, 4), round(v.y, 4), round(v.z, 4)
-
-    def veckey2d(v):
-        return round(v[0], 4), round(v[1], 4)
+    def veckeys(values, stride):
+        """Rounded keys of flat coordinates"""
+        rounded = list(map(round, values, repeat(4, len(values))))
+        return list(zip(*[rounded[i::stride] for i in range(stride)]))
 
-    def findVertexGroupName(face, vWeightMap):
+    def findVertexGroupName(face_vertices, vWeightMap):
         """
         Searches the vertexDict to see what groups is assigned to a given face.
         We use a frequency system in order to sort out the name because a given vetex can
@@ -286,7 +401,7 @@ def write_file(filepath, objects, scene,
         of vertices is the face's group
         """
         weightDict = {}
-        for vert_index in face.vertices:
+        for vert_index in face_vertices:
             vWeights = vWeightMap[vert_index]
             for vGroupName, weight in vWeights:
                 weightDict[vGroupName] = weightDict.get(vGroupName, 0.0) + weight
@@ -300,7 +415,7 @@ def write_file(filepath, objects, scene,
 
     time1 = time.time()
 
-    file = open(filepath, "w", encoding="utf8", newline="\n")
+    file = open(filepath, "w", encoding="utf8", newline="\n", buffering=OBJ_WRITE_BUFFER)
     fw = file.write
 
     # Write Header
@@ -328,336 +443,308 @@ def write_file(filepath, objects, scene,
     copy_set = set()
 
     # Get all meshes
-    for ob_main in objects:
+    for ob, ob_mat in export_objects(objects, scene):
+        uv_unique_count = no_unique_count = 0
 
-        # ignore dupli children
-        if ob_main.parent and ob_main.parent.dupli_type in {'VERTS', 'FACES'}:
-            # XXX
-            print(ob_main.name, 'is a dupli child - ignoring')
+        # Nurbs curve support
+        if EXPORT_CURVE_AS_NURBS and test_nurbs_compat(ob):
+            ob_mat = EXPORT_GLOBAL_MATRIX * ob_mat
+            totverts += write_nurb(fw, ob, ob_mat)
             continue
+        # END NURBS
 
-        obs = []
-        if ob_main.dupli_type != 'NONE':
-            # XXX
-            print('creating dupli_list on', ob_main.name)
-            ob_main.dupli_list_create(scene)
+        try:
+            me = ob.to_mesh(scene, EXPORT_APPLY_MODIFIERS, 'PREVIEW', calc_tessface=False)
+        except RuntimeError:
+            me = None
 
-            obs = [(dob.object, dob.matrix) for dob in ob_main.dupli_list]
+        if me is None:
+            continue
 
-            # XXX debug print
-            print(ob_main.name, 'has', len(obs), 'dupli children')
-        else:
-            obs = [(ob_main, ob_main.matrix_world)]
+        me.transform(EXPORT_GLOBAL_MATRIX * ob_mat)
 
-        for ob, ob_mat in obs:
-            uv_unique_count = no_unique_count = 0
+        if EXPORT_TRI:
+            # _must_ do this first since it re-allocs arrays
+            mesh_triangulate(me)
 
-            # Nurbs curve support
-            if EXPORT_CURVE_AS_NURBS and test_nurbs_compat(ob):
-                ob_mat = EXPORT_GLOBAL_MATRIX * ob_mat
-                totverts += write_nurb(fw, ob, ob_mat)
-                continue
-            # END NURBS
+        if EXPORT_UV:
+            faceuv = len(me.uv_textures) > 0
+            if faceuv:
+                uv_texture = me.uv_textures.active.data[:]
+                uv_layer = me.uv_layers.active.data
+        else:
+            faceuv = False
+
+        # Pull the mesh data in bulk
+        tot_verts = len(me.vertices)
+        tot_faces = len(me.polygons)
+        tot_loops = len(me.loops)
+
+        f_material = [0] * tot_faces
+        f_use_smooth = [False] * tot_faces
+        f_loop_start = [0] * tot_faces
+        f_loop_total = [0] * tot_faces
+        me.polygons.foreach_get("material_index", f_material)
+        me.polygons.foreach_get("use_smooth", f_use_smooth)
+        me.polygons.foreach_get("loop_start", f_loop_start)
+        me.polygons.foreach_get("loop_total", f_loop_total)
+
+        loops_vert = array('i', [0]) * tot_loops
+        me.loops.foreach_get("vertex_index", loops_vert)
+
+        # Make our own list so it can be sorted to reduce context switching
+        face_indices = list(range(tot_faces))
+
+        if EXPORT_EDGES:
+            edges = me.edges
+        else:
+            edges = []
 
-            try:
-                me = ob.to_mesh(scene, EXPORT_APPLY_MODIFIERS, 'PREVIEW', calc_tessface=False)
-            except RuntimeError:
-                me = None
+        if not (len(face_indices) + len(edges) + tot_verts):  # Make sure there is somthing to write
 
-            if me is None:
-                continue
+            # clean up
+            bpy.data.meshes.remove(me)
 
-            me.transform(EXPORT_GLOBAL_MATRIX * ob_mat)
+            continue  # dont bother with this mesh.
 
-            if EXPORT_TRI:
-                # _must_ do this first since it re-allocs arrays
-                mesh_triangulate(me)
+        if EXPORT_NORMALS and face_indices:
+            me.calc_normals_split()
+            # No need to call me.free_normals_split later, as this mesh is deleted anyway!
+            loops = me.loops
+        else:
+            loops = []
 
-            if EXPORT_UV:
-                faceuv = len(me.uv_textures) > 0
-                if faceuv:
-                    uv_texture = me.uv_textures.active.data[:]
-                    uv_layer = me.uv_layers.active.data[:]
-            else:
-                faceuv = False
+        if (EXPORT_SMOOTH_GROUPS or EXPORT_SMOOTH_GROUPS_BITFLAGS) and face_indices:
+            smooth_groups, smooth_groups_tot = me.calc_smooth_groups(EXPORT_SMOOTH_GROUPS_BITFLAGS)
+            if smooth_groups_tot <= 1:
+                smooth_groups, smooth_groups_tot = (), 0
+        else:
+            smooth_groups, smooth_groups_tot = (), 0
 
-            me_verts = me.vertices[:]
+        materials = me.materials[:]
+        material_names = [m.name if m else None for m in materials]
 
-            # Make our own list so it can be sorted to reduce context switching
-            face_index_pairs = [(face, index) for index, face in enumerate(me.polygons)]
-            # faces = [ f for f in me.tessfaces ]
+        # avoid bad index errors
+        if not materials:
+            materials = [None]
+            material_names = [name_compat(None)]
 
-            if EXPORT_EDGES:
-                edges = me.edges
+        # Sort by Material, then images
+        # so we dont over context switch in the obj file.
+        if EXPORT_KEEP_VERT_ORDER:
+            pass
+        else:
+            if faceuv:
+                if smooth_groups:
+                    sort_func = lambda a: (f_material[a],
+                                           hash(uv_texture[a].image),
+                                           smooth_groups[a] if f_use_smooth[a] else False)
+                else:
+                    sort_func = lambda a: (f_material[a],
+                                           hash(uv_texture[a].image),
+                                           f_use_smooth[a])
+            elif len(materials) > 1:
+                if smooth_groups:
+                    sort_func = lambda a: (f_material[a],
+                                           smooth_groups[a] if f_use_smooth[a] else False)
+                else:
+                    sort_func = lambda a: (f_material[a],
+                                           f_use_smooth[a])
             else:
-                edges = []
+                # no materials
+                if smooth_groups:
+                    sort_func = lambda a: smooth_groups[a if f_use_smooth[a] else False]
+                else:
+                    sort_func = lambda a: f_use_smooth[a]
 
-            if not (len(face_index_pairs) + len(edges) + len(me.vertices)):  # Make sure there is somthing to write
+            face_indices.sort(key=sort_func)
 
-                # clean up
-                bpy.data.meshes.remove(me)
+            del sort_func
 
-                continue  # dont bother with this mesh.
+        # Loops in the order they are written (face corners)
+        loop_order = [l_idx for f_index in face_indices
+                      for l_idx in range(f_loop_start[f_index], f_loop_start[f_index] + f_loop_total[f_index])]
 
-            if EXPORT_NORMALS and face_index_pairs:
-                me.calc_normals_split()
-                # No need to call me.free_normals_split later, as this mesh is deleted anyway!
-                loops = me.loops
-            else:
-                loops = []
+        # Set the default mat to no material and no image.
+        contextMat = 0, 0  # Can never be this, so we will label a new material the first chance we get.
+        contextSmooth = None  # Will either be true or false,  set bad to force initialization switch.
 
-            if (EXPORT_SMOOTH_GROUPS or EXPORT_SMOOTH_GROUPS_BITFLAGS) and face_index_pairs:
-                smooth_groups, smooth_groups_tot = me.calc_smooth_groups(EXPORT_SMOOTH_GROUPS_BITFLAGS)
-                if smooth_groups_tot <= 1:
-                    smooth_groups, smooth_groups_tot = (), 0
+        if EXPORT_BLEN_OBS or EXPORT_GROUP_BY_OB:
+            name1 = ob.name
+            name2 = ob.data.name
+            if name1 == name2:
+                obnamestring = name_compat(name1)
             else:
-                smooth_groups, smooth_groups_tot = (), 0
+                obnamestring = '%s_%s' % (name_compat(name1), name_compat(name2))
+
+            if EXPORT_BLEN_OBS:
+                fw('o %s\n' % obnamestring)  # Write Object name
+            else:  # if EXPORT_GROUP_BY_OB:
+                fw('g %s\n' % obnamestring)
+
+        # Vert
+        verts_co = array('f', [0.0]) * (tot_verts * 3)
+        me.vertices.foreach_get("co", verts_co)
+        write_block(fw, 'v %.6f %.6f %.6f\n', verts_co, 3)
+        del verts_co
+
+        # Corners in writing order, vertex index then optional uv and normal indices
+        corners = [list(map(totverts.__add__, map(loops_vert.__getitem__, loop_order)))]
+
+        # UV
+        if faceuv:
+            uv = array('f', [0.0]) * (tot_loops * 2)
+            uv_layer.foreach_get("uv", uv)
+            uv_keys = veckeys(uv, 2)
+
+            uv_first, uv_ids = unique_keys(list(map(uv_keys.__getitem__, loop_order)))
+            write_block(fw, 'vt %.6f %.6f\n',
+                        [c for i in uv_first for c in uv[loop_order[i] * 2:loop_order[i] * 2 + 2]], 2)
+            uv_unique_count = len(uv_first)
+            corners.append(list(map(totuvco.__add__, uv_ids)))
+
+            del uv, uv_keys, uv_first, uv_ids
+            # Only need uv_unique_count
+
+        # NORMAL, Smooth/Non smoothed.
+        if EXPORT_NORMALS and loops:
+            normals = array('f', [0.0]) * (tot_loops * 3)
+            loops.foreach_get("normal", normals)
+            no_keys = list(map(veckeys(normals, 3).__getitem__, loop_order))
+
+            no_first, no_ids = unique_keys(no_keys)
+            write_block(fw, 'vn %.6f %.6f %.6f\n', [c for i in no_first for c in no_keys[i]], 3)
+            no_unique_count = len(no_first)
+            corners.append(list(map(totno.__add__, no_ids)))
+
+            del normals, no_keys, no_first, no_ids
+
+        if faceuv:
+            if EXPORT_NORMALS:
+                corner_format = "%d/%d/%d"  # vert, uv, normal
+            else:  # No Normals
+                corner_format = "%d/%d"  # vert, uv
+        else:  # No UV's
+            if EXPORT_NORMALS:
+                corner_format = "%d//%d"
+            else:  # No Normals
+                corner_format = "%d"
+        corners = list(map(corner_format.__mod__, zip(*corners)))
+
+        if not faceuv:
+            f_image = None
+
+        # XXX
+        if EXPORT_POLYGROUPS:
+            # Retrieve the list of vertex groups
+            vertGroupNames = ob.vertex_groups.keys()
+            if vertGroupNames:
+                currentVGroup = ''
+                # Create a dictionary keyed by face id and listing, for each vertex, the vertex groups it belongs to
+                vgroupsMap = [[(vertGroupNames[g.group], g.weight) for g in v.groups] for v in me.vertices]
+
+        corner = 0
+        for f_index in face_indices:
+            f_smooth = f_use_smooth[f_index]
+            if f_smooth and smooth_groups:
+                f_smooth = smooth_groups[f_index]
+            f_mat = min(f_material[f_index], len(materials) - 1)
+            f_loops = f_loop_total[f_index]
 
-            materials = me.materials[:]
-            material_names = [m.name if m else None for m in materials]
+            if faceuv:
+                tface = uv_texture[f_index]
+                f_image = tface.image
 
-            # avoid bad index errors
-            if not materials:
-                materials = [None]
-                material_names = [name_compat(None)]
+            # MAKE KEY
+            if faceuv and f_image:  # Object is always true.
+                key = material_names[f_mat], f_image.name
+            else:
+                key = material_names[f_mat], None  # No image, use None instead.
 
-            # Sort by Material, then images
-            # so we dont over context switch in the obj file.
-            if EXPORT_KEEP_VERT_ORDER:
-                pass
+            # Write the vertex group
+            if EXPORT_POLYGROUPS:
+                if vertGroupNames:
+                    # find what vertext group the face belongs to
+                    f_start = f_loop_start[f_index]
+                    vgroup_of_face = findVertexGroupName(loops_vert[f_start:f_start + f_loops], vgroupsMap)
+                    if vgroup_of_face != currentVGroup:
+                        currentVGroup = vgroup_of_face
+                        fw('g %s\n' % vgroup_of_face)
+
+            # CHECK FOR CONTEXT SWITCH
+            if key == contextMat:
+                pass  # Context already switched, dont do anything
             else:
-                if faceuv:
-                    if smooth_groups:
-                        sort_func = lambda a: (a[0].material_index,
-                                               hash(uv_texture[a[1]].image),
-                                               smooth_groups[a[1]] if a[0].use_smooth else False)
-                    else:
-                        sort_func = lambda a: (a[0].material_index,
-                                               hash(uv_texture[a[1]].image),
-                                               a[0].use_smooth)
-                elif len(materials) > 1:
-                    if smooth_groups:
-                        sort_func = lambda a: (a[0].material_index,
-                                               smooth_groups[a[1]] if a[0].use_smooth else False)
-                    else:
-                        sort_func = lambda a: (a[0].material_index,
-                                               a[0].use_smooth)
+                if key[0] is None and key[1] is None:
+                    # Write a null material, since we know the context has changed.
+                    if EXPORT_GROUP_BY_MAT:
+                        # can be mat_image or (null)
+                        fw("g %s_%s\n" % (name_compat(ob.name), name_compat(ob.data.name)))  # can be mat_image or (null)
+                    if EXPORT_MTL:
+                        fw("usemtl (null)\n")  # mat, image
+
                 else:
-                    # no materials
+                    mat_data = mtl_dict.get(key)
+                    if not mat_data:
+                        # First add to global dict so we can export to mtl
+                        # Then write mtl
+
+                        # Make a new names from the mat and image name,
+                        # converting any spaces to underscores with name_compat.
+
+                        # If none image dont bother adding it to the name
+                        # Try to avoid as much as possible adding texname (or other things)
+                        # to the mtl name (see [#32102])...
+                        mtl_name = "%s" % name_compat(key[0])
+                        if mtl_rev_dict.get(mtl_name, None) not in {key, None}:
+                            if key[1] is None:
+                                tmp_ext = "_NONE"
+                            else:
+                                tmp_ext = "_%s" % name_compat(key[1])
+                            i = 0
+                            while mtl_rev_dict.get(mtl_name + tmp_ext, None) not in {key, None}:
+                                i += 1
+                                tmp_ext = "_%3d" % i
+                            mtl_name += tmp_ext
+                        mat_data = mtl_dict[key] = mtl_name, materials[f_mat], f_image
+                        mtl_rev_dict[mtl_name] = key
+
+                    if EXPORT_GROUP_BY_MAT:
+                        fw("g %s_%s_%s\n" % (name_compat(ob.name), name_compat(ob.data.name), mat_data[0]))  # can be mat_image or (null)
+                    if EXPORT_MTL:
+                        fw("usemtl %s\n" % mat_data[0])  # can be mat_image or (null)
+
+            contextMat = key
+            if f_smooth != contextSmooth:
+                if f_smooth:  # on now off
                     if smooth_groups:
-                        sort_func = lambda a: smooth_groups[a[1] if a[0].use_smooth else False]
+                        f_smooth = smooth_groups[f_index]
+                        fw('s %d\n' % f_smooth)
                     else:
-                        sort_func = lambda a: a[0].use_smooth
-
-                face_index_pairs.sort(key=sort_func)
-
-                del sort_func
-
-            # Set the default mat to no material and no image.
-            contextMat = 0, 0  # Can never be this, so we will label a new material the first chance we get.
-            contextSmooth = None  # Will either be true or false,  set bad to force initialization switch.
-
-            if EXPORT_BLEN_OBS or EXPORT_GROUP_BY_OB:
-                name1 = ob.name
-                name2 = ob.data.name
-                if name1 == name2:
-                    obnamestring = name_compat(name1)
-                else:
-                    obnamestring = '%s_%s' % (name_compat(name1), name_compat(name2))
-
-                if EXPORT_BLEN_OBS:
-                    fw('o %s\n' % obnamestring)  # Write Object name
-                else:  # if EXPORT_GROUP_BY_OB:
-                    fw('g %s\n' % obnamestring)
+                        fw('s 1\n')
+                else:  # was off now on
+                    fw('s off\n')
+                contextSmooth = f_smooth
 
-            # Vert
-            for v in me_verts:
-                fw('v %.6f %.6f %.6f\n' % v.co[:])
+            fw('f %s\n' % ' '.join(corners[corner:corner + f_loops]))
+            corner += f_loops
 
-            # UV
             if faceuv:
-                # in case removing some of these dont get defined.
-                uv = f_index = uv_index = uv_key = uv_val = uv_ls = None
-
-                uv_face_mapping = [None] * len(face_index_pairs)
-
-                uv_dict = {}
-                uv_get = uv_dict.get
-                for f, f_index in face_index_pairs:
-                    uv_ls = uv_face_mapping[f_index] = []
-                    for uv_index, l_index in enumerate(f.loop_indices):
-                        uv = uv_layer[l_index].uv
-                        uv_key = veckey2d(uv)
-                        uv_val = uv_get(uv_key)
-                        if uv_val is None:
-                            uv_val = uv_dict[uv_key] = uv_unique_count
-                            fw('vt %.6f %.6f\n' % uv[:])
-                            uv_unique_count += 1
-                        uv_ls.append(uv_val)
-
-                del uv_dict, uv, f_index, uv_index, uv_ls, uv_get, uv_key, uv_val
-                # Only need uv_unique_count and uv_face_mapping
-
-            # NORMAL, Smooth/Non smoothed.
-            if EXPORT_NORMALS:
-                no_key = no_val = None
-                normals_to_idx = {}
-                no_get = normals_to_idx.get
-                loops_to_normals = [0] * len(loops)
-                for f, f_index in face_index_pairs:
-                    for l_idx in f.loop_indices:
-                        no_key = veckey3d(loops[l_idx].normal)
-                        no_val = no_get(no_key)
-                        if no_val is None:
-                            no_val = normals_to_idx[no_key] = no_unique_count
-                            fw('vn %.6f %.6f %.6f\n' % no_key)
-                            no_unique_count += 1
-                        loops_to_normals[l_idx] = no_val
-                del normals_to_idx, no_get, no_key, no_val
-            else:
-                loops_to_normals = []
-
-            if not faceuv:
-                f_image = None
-
-            # XXX
-            if EXPORT_POLYGROUPS:
-                # Retrieve the list of vertex groups
-                vertGroupNames = ob.vertex_groups.keys()
-                if vertGroupNames:
-                    currentVGroup = ''
-                    # Create a dictionary keyed by face id and listing, for each vertex, the vertex groups it belongs to
-                    vgroupsMap = [[] for _i in range(len(me_verts))]
-                    for v_idx, v_ls in enumerate(vgroupsMap):
-                        v_ls[:] = [(vertGroupNames[g.group], g.weight) for g in me_verts[v_idx].groups]
-
-            for f, f_index in face_index_pairs:
-                f_smooth = f.use_smooth
-                if f_smooth and smooth_groups:
-                    f_smooth = smooth_groups[f_index]
-                f_mat = min(f.material_index, len(materials) - 1)
-
-                if faceuv:
-                    tface = uv_texture[f_index]
-                    f_image = tface.image
-
-                # MAKE KEY
-                if faceuv and f_image:  # Object is always true.
-                    key = material_names[f_mat], f_image.name
-                else:
-                    key = material_names[f_mat], None  # No image, use None instead.
-
-                # Write the vertex group
-                if EXPORT_POLYGROUPS:
-                    if vertGroupNames:
-                        # find what vertext group the face belongs to
-                        vgroup_of_face = findVertexGroupName(f, vgroupsMap)
-                        if vgroup_of_face != currentVGroup:
-                            currentVGroup = vgroup_of_face
-                            fw('g %s\n' % vgroup_of_face)
-
-                # CHECK FOR CONTEXT SWITCH
-                if key == contextMat:
-                    pass  # Context already switched, dont do anything
-                else:
-                    if key[0] is None and key[1] is None:
-                        # Write a null material, since we know the context has changed.
-                        if EXPORT_GROUP_BY_MAT:
-                            # can be mat_image or (null)
-                            fw("g %s_%s\n" % (name_compat(ob.name), name_compat(ob.data.name)))  # can be mat_image or (null)
-                        if EXPORT_MTL:
-                            fw("usemtl (null)\n")  # mat, image
+                face_vert_index += f_loops
 
-                    else:
-                        mat_data = mtl_dict.get(key)
-                        if not mat_data:
-                            # First add to global dict so we can export to mtl
-                            # Then write mtl
-
-                            # Make a new names from the mat and image name,
-                            # converting any spaces to underscores with name_compat.
-
-                            # If none image dont bother adding it to the name
-                            # Try to avoid as much as possible adding texname (or other things)
-                            # to the mtl name (see [#32102])...
-                            mtl_name = "%s" % name_compat(key[0])
-                            if mtl_rev_dict.get(mtl_name, None) not in {key, None}:
-                                if key[1] is None:
-                                    tmp_ext = "_NONE"
-                                else:
-                                    tmp_ext = "_%s" % name_compat(key[1])
-                                i = 0
-                                while mtl_rev_dict.get(mtl_name + tmp_ext, None) not in {key, None}:
-                                    i += 1
-                                    tmp_ext = "_%3d" % i
-                                mtl_name += tmp_ext
-                            mat_data = mtl_dict[key] = mtl_name, materials[f_mat], f_image
-                            mtl_rev_dict[mtl_name] = key
-
-                        if EXPORT_GROUP_BY_MAT:
-                            fw("g %s_%s_%s\n" % (name_compat(ob.name), name_compat(ob.data.name), mat_data[0]))  # can be mat_image or (null)
-                        if EXPORT_MTL:
-                            fw("usemtl %s\n" % mat_data[0])  # can be mat_image or (null)
-
-                contextMat = key
-                if f_smooth != contextSmooth:
-                    if f_smooth:  # on now off
-                        if smooth_groups:
-                            f_smooth = smooth_groups[f_index]
-                            fw('s %d\n' % f_smooth)
-                        else:
-                            fw('s 1\n')
-                    else:  # was off now on
-                        fw('s off\n')
-                    contextSmooth = f_smooth
-
-                #f_v = [(vi, me_verts[v_idx]) for vi, v_idx in enumerate(f.vertices)]
-                f_v = [(vi, me_verts[v_idx], l_idx) for vi, (v_idx, l_idx) in enumerate(zip(f.vertices, f.loop_indices))]
-
-                fw('f')
-                if faceuv:
-                    if EXPORT_NORMALS:
-                        for vi, v, li in f_v:
-                            fw(" %d/%d/%d" %
-                                       (totverts + v.index,
-                                        totuvco + uv_face_mapping[f_index][vi],
-                                        totno + loops_to_normals[li],
-                                        ))  # vert, uv, normal
-                    else:  # No Normals
-                        for vi, v, li in f_v:
-                            fw(" %d/%d" % (
-                                       totverts + v.index,
-                                       totuvco + uv_face_mapping[f_index][vi],
-                                       ))  # vert, uv
-
-                    face_vert_index += len(f_v)
-
-                else:  # No UV's
-                    if EXPORT_NORMALS:
-                        for vi, v, li in f_v:
-                            fw(" %d//%d" % (totverts + v.index, totno + loops_to_normals[li]))
-                    else:  # No Normals
-                        for vi, v, li in f_v:
-                            fw(" %d" % (totverts + v.index))
-
-                fw('\n')
-
-            # Write edges.
-            if EXPORT_EDGES:
-                for ed in edges:
-                    if ed.is_loose:
-                        fw('l %d %d\n' % (totverts + ed.vertices[0], totverts + ed.vertices[1]))
-
-            # Make the indices global rather then per mesh
-            totverts += len(me_verts)
-            totuvco += uv_unique_count
-            totno += no_unique_count
+        # Write edges.
+        if EXPORT_EDGES:
+            for ed in edges:
+                if ed.is_loose:
+                    fw('l %d %d\n' % (totverts + ed.vertices[0], totverts + ed.vertices[1]))
 
-            # clean up
-            bpy.data.meshes.remove(me)
+        # Make the indices global rather then per mesh
+        totverts += tot_verts
+        totuvco += uv_unique_count
+        totno += no_unique_count
 
-        if ob_main.dupli_type != 'NONE':
-            ob_main.dupli_list_clear()
+        # clean up
+        bpy.data.meshes.remove(me)
 
     file.close()
 
@@ -688,6 +775,7 @@ def _write(context, filepath,
               EXPORT_CURVE_AS_NURBS,
               EXPORT_SEL_ONLY,  # ok
               EXPORT_ANIMATION,
+              EXPORT_ANIMATION_CACHE,
               EXPORT_GLOBAL_MATRIX,
               EXPORT_PATH_MODE,
               ):  # Not used
@@ -709,9 +797,18 @@ def _write(context, filepath,
     else:
         scene_frames = [orig_frame]  # Dont export an animation.
 
+    # Write the first frame only, and the vertex positions of all frames to a point cache.
+    if EXPORT_ANIMATION and EXPORT_ANIMATION_CACHE and scene_frames:
+        cache_file = open(base_name + ".pc2", "wb")
+        write_pc2_header(cache_file, 0, scene_frames[0], 0)
+        cache_points = None
+        cache_samples = 0
+    else:
+        cache_file = None
+
     # Loop through all frames in the scene and export.
     for frame in scene_frames:
-        if EXPORT_ANIMATION:  # Add frame to the filepath.
+        if EXPORT_ANIMATION and cache_file is None:  # Add frame to the filepath.
             context_name[2] = '_%.6d' % frame
 
         scene.frame_set(frame, 0.0)
@@ -720,6 +817,24 @@ def _write(context, filepath,
         else:
             objects = scene.objects
 
+        if cache_file is not None:
+            cache_end = cache_file.tell()
+            points = write_pc2_sample(cache_file, objects, scene,
+                                      EXPORT_APPLY_MODIFIERS,
+                                      EXPORT_CURVE_AS_NURBS,
+                                      EXPORT_GLOBAL_MATRIX,
+                                      )
+            if cache_points is None:
+                cache_points = points
+            elif points != cache_points:
+                print("\tWarning, vertex count changed on frame %d, the point cache stops there" % frame)
+                cache_file.truncate(cache_end)
+                break
+            cache_samples += 1
+
+            if cache_samples > 1:
+                continue  # topology and materials only once
+
         full_path = ''.join(context_name)
 
         # erm... bit of a problem here, this can overwrite files when exporting frames. not too bad.
@@ -743,6 +858,10 @@ def _write(context, filepath,
                    EXPORT_PATH_MODE,
                    )
 
+    if cache_file is not None:
+        write_pc2_header(cache_file, cache_points or 0, scene_frames[0], cache_samples)
+        cache_file.close()
+
     scene.frame_set(orig_frame, 0.0)
 
     # Restore old active scene.
@@ -774,6 +893,7 @@ def save(operator, context, filepath="",
          use_nurbs=True,
          use_selection=True,
          use_animation=False,
+         use_animation_cache=False,
          global_matrix=None,
          path_mode='AUTO'
          ):
@@ -795,6 +915,7 @@ def save(operator, context, filepath="",
            EXPORT_CURVE_AS_NURBS=use_nurbs,
            EXPORT_SEL_ONLY=use_selection,
            EXPORT_ANIMATION=use_animation,
+           EXPORT_ANIMATION_CACHE=use_animation_cache,
            EXPORT_GLOBAL_MATRIX=global_matrix,
            EXPORT_PATH_MODE=path_mode,
            )
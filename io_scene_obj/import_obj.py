@@ -32,7 +32,13 @@ http://wiki.blender.org/index.php/Scripts/Manual/Import/wavefront_obj
 """
 
 import os
+import re
+import sys
 import time
+import mmap
+import struct
+from array import array
+from itertools import accumulate, chain, repeat
 import bpy
 import mathutils
 from bpy_extras.io_utils import unpack_list, unpack_face_list
@@ -374,14 +380,16 @@ def create_materials(filepath, relpath,
 def split_mesh(verts_loc, faces, unique_materials, filepath, SPLIT_OB_OR_GROUP):
     """
     Takes vert_loc and faces, and separates into multiple sets of
-    (verts_loc, faces, unique_materials, dataname)
+    (verts_loc, faces, unique_materials, dataname, verts_index)
+    verts_loc are flat arrays of coordinates, 3 per vertex,
+    verts_index are the indices of the split verts in verts_loc, None when not split.
     """
 
     filename = os.path.splitext((os.path.basename(filepath)))[0]
 
     if not SPLIT_OB_OR_GROUP or not faces:
         # use the filename for the object name since we aren't chopping up the mesh.
-        return [(verts_loc, faces, unique_materials, filename)]
+        return [(verts_loc, faces, unique_materials, filename, None)]
 
     def key_to_name(key):
         # if the key is a tuple, join it to make a string
@@ -401,14 +409,15 @@ def split_mesh(verts_loc, faces, unique_materials, filepath, SPLIT_OB_OR_GROUP):
         if oldkey != key:
             # Check the key has changed.
             try:
-                verts_split, faces_split, unique_materials_split, vert_remap = face_split_dict[key]
+                verts_split, faces_split, unique_materials_split, vert_remap, verts_split_index = face_split_dict[key]
             except KeyError:
                 faces_split = []
-                verts_split = []
+                verts_split = array('d')
                 unique_materials_split = {}
                 vert_remap = {}
+                verts_split_index = []
 
-                face_split_dict[key] = (verts_split, faces_split, unique_materials_split, vert_remap)
+                face_split_dict[key] = (verts_split, faces_split, unique_materials_split, vert_remap, verts_split_index)
 
             oldkey = key
 
@@ -418,9 +427,9 @@ def split_mesh(verts_loc, faces, unique_materials, filepath, SPLIT_OB_OR_GROUP):
         for enum, i in enumerate(face_vert_loc_indices):
             map_index = vert_remap.get(i)
             if map_index is None:
-                map_index = len(verts_split)
+                map_index = len(verts_split_index)
                 vert_remap[i] = map_index  # set the new remapped index so we only add once and can reference next time.
-                verts_split.append(verts_loc[i])  # add the vert to the local verts
+                verts_split_index.append(i)  # the vert is added to the local verts once sorted
 
             face_vert_loc_indices[enum] = map_index  # remap to the local index
 
@@ -430,8 +439,23 @@ def split_mesh(verts_loc, faces, unique_materials, filepath, SPLIT_OB_OR_GROUP):
 
         faces_split.append(face)
 
+    # keep the split verts in file order, the point cache of an object
+    # is then a range of the file one when its verts are contiguous in the file
+    for verts_split, faces_split, unique_materials_split, vert_remap, verts_split_index in face_split_dict.values():
+        order = sorted(range(len(verts_split_index)), key=verts_split_index.__getitem__)
+        local_remap = [0] * len(order)
+        for map_index, i in enumerate(order):
+            local_remap[i] = map_index
+
+        verts_split_index[:] = map(verts_split_index.__getitem__, order)
+        for face in faces_split:
+            face[0][:] = map(local_remap.__getitem__, face[0])
+
+        for i in verts_split_index:
+            verts_split.extend(verts_loc[i * 3:i * 3 + 3])
+
     # remove one of the itemas and reorder
-    return [(value[0], value[1], value[2], key_to_name(key)) for key, value in list(face_split_dict.items())]
+    return [(value[0], value[1], value[2], key_to_name(key), value[4]) for key, value in list(face_split_dict.items())]
 
 
 def create_mesh(new_objects,
@@ -513,7 +537,8 @@ def create_mesh(new_objects,
             # NGons into triangles
             if has_ngons and len_face_vert_loc_indices > 4:
 
-                ngon_face_indices = ngon_tessellate(verts_loc, face_vert_loc_indices)
+                ngon_face_indices = ngon_tessellate([verts_loc[i * 3:i * 3 + 3] for i in face_vert_loc_indices],
+                                                    list(range(len_face_vert_loc_indices)))
                 faces.extend([([face_vert_loc_indices[ngon[0]],
                                 face_vert_loc_indices[ngon[1]],
                                 face_vert_loc_indices[ngon[2]],
@@ -572,11 +597,11 @@ def create_mesh(new_objects,
     for material in materials:
         me.materials.append(material)
 
-    me.vertices.add(len(verts_loc))
+    me.vertices.add(len(verts_loc) // 3)
     me.tessfaces.add(len(faces))
 
-    # verts_loc is a list of (x, y, z) tuples
-    me.vertices.foreach_set("co", unpack_list(verts_loc))
+    # verts_loc is a flat array of coordinates
+    me.vertices.foreach_set("co", verts_loc)
 
     # faces is a list of (vert_indices, texco_indices, ...) tuples
     # XXX faces should contain either 3 or 4 verts
@@ -745,7 +770,7 @@ def create_nurbs(context_nurbs, vert_loc, new_objects):
 
     nu = cu.splines.new('NURBS')
     nu.points.add(len(curv_idx) - 1)  # a point is added to start with
-    nu.points.foreach_set("co", [co_axis for vt_idx in curv_idx for co_axis in (vert_loc[vt_idx] + (1.0,))])
+    nu.points.foreach_set("co", [co_axis for vt_idx in curv_idx for co_axis in (tuple(vert_loc[vt_idx * 3:vt_idx * 3 + 3]) + (1.0,))])
 
     nu.order_u = deg[0] + 1
 
@@ -798,6 +823,150 @@ def strip_slash(line_split):
     return False
 
 
+def read_pc2_header(file):
+    """(points, frame_start, sample_rate, samples) of a point cache (.pc2), None if it isn't one"""
+    header = file.read(32)
+    if len(header) != 32:
+        return None
+
+    signature, version, points, frame_start, sample_rate, samples = struct.unpack('<12siiffi', header)
+    if signature != b'POINTCACHE2\0':
+        return None
+
+    return points, frame_start, sample_rate, samples
+
+
+def add_mesh_cache(ob, filepath, frame_start, sample_rate):
+    mod = ob.modifiers.new(name="MeshCache", type='MESH_CACHE')
+    mod.cache_format = 'PC2'
+    mod.filepath = filepath
+    mod.frame_start = frame_start
+    if sample_rate > 0.0:
+        mod.frame_scale = 1.0 / sample_rate
+
+
+def point_cache_dir(cache_path):
+    """
+    New directory for the point caches made on import, never next to the imported file:
+    next to the blend file when it's saved, in the temporary directory otherwise.
+    """
+    import tempfile
+
+    prefix = os.path.splitext(os.path.basename(os.fsdecode(cache_path)))[0] + "_pc2_"
+    blend_dir = os.path.dirname(bpy.path.abspath(bpy.data.filepath)) if bpy.data.filepath else None
+    return tempfile.mkdtemp(prefix=prefix, dir=blend_dir)
+
+
+def point_cache_ranges(verts_index):
+    """
+    Return the (start, end) ranges of consecutive points in verts_index (sorted).
+    """
+    ranges = []
+    start = prev = verts_index[0]
+    for i in verts_index[1:]:
+        if i != prev + 1:
+            ranges.append((start, prev + 1))
+            start = i
+        prev = i
+    ranges.append((start, prev + 1))
+    return ranges
+
+
+def load_point_cache(cache_path, cache_objects, tot_verts, use_animation_cache_copy=False):
+    """
+    Animate the new objects with the point cache (.pc2) written along the file,
+    with a Mesh Cache modifier so frames are read from disk as they are needed.
+
+    cache_objects are (object, verts_index) pairs, verts_index None for an object
+    with all the file vertices in order, which uses the cache directly.
+    Split objects get a cache per object (see point_cache_dir), copied one sample at a time:
+    a single slice of it for the vertices of an object contiguous in the file (as written by the exporter),
+    one slice per range of vertices otherwise (slow, only with use_animation_cache_copy).
+    """
+    with open(cache_path, 'rb') as cache_file:
+        header = read_pc2_header(cache_file)
+        if header is None:
+            print("\tWarning, invalid point cache %r, ignoring" % cache_path)
+            return
+
+        points, frame_start, sample_rate, samples = header
+        if points != tot_verts:
+            print("\tWarning, point cache %r has %d points for %d vertices, ignoring" % (cache_path, points, tot_verts))
+            return
+
+        # an interrupted export leaves less samples than the header says
+        samples_found = (os.fstat(cache_file.fileno()).st_size - 32) // (points * 12) if points else samples
+        if samples_found < samples:
+            print("\tWarning, point cache %r is truncated, %d of %d samples" % (cache_path, samples_found, samples))
+            samples = samples_found
+
+        split_objects = []
+        for ob, verts_index in cache_objects:
+            # split verts are sorted (see split_mesh), all of them are the file vertices in order
+            if verts_index is None or len(verts_index) == points:
+                add_mesh_cache(ob, os.fsdecode(cache_path), frame_start, sample_rate)
+            elif verts_index:
+                ranges = point_cache_ranges(verts_index)
+                if len(ranges) == 1 or use_animation_cache_copy:
+                    split_objects.append((ob, len(verts_index), ranges))
+                else:
+                    print("\tWarning, vertices of %r are not contiguous in the point cache, "
+                          "not animated (enable copying scattered caches)" % ob.name)
+
+        if not split_objects:
+            return
+
+        try:
+            cache_dir = point_cache_dir(cache_path)
+        except OSError as e:
+            print("\tWarning, can't create the point caches of the split objects (%s), ignoring" % e)
+            return
+
+        print("\twriting point caches of the split objects to %r" % cache_dir)
+
+        split_caches = []
+        names = set()
+        try:
+            for ob, ob_points, ranges in split_objects:
+                # object names can clean to the same file name
+                name = bpy.path.clean_name(ob.name)
+                name_unique = name
+                i = 0
+                while name_unique in names:
+                    i += 1
+                    name_unique = "%s_%d" % (name, i)
+                names.add(name_unique)
+
+                ob_cache_path = os.path.join(cache_dir, name_unique + ".pc2")
+                ob_cache_file = open(ob_cache_path, 'wb')
+                # byte ranges of the object points in a sample
+                split_caches.append((ob, ob_cache_path, ob_cache_file, [(start * 12, end * 12) for start, end in ranges]))
+                ob_cache_file.write(struct.pack('<12siiffi', b'POINTCACHE2\0', 1, ob_points, frame_start, sample_rate, samples))
+
+            # samples are copied as is, no need to convert the floats
+            sample_size = points * 12
+            for sample in range(samples):
+                co = cache_file.read(sample_size)
+                if len(co) != sample_size:
+                    raise EOFError("point cache ends at sample %d" % sample)
+
+                for ob, ob_cache_path, ob_cache_file, co_ranges in split_caches:
+                    for start, end in co_ranges:
+                        ob_cache_file.write(co[start:end])
+        except (OSError, EOFError) as e:
+            print("\tWarning, can't write the point caches of the split objects (%s), ignoring" % e)
+            split_caches_done = False
+        else:
+            split_caches_done = True
+        finally:
+            for ob, ob_cache_path, ob_cache_file, co_ranges in split_caches:
+                ob_cache_file.close()
+
+        if split_caches_done:
+            for ob, ob_cache_path, ob_cache_file, co_ranges in split_caches:
+                add_mesh_cache(ob, bpy.path.relpath(ob_cache_path) if bpy.data.filepath else ob_cache_path, frame_start, sample_rate)
+
+
 def get_float_func(filepath):
     """
     find the float function for this obj file
@@ -819,6 +988,144 @@ def get_float_func(filepath):
     return float
 
 
+OBJ_CHUNK_SIZE = 1 << 23  # bytes of the file parsed by one worker at a time
+
+# lines handled by the workers: vertices and texture coordinates with all their fields,
+# normals, comments and faces without relative indices that fit on one line, matched all at once
+obj_event_re = re.compile(br'^(?![ \t]*(?:v[ \t]+\S+[ \t]+\S+[ \t]+\S|vt[ \t]+\S+[ \t]+\S|vn[ \t]|'
+                          br'f[ \t][^-\\\n]*$|#|\r?$)).*$', re.M)
+obj_vert_loc_re = re.compile(br'^[ \t]*v[ \t]+(\S+)[ \t]+(\S+)[ \t]+(\S+)', re.M)
+obj_vert_tex_re = re.compile(br'^[ \t]*vt[ \t]+(\S+)[ \t]+(\S+)', re.M)
+obj_face_re = re.compile(br'^[ \t]*f[ \t](.*)$', re.M)
+
+
+def parse_obj_chunk(args):
+    """
+    Parse a line aligned part of the file, in a worker process.
+
+    Vertices, texture coordinates and faces are parsed into flat arrays,
+    any other line is returned as an event to be handled in order by the caller,
+    with the counts of records parsed before it.
+    """
+    filepath, start, end, use_comma = args
+
+    if use_comma:
+        float_func = lambda f: float(f.replace(b',', b'.'))
+    else:
+        float_func = float
+    to_index = (-1).__add__
+
+    verts_loc = array('d')
+    verts_tex = array('d')
+    face_offsets = array('l', (0,))
+    face_loc = array('l')
+    face_tex = array('l')
+    events = []
+
+    def parse_records(data):
+        verts_loc.extend(map(float_func, chain.from_iterable(obj_vert_loc_re.findall(data))))
+        verts_tex.extend(map(float_func, chain.from_iterable(obj_vert_tex_re.findall(data))))
+
+        faces = obj_face_re.findall(data)
+        if not faces:
+            return
+
+        face_offsets.extend(map(face_offsets[-1].__add__, accumulate(map(len, map(bytes.split, faces)))))
+
+        corners = b' '.join(faces).split()
+        slashes = set(map(bytes.count, corners, repeat(b'/')))
+        if slashes == {0}:
+            loc_fields = corners
+            tex_fields = [b''] * len(corners)
+        elif len(slashes) == 1:
+            # loc_index/tex_index/nor_index, same format for all corners
+            fields = b'/'.join(corners).split(b'/')
+            stride = slashes.pop() + 1
+            loc_fields = fields[0::stride]
+            tex_fields = fields[1::stride]
+        else:
+            obj_verts = [v.split(b'/') + [b''] for v in corners]
+            loc_fields = [obj_vert[0] for obj_vert in obj_verts]
+            tex_fields = [obj_vert[1] for obj_vert in obj_verts]
+
+        if not all(tex_fields):
+            tex_fields = [i or b'1' for i in tex_fields]  # dummy
+
+        face_loc.extend(map(to_index, map(int, loc_fields)))
+        face_tex.extend(map(to_index, map(int, tex_fields)))
+
+    with open(filepath, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        data = data[start:end]
+
+    position = 0
+    for event in obj_event_re.finditer(data):
+        parse_records(data[position:event.start()])
+        position = event.end()
+        events.append((len(verts_loc) // 3, len(verts_tex) // 2, len(face_offsets) - 1, event.group()))
+    parse_records(data[position:])
+
+    return verts_loc, verts_tex, face_offsets, face_loc, face_tex, events
+
+
+def parse_obj(filepath, use_comma, use_processes=False):
+    """
+    Parse the file in line aligned chunks, in worker processes with use_processes.
+
+    Yields (verts_loc, verts_tex, faces, line) in file order: the records parsed
+    before a line the workers don't handle (None at the end of a chunk),
+    verts_loc is a flat array of coordinates, faces are
+    (face_vert_loc_indices, face_vert_tex_indices) lists.
+
+    Workers are forked from the running process, which isn't safe with the threads of Blender
+    on all platforms (they can't be spawned, the add-on needs bpy), so this is only an option.
+    """
+    import multiprocessing
+
+    size = os.path.getsize(filepath)
+    if not size:
+        return
+
+    chunks = []
+    with open(filepath, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        start = 0
+        while start < size:
+            end = data.find(b'\n', start + OBJ_CHUNK_SIZE) + 1 or size
+            chunks.append((filepath, start, end, use_comma))
+            start = end
+
+    context = None
+    if use_processes:
+        try:
+            context = multiprocessing.get_context("fork")
+        except ValueError:
+            pass
+
+    if context is None or len(chunks) < 2 or (os.cpu_count() or 1) < 2:
+        pool = None
+        results = map(parse_obj_chunk, chunks)
+    else:
+        pool = context.Pool()
+        results = pool.imap(parse_obj_chunk, chunks)
+
+    try:
+        for verts_loc, verts_tex, face_offsets, face_loc, face_tex, events in results:
+            events.append((len(verts_loc) // 3, len(verts_tex) // 2, len(face_offsets) - 1, None))
+            face_loc = face_loc.tolist()
+            face_tex = face_tex.tolist()
+
+            v = t = f = 0
+            for next_v, next_t, next_f, line in events:
+                yield (verts_loc[v * 3:next_v * 3],
+                       list(zip(*[iter(verts_tex[t * 2:next_t * 2])] * 2)),
+                       [(face_loc[i:j], face_tex[i:j]) for i, j in zip(face_offsets[f:next_f], face_offsets[f + 1:next_f + 1])],
+                       line,
+                       )
+                v, t, f = next_v, next_t, next_f
+    finally:
+        if pool is not None:
+            pool.terminate()
+
+
 def load(operator, context, filepath,
          global_clamp_size=0.0,
          use_ngons=True,
@@ -828,6 +1135,9 @@ def load(operator, context, filepath,
          use_split_groups=True,
          use_image_search=True,
          use_groups_as_vgroups=False,
+         use_animation_cache=True,
+         use_animation_cache_copy=False,
+         use_processes=False,
          relpath=None,
          global_matrix=None,
          ):
@@ -849,7 +1159,7 @@ def load(operator, context, filepath,
 
     time_main = time.time()
 
-    verts_loc = []
+    verts_loc = array('d')  # 3 coordinates per vertex
     verts_tex = []
     faces = []  # tuples of the faces
     material_libs = []  # filanems to material libs this uses
@@ -888,8 +1198,28 @@ def load(operator, context, filepath,
     time_sub = time.time()
 #     time_sub= sys.time()
 
-    file = open(filepath, 'rb')
-    for line in file:  # .readlines():
+    # vertices and single line faces are parsed by parse_obj, the other lines are handled here in order
+    for verts_loc_block, verts_tex_block, faces_block, line in parse_obj(filepath, float_func is not float, use_processes):
+        verts_loc.extend(verts_loc_block)
+        verts_tex.extend(verts_tex_block)
+
+        for block_loc_indices, block_tex_indices in faces_block:
+            if use_groups_as_vgroups and context_vgroup:
+                vertex_groups[context_vgroup].extend(block_loc_indices)
+
+            faces.append((block_loc_indices,
+                          block_tex_indices,
+                          context_material,
+                          context_smooth_group,
+                          context_object,
+                          ))
+
+            if len(block_loc_indices) > 4:
+                has_ngons = True
+
+        if line is None:
+            continue
+
         line_split = line.split()
 
         if not line_split:
@@ -897,14 +1227,12 @@ def load(operator, context, filepath,
 
         line_start = line_split[0]  # we compare with this a _lot_
 
+        # vertices and texture coordinates with missing fields, default them to 0
         if line_start == b'v':
-            verts_loc.append((float_func(line_split[1]), float_func(line_split[2]), float_func(line_split[3])))
-
-        elif line_start == b'vn':
-            pass
+            verts_loc.extend(map(float_func, (line_split[1:] + [b'0'] * 3)[:3]))
 
         elif line_start == b'vt':
-            verts_tex.append((float_func(line_split[1]), float_func(line_split[2])))
+            verts_tex.append(tuple(map(float_func, (line_split[1:] + [b'0'] * 2)[:2])))
 
         # Handel faces lines (as faces) and the second+ lines of fa multiline face here
         # use 'f' not 'f ' because some objs (very rare have 'fo ' for faces)
@@ -942,7 +1270,7 @@ def load(operator, context, filepath,
 
                 # Make relative negative vert indices absolute
                 if vert_loc_index < 0:
-                    vert_loc_index = len(verts_loc) + vert_loc_index + 1
+                    vert_loc_index = len(verts_loc) // 3 + vert_loc_index + 1
 
                 face_vert_loc_indices.append(vert_loc_index)
 
@@ -996,7 +1324,7 @@ def load(operator, context, filepath,
 
                 # Make relative negative vert indices absolute
                 if vert_loc_index < 0:
-                    vert_loc_index = len(verts_loc) + vert_loc_index + 1
+                    vert_loc_index = len(verts_loc) // 3 + vert_loc_index + 1
 
                 face_vert_loc_indices.append(vert_loc_index)
 
@@ -1050,7 +1378,7 @@ def load(operator, context, filepath,
                 vert_loc_index = int(i) - 1
 
                 if vert_loc_index < 0:
-                    vert_loc_index = len(verts_loc) + vert_loc_index + 1
+                    vert_loc_index = len(verts_loc) // 3 + vert_loc_index + 1
 
                 curv_idx.append(vert_loc_index)
 
@@ -1087,7 +1415,6 @@ def load(operator, context, filepath,
             context_image= line_value(line_split)
         '''
 
-    file.close()
     time_new = time.time()
     print("%.4f sec" % (time_new - time_sub))
     time_sub = time_new
@@ -1107,14 +1434,16 @@ def load(operator, context, filepath,
 #     scn.objects.selected = []
     new_objects = []  # put new objects here
 
-    print('\tbuilding geometry...\n\tverts:%i faces:%i materials: %i smoothgroups:%i ...' % (len(verts_loc), len(faces), len(unique_materials), len(unique_smooth_groups)))
+    print('\tbuilding geometry...\n\tverts:%i faces:%i materials: %i smoothgroups:%i ...' % (len(verts_loc) // 3, len(faces), len(unique_materials), len(unique_smooth_groups)))
     # Split the mesh by objects/materials, may
     if use_split_objects or use_split_groups:
         SPLIT_OB_OR_GROUP = True
     else:
         SPLIT_OB_OR_GROUP = False
 
-    for verts_loc_split, faces_split, unique_materials_split, dataname in split_mesh(verts_loc, faces, unique_materials, filepath, SPLIT_OB_OR_GROUP):
+    cache_objects = []  # (object, verts_index) for the point cache
+
+    for verts_loc_split, faces_split, unique_materials_split, dataname, verts_index in split_mesh(verts_loc, faces, unique_materials, filepath, SPLIT_OB_OR_GROUP):
         # Create meshes from the data, warning 'vertex_groups' wont support splitting
         create_mesh(new_objects,
                     has_ngons,
@@ -1129,6 +1458,13 @@ def load(operator, context, filepath,
                     vertex_groups,
                     dataname,
                     )
+        cache_objects.append((new_objects[-1], verts_index))
+
+    # Vertex animation written along the file
+    cache_path = os.path.splitext(filepath)[0] + b".pc2"
+    if use_animation_cache and cache_objects and os.path.exists(cache_path):
+        print('\tloading point cache...')
+        load_point_cache(cache_path, cache_objects, len(verts_loc) // 3, use_animation_cache_copy)
 
     # nurbs support
     for context_nurbs in nurbs:
@@ -43,6 +43,7 @@ if "init_data" in locals():
     imp.reload(master_html)
     imp.reload(utils)
     imp.reload(balancing)
+    imp.reload(journal)
     imp.reload(ui)
     imp.reload(repath)
     imp.reload(versioning)
@@ -56,6 +57,7 @@ else:
     from netrender import master_html
     from netrender import utils
     from netrender import balancing
+    from netrender import journal
     from netrender import ui
     from netrender import repath
     from netrender import versioning
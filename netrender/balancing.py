@@ -29,6 +29,14 @@ class RatingRule:
     def id(self):
         return str(id(self))
 
+    def prepare(self, jobs):
+        """Called once per balancing pass, before jobs are rated"""
+        pass
+
+    def finish(self):
+        """Called once per balancing pass, after jobs are rated"""
+        pass
+
     def rate(self, job):
         return 0
 
@@ -52,11 +60,30 @@ class PriorityRule:
     def test(self, job):
         return False
 
+class ChunkRule:
+    def __init__(self):
+        self.enabled = True
+        self.editable = True
+    def id(self):
+        return str(id(self))
+
+    def chunks(self, job, slave):
+        return job.chunks
+
 class Balancer:
+    """
+    Jobs are kept in rating order, they're only rated and sorted again when ratings may have changed
+    (see invalidate), not on each dispatch. Priorities and exceptions depend on frame counts and time,
+    they're tested when selecting the job to dispatch (see select).
+    """
     def __init__(self):
         self.rules = []
         self.priorities = []
         self.exceptions = []
+        self.chunking = []
+
+        self.ratings = {} # job id -> rating, from the last time jobs were rated
+        self.ratings_valid = False
 
     def ruleByID(self, rule_id):
         for rule in self.rules:
@@ -68,11 +95,15 @@ class Balancer:
         for rule in self.exceptions:
             if rule.id() == rule_id:
                 return rule
+        for rule in self.chunking:
+            if rule.id() == rule_id:
+                return rule
 
         return None
 
     def addRule(self, rule):
         self.rules.append(rule)
+        self.invalidate()
 
     def addPriority(self, priority):
         self.priorities.append(priority)
@@ -80,9 +111,20 @@ class Balancer:
     def addException(self, exception):
         self.exceptions.append(exception)
 
+    def addChunking(self, chunking):
+        self.chunking.append(chunking)
+
+    def invalidate(self):
+        """Rate jobs again on next balance: usage updated, jobs added, removed or edited, rules changed"""
+        self.ratings_valid = False
+
     def applyRules(self, job):
         return sum((rule.rate(job) for rule in self.rules if rule.enabled))
 
+    def rating(self, job):
+        rating = self.ratings.get(job.id)
+        return self.applyRules(job) if rating is None else rating
+
     def applyPriorities(self, job):
         for priority in self.priorities:
             if priority.enabled and priority.test(job):
@@ -97,19 +139,66 @@ class Balancer:
 
         return False
 
+    def applyChunking(self, job, slave):
+        for chunking in self.chunking:
+            if chunking.enabled:
+                return max(chunking.chunks(job, slave), 1) # first enabled rule decides
+
+        return job.chunks
+
     def sortKey(self, job):
         return (1 if self.applyExceptions(job) else 0, # exceptions after
                         0 if self.applyPriorities(job) else 1, # priorities first
-                        self.applyRules(job))
+                        self.rating(job))
+
+    def rate(self, jobs):
+        rules = [rule for rule in self.rules if rule.enabled]
+        for rule in rules:
+            rule.prepare(jobs)
+
+        try:
+            # ratings only depend on data gathered in prepare
+            self.ratings = {job.id: self.applyRules(job) for job in jobs}
+        finally:
+            for rule in rules:
+                rule.finish()
+
+        self.ratings_valid = True
 
     def balance(self, jobs):
         if jobs:
-            # use inline copy to make sure the list is still accessible while sorting
-            jobs[:] = sorted(jobs, key=self.sortKey)
+            # jobs added without invalidating are rated too
+            if not self.ratings_valid or len(self.ratings) != len(jobs):
+                self.rate(jobs)
+
+                # use inline copy to make sure the list is still accessible while sorting
+                ratings = self.ratings
+                jobs[:] = sorted(jobs, key=lambda job: ratings[job.id])
+
             return jobs[0]
         else:
             return None
 
+    def select(self, jobs, accept = None):
+        """
+        Job to dispatch from jobs in rating order (see balance): the first with priority, or else the first one,
+        skipping exceptions and jobs refused by accept.
+        Same choice as taking the first accepted job after sorting with sortKey.
+        """
+        first = None
+
+        for job in jobs:
+            if self.applyExceptions(job) or (accept and not accept(job)):
+                continue
+
+            if self.applyPriorities(job):
+                return job # priorities are first
+
+            if first is None:
+                first = job
+
+        return first
+
 # ==========================
 
 class RatingUsage(RatingRule):
@@ -131,13 +220,37 @@ class RatingUsageByCategory(RatingRule):
     def __init__(self, get_jobs):
         super().__init__()
         self.getJobs = get_jobs
+        self.categories = None
 
     def __str__(self):
         return "Usage per category"
 
+    def categoryTotals(self, jobs):
+        # category -> [total usage, maximum priority]
+        categories = {}
+        for j in jobs:
+            totals = categories.get(j.category)
+            if totals:
+                totals[0] += j.usage
+                totals[1] = max(totals[1], j.priority)
+            else:
+                categories[j.category] = [j.usage, j.priority]
+
+        return categories
+
+    def prepare(self, jobs):
+        # totals are gathered in one pass instead of once per rated job
+        self.categories = self.categoryTotals(jobs)
+
+    def finish(self):
+        self.categories = None
+
     def rate(self, job):
-        total_category_usage = sum([j.usage for j in self.getJobs() if j.category == job.category])
-        maximum_priority = max([j.priority for j in self.getJobs() if j.category == job.category])
+        categories = self.categories
+        if categories is None or job.category not in categories:
+            categories = self.categoryTotals(self.getJobs())
+
+        total_category_usage, maximum_priority = categories[job.category]
 
         # less usage is better
         return total_category_usage / maximum_priority
@@ -254,3 +367,43 @@ class ExcludeSlavesLimit(ExclusionRule):
                  "limit_str":self.str_limit(),
                  "id":self.id()
 	  }
+
+class AdaptiveChunks(ChunkRule):
+    def __init__(self, count_slaves, limit = 5):
+        super().__init__()
+        self.count_slaves = count_slaves
+        self.limit = limit
+
+    def setLimit(self, value):
+        self.limit = float(value)
+
+    def str_limit(self):
+        return "about %g minute%s per dispatch" % (self.limit, "s" if self.limit != 1 else "")
+
+    def __str__(self):
+        return "Adapt chunks to frame render time"
+
+    def chunks(self, job, slave):
+        frame_time = job.averageFrameTime(slave.id)
+
+        if not frame_time:
+            return job.chunks # nothing rendered yet, use the job setting
+
+        chunks = int(self.limit * 60 / frame_time)
+
+        # near the end, split the remaining frames between all slaves, so none is left rendering alone
+        queued = job.countFrames(status = netrender.model.FRAME_QUEUED)
+        slaves = max(self.count_slaves(), 1)
+        chunks = min(chunks, -(-queued // slaves))
+
+        return chunks
+
+    def serialize(self):
+        return { "type": "chunking",
+                 "enabled": self.enabled,
+                 "editable": self.editable,
+                 "descritpiton":str(self),
+                 "limit": self.limit,
+                 "limit_str":self.str_limit(),
+                 "id":self.id()
+          }
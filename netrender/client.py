@@ -174,6 +174,14 @@ def sendJobVCS(conn, scene, anim = False):
 
     return job_id
 
+def signatureCache(netsettings):
+    # signatures of unchanged files are reused between jobs
+    path = bpy.path.abspath(netsettings.path)
+    if os.path.isdir(path):
+        return SignatureCache(os.path.join(path, "signatures.json"))
+    else:
+        return None
+
 def sendJobBaking(conn, scene, can_save = True):
     netsettings = scene.network_render
     job = netrender.model.RenderJob()
@@ -232,6 +240,8 @@ def sendJobBaking(conn, scene, can_save = True):
         job.addFrame(i + 1)
         job.frames[-1].command = netrender.baking.taskToCommand(task)
         
+    job.signFiles(signatureCache(netsettings))
+
     # try to send path first
     with ConnectionContext():
         conn.request("POST", "/job", json.dumps(job.serialize()))
@@ -322,6 +332,8 @@ def sendJobBlender(conn, scene, anim = False, can_save = True):
     
     job.tags.add(netrender.model.TAG_RENDER)
 
+    job.signFiles(signatureCache(netsettings))
+
     # try to send path first
     with ConnectionContext():
         conn.request("POST", "/job", json.dumps(job.serialize()))
@@ -0,0 +1,125 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+import os
+import json
+import threading
+
+JOURNAL_FILENAME = "blender_master.journal"
+
+# Record types
+RECORD_MASTER = "master"            # master working path and last job id
+RECORD_SLAVE = "slave"              # slave added
+RECORD_SLAVE_REMOVE = "slave_remove"
+RECORD_JOB = "job"                  # full job state
+RECORD_JOB_INFO = "job_info"        # job status, priority, ... changed
+RECORD_JOB_REMOVE = "job_remove"
+RECORD_FRAMES = "frames"            # frames status changed
+
+class Journal:
+    """
+    Append only log of the master state, one json record per line.
+
+    Records are written (and flushed) as changes happen, so nothing is lost if the master dies.
+    Replaying them in order rebuilds the state, the log is rewritten as a snapshot
+    of the live state (compacted) when it grows much larger than that.
+    """
+    def __init__(self, path, compact_ratio = 4, compact_minimum = 10000):
+        self.filepath = os.path.join(path, JOURNAL_FILENAME)
+        self.lock = threading.Lock()
+        self.file = None
+
+        self.compact_ratio = compact_ratio
+        self.compact_minimum = compact_minimum
+
+        self.records = 0 # records in the log
+        self.snapshot_records = 0 # records in the last snapshot
+
+    def exists(self):
+        return os.path.exists(self.filepath)
+
+    def read(self):
+        """Records of the log, in order"""
+        records = []
+
+        with open(self.filepath, "r", encoding = "utf8") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    # last record was only partially written, ignore the rest
+                    print("Journal: truncated record, ignoring the end of the log")
+                    break
+
+        return records
+
+    def write(self, records):
+        """Replace the log by the given records (snapshot) and keep it open for appending"""
+        temp_path = self.filepath + ".temp"
+
+        with self.lock:
+            if self.file:
+                self.file.close()
+                self.file = None
+
+            with open(temp_path, "w", encoding = "utf8") as f:
+                for record in records:
+                    f.write(json.dumps(record))
+                    f.write("\n")
+
+                f.flush()
+                os.fsync(f.fileno())
+
+            os.replace(temp_path, self.filepath)
+
+            self.records = self.snapshot_records = len(records)
+            self.file = open(self.filepath, "a", encoding = "utf8")
+
+    def append(self, record):
+        line = json.dumps(record) + "\n"
+
+        with self.lock:
+            if self.file:
+                self.file.write(line)
+                self.file.flush()
+                self.records += 1
+
+    def needsCompaction(self):
+        return self.records > max(self.compact_minimum, self.snapshot_records * self.compact_ratio)
+
+    def close(self):
+        with self.lock:
+            if self.file:
+                self.file.flush()
+                os.fsync(self.file.fileno())
+                self.file.close()
+                self.file = None
+
+    def moveAside(self):
+        """Keep an unusable log for inspection instead of writing over it, returns its new path"""
+        self.close()
+
+        bad_path = self.filepath + ".bad"
+        os.replace(self.filepath, bad_path)
+        return bad_path
+
+    def remove(self):
+        self.close()
+
+        if self.exists():
+            os.remove(self.filepath)
@@ -18,16 +18,18 @@
 
 import sys, os
 import http, http.client, http.server, socket, socketserver
-import shutil, time, hashlib
+import shutil, time, hashlib, tempfile
+import threading
 import pickle
 import zipfile
-import select # for select.error
+import urllib.parse
 import json
 
 
 from netrender.utils import *
 import netrender.model
 import netrender.balancing
+import netrender.journal
 import netrender.master_html
 import netrender.thumbnail as thumbnail
 
@@ -36,11 +38,12 @@ class MRenderFile(netrender.model.RenderFile):
         super().__init__(filepath, index, start, end, signature)
         self.found = False
 
-    def updateStatus(self):
+    def updateStatus(self, found_signature = None):
         self.found = os.path.exists(self.filepath)
         
         if self.found and self.signature != None:
-            found_signature = hashFile(self.filepath)
+            if found_signature is None:
+                found_signature = hashFile(self.filepath)
             self.found = self.signature == found_signature
             if not self.found:
                 print("Signature mismatch", self.signature, found_signature)
@@ -67,6 +70,14 @@ class MRenderSlave(netrender.model.RenderSlave):
 
         netrender.model.RenderSlave._slave_map[self.id] = self
 
+    @staticmethod
+    def journalMaterialize(data):
+        slave = MRenderSlave(netrender.model.RenderSlave.materialize(data, cache = False))
+        # keep the id the slave was given, it's still using it
+        slave.id = data["id"]
+        netrender.model.RenderSlave._slave_map[slave.id] = slave
+        return slave
+
     def seen(self):
         self.last_seen = time.time()
 
@@ -97,6 +108,7 @@ class MRenderJob(netrender.model.RenderJob):
         self.last_update = 0
         self.save_path = ""
         self.files = [MRenderFile(rfile.filepath, rfile.index, rfile.start, rfile.end, rfile.signature) for rfile in job_info.files]
+        self.frame_times = {} # slave id -> (total render time, frames rendered)
         
     def setForceUpload(self, force):
         for rfile in self.files:
@@ -112,6 +124,87 @@ class MRenderJob(netrender.model.RenderJob):
             f.write(json.dumps(self.serialize()))
             f.close()
 
+    def journalInfo(self):
+        return {
+                    "id": self.id,
+                    "status": self.status,
+                    "transitions": self.transitions,
+                    "priority": self.priority,
+                    "chunks": self.chunks,
+                    "blacklist": self.blacklist,
+                    "usage": self.usage,
+                    "last_dispatched": self.last_dispatched,
+                    "finish_time": self.finish_time,
+                    "resolution": self.resolution,
+                    "found": [rfile.found for rfile in self.files]
+                }
+
+    def journalRestoreInfo(self, info):
+        self._status = info["status"] # transitions are restored as is
+        self.transitions = info["transitions"]
+        self.priority = info["priority"]
+        self.chunks = info["chunks"]
+        self.blacklist = info["blacklist"]
+        self.usage = info["usage"]
+        self.last_dispatched = info["last_dispatched"]
+        self.finish_time = info["finish_time"]
+        self.resolution = info["resolution"]
+
+        for rfile, found in zip(self.files, info["found"]):
+            rfile.found = found
+
+    def journalState(self):
+        data = self.serialize(withFrames = False)
+        data.update(self.journalInfo())
+        data["save_path"] = self.save_path
+        data["start_time"] = self.start_time
+        data["frames"] = [frame.journalState() + [frame.command] for frame in self.frames]
+        return data
+
+    @staticmethod
+    def journalMaterialize(data, slaves_map):
+        frames = data["frames"]
+        data["frames"] = []
+
+        job_info = netrender.model.RenderJob.materialize(data)
+        job = MRenderJob(data["id"], job_info)
+
+        for rfile, info_file in zip(job.files, job_info.files):
+            rfile.original_path = info_file.original_path
+            rfile.force = info_file.force
+
+        job.journalRestoreInfo(data)
+        job.save_path = data["save_path"]
+        job.start_time = data["start_time"]
+
+        for state in frames:
+            frame = job.addFrame(state[0], state[-1])
+            frame.journalRestore(state, slaves_map)
+
+        job.indexFrameTimes()
+
+        return job
+
+    def addFrameTime(self, slave_id, frame_time):
+        total_time, count = self.frame_times.get(slave_id, (0.0, 0))
+        self.frame_times[slave_id] = (total_time + frame_time, count + 1)
+
+    def indexFrameTimes(self):
+        self.frame_times = {}
+        for frame in self.frames:
+            if frame.status == netrender.model.FRAME_DONE and frame.slave and frame.time:
+                self.addFrameTime(frame.slave.id, frame.time)
+
+    def averageFrameTime(self, slave_id = None):
+        """Average render time of a frame on that slave (or on any slave if it hasn't rendered any), None if unknown"""
+        if slave_id in self.frame_times:
+            total_time, count = self.frame_times[slave_id]
+        else:
+            total_time = sum(t for t, c in self.frame_times.values())
+            count = sum(c for t, c in self.frame_times.values())
+
+        return total_time / count if count else None
+
     def edit(self, info_map):
         if "status" in info_map:
             self.status = info_map["status"]
@@ -122,22 +215,25 @@ class MRenderJob(netrender.model.RenderJob):
         if "chunks" in info_map:
             self.chunks = info_map["chunks"]
 
-    def testStart(self):
+    def testFiles(self):
         # Don't test files for versionned jobs
         if not self.version_info:
             for f in self.files:
                 if not f.test():
                     return False
 
+        return True
+
+    def testStart(self):
+        if not self.testFiles():
+            return False
+
         self.start()
         self.initInfo()
         return True
 
     def testFinished(self):
-        for f in self.frames:
-            if f.status == netrender.model.FRAME_QUEUED or f.status == netrender.model.FRAME_DISPATCHED:
-                break
-        else:
+        if not self.countFrames(netrender.model.FRAME_QUEUED) and not self.countFrames(netrender.model.FRAME_DISPATCHED):
             self.status = netrender.model.JOB_FINISHED
             self.finish_time=time.time()
 
@@ -167,9 +263,7 @@ class MRenderJob(netrender.model.RenderJob):
                 frame.log_path = log_path
 
     def addFrame(self, frame_number, command):
-        frame = MRenderFrame(frame_number, command)
-        self.frames.append(frame)
-        return frame
+        return self._appendFrame(MRenderFrame(frame_number, command))
 
     def reset(self, all):
         for f in self.frames:
@@ -178,14 +272,14 @@ class MRenderJob(netrender.model.RenderJob):
         if all:
             self.status = netrender.model.JOB_QUEUED
 
-    def getFrames(self):
-        frames = []
-        for f in self.frames:
-            if f.status == netrender.model.FRAME_QUEUED:
-                self.last_dispatched = time.time()
-                frames.append(f)
-                if len(frames) >= self.chunks:
-                    break
+    def getFrames(self, chunks = None):
+        if chunks is None or self.type == netrender.model.JOB_PROCESS:
+            chunks = self.chunks
+
+        frames = self.queuedFrames(max(chunks, 1))
+
+        if frames:
+            self.last_dispatched = time.time()
 
         return frames
     
@@ -203,6 +297,16 @@ class MRenderFrame(netrender.model.RenderFrame):
 
         self.log_path = None
 
+    def journalState(self):
+        return [self.number, self.status, self.time, self.slave.id if self.slave else None, self.log_path, self.results]
+
+    def journalRestore(self, state, slaves_map):
+        self.status = state[1]
+        self.time = state[2]
+        self.slave = slaves_map.get(state[3])
+        self.log_path = state[4]
+        self.results = state[5]
+
     def addDefaultRenderResult(self):
         self.results.append(self.getRenderFilename())
 
@@ -230,16 +334,66 @@ reset_pattern = re.compile("/reset(all|)_([a-zA-Z0-9]+)_([0-9]+)")
 cancel_pattern = re.compile("/cancel_([a-zA-Z0-9]+)")
 pause_pattern = re.compile("/pause_([a-zA-Z0-9]+)")
 edit_pattern = re.compile("/edit_([a-zA-Z0-9]+)")
+range_pattern = re.compile("bytes=([0-9]+)-$")
+
+# buffer size for file transfers
+TRANSFER_BUFFER_SIZE = 1024 * 1024
+
+# longest time (in seconds) a slave request can be held open by the master (long polling)
+MAX_WAIT_TIMEOUT = 60
+
+# requests that can change what is dispatched or cancelled, waiting slaves are woken up after them
+notify_methods = {"POST", "PUT"}
+notify_pattern = re.compile("/(job|edit|balance|cancel|pause|clear|reset|file|render|result)")
 
 class RenderHandler(http.server.BaseHTTPRequestHandler):
     def write_file(self, file_path, mode = 'wb'):
+        # stream to disk, never hold whole uploads in memory
+        # returns the signature of the received data, so it doesn't have to be read again
         length = int(self.headers['content-length'])
-        f = open(file_path, mode)
-        buf = self.rfile.read(length)
-        f.write(buf)
-        f.close()
-        del buf
-        
+        m = hashlib.md5()
+        with open(file_path, mode) as f:
+            while length > 0:
+                buf = self.rfile.read(min(length, TRANSFER_BUFFER_SIZE))
+                if not buf:
+                    break
+                f.write(buf)
+                m.update(buf)
+                length -= len(buf)
+
+        return m.hexdigest()
+
+    def send_file(self, file_path, content = "application/octet-stream"):
+        with open(file_path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+
+            # only open ended ranges are supported, used to resume interrupted downloads
+            match = range_pattern.match(self.headers.get('range', ""))
+            start = int(match.groups()[0]) if match else 0
+
+            if 0 < start < size:
+                f.seek(start)
+                self.send_head(http.client.PARTIAL_CONTENT, headers = {
+                                                                    "content-length": str(size - start),
+                                                                    "content-range": "bytes %i-%i/%i" % (start, size - 1, size)
+                                                                    }, content = content)
+            else:
+                self.send_head(headers = {"content-length": str(size), "accept-ranges": "bytes"}, content = content)
+
+            shutil.copyfileobj(f, self.wfile, TRANSFER_BUFFER_SIZE)
+
+    def handle_one_request(self):
+        super().handle_one_request()
+
+        if getattr(self, "command", None) in notify_methods and notify_pattern.match(self.path):
+            self.server.notifyChange()
+
+    def getWaitTimeout(self):
+        try:
+            return min(float(self.headers.get('wait-timeout', 0)), MAX_WAIT_TIMEOUT)
+        except ValueError:
+            return 0
+
     def log_message(self, format, *args):
         # override because the original calls self.address_string(), which
         # is extremely slow due to some timeout..
@@ -271,19 +425,12 @@ class RenderHandler(http.server.BaseHTTPRequestHandler):
             job_id = self.headers.get('job-id', "")
             job_frame = int(self.headers.get('job-frame', -1))
 
-            job = self.server.getJobID(job_id)
-            if job:
-                frame = job[job_frame]
-
-
-                if frame:
-                    self.send_head(http.client.OK)
-                else:
-                    # no such frame
-                    self.send_head(http.client.NO_CONTENT)
-            else:
-                # no such job id
+            # with a wait timeout, the request is held until the frame is cancelled
+            if self.server.waitCancel(job_id, job_frame, self.getWaitTimeout()):
+                # no such job id or frame
                 self.send_head(http.client.NO_CONTENT)
+            else:
+                self.send_head(http.client.OK)
 
     # =-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
     # -=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=
@@ -318,10 +465,7 @@ class RenderHandler(http.server.BaseHTTPRequestHandler):
 
                             filename = job.getResultPath(frame.getRenderFilename())
 
-                            f = open(filename, 'rb')
-                            self.send_head(content = "image/x-exr")
-                            shutil.copyfileobj(f, self.wfile)
-                            f.close()
+                            self.send_file(filename, content = "image/x-exr")
                         elif frame.status == netrender.model.FRAME_ERROR:
                             self.send_head(http.client.PARTIAL_CONTENT)
                     else:
@@ -345,20 +489,33 @@ class RenderHandler(http.server.BaseHTTPRequestHandler):
                 if job:
                     self.server.stats("", "Sending result to client")
 
-                    zip_filepath = job.getResultPath("results.zip")
-                    with zipfile.ZipFile(zip_filepath, "w") as zfile:
-                        for frame in job.frames:
-                            if frame.status == netrender.model.FRAME_DONE:
-                                for filename in frame.results:
-                                    filepath = job.getResultPath(filename)
-                                    
+                    query = urllib.parse.parse_qs(urllib.parse.urlsplit(self.path).query)
+                    frame_ranges = parseFrameRanges(query.get("frames", [""])[0])
+
+                    results = [(job.getResultPath(filename), filename)
+                               for frame in job.frames
+                               if frame.status == netrender.model.FRAME_DONE and frameInRanges(frame.number, frame_ranges)
+                               for filename in frame.results]
+
+                    # results are already compressed, they are stored as is
+                    if sys.version_info >= (3, 5):
+                        # the archive is written straight to the connection (no length, it ends when the connection closes)
+                        self.send_head(content = "application/x-zip-compressed")
+
+                        with zipfile.ZipFile(self.wfile, "w", zipfile.ZIP_STORED) as zfile:
+                            for filepath, filename in results:
+                                zfile.write(filepath, filename)
+                    else:
+                        # zipfile can't write to an unseekable stream before python 3.5, build the archive in a
+                        # temporary file first (not shared, requests for different frames can run at the same time)
+                        with tempfile.TemporaryFile(dir = job.save_path) as f:
+                            with zipfile.ZipFile(f, "w", zipfile.ZIP_STORED) as zfile:
+                                for filepath, filename in results:
                                     zfile.write(filepath, filename)
-                                    
-                    
-                    f = open(zip_filepath, 'rb')
-                    self.send_head(content = "application/x-zip-compressed")
-                    shutil.copyfileobj(f, self.wfile)
-                    f.close()
+
+                            self.send_head(headers = {"content-length": str(f.tell())}, content = "application/x-zip-compressed")
+                            f.seek(0)
+                            shutil.copyfileobj(f, self.wfile)
                 else:
                     # no such job id
                     self.send_head(http.client.NO_CONTENT)
@@ -387,10 +544,7 @@ class RenderHandler(http.server.BaseHTTPRequestHandler):
                             thumbname = thumbnail.generate(filename)
 
                             if thumbname:
-                                f = open(thumbname, 'rb')
-                                self.send_head(content = "image/jpeg")
-                                shutil.copyfileobj(f, self.wfile)
-                                f.close()
+                                self.send_file(thumbname, content = "image/jpeg")
                             else: # thumbnail couldn't be generated
                                 self.send_head(http.client.PARTIAL_CONTENT)
                                 return
@@ -423,13 +577,7 @@ class RenderHandler(http.server.BaseHTTPRequestHandler):
                             self.send_head(http.client.PROCESSING)
                         else:
                             self.server.stats("", "Sending log to client")
-                            f = open(frame.log_path, 'rb')
-
-                            self.send_head(content = "text/plain")
-
-                            shutil.copyfileobj(f, self.wfile)
-
-                            f.close()
+                            self.send_file(frame.log_path, content = "text/plain")
                     else:
                         # no such frame
                         self.send_head(http.client.NO_CONTENT)
@@ -466,8 +614,9 @@ class RenderHandler(http.server.BaseHTTPRequestHandler):
             else: # status of all jobs
                 message = []
 
-                for job in self.server:
-                    message.append(job.serialize())
+                with self.server.lock:
+                    for job in self.server:
+                        message.append(job.serialize())
 
 
             self.server.stats("", "Sending status")
@@ -476,24 +625,17 @@ class RenderHandler(http.server.BaseHTTPRequestHandler):
 
         # =-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
         elif self.path == "/job":
-            self.server.balance()
-
             slave_id = self.headers['slave-id']
 
             slave = self.server.getSeenSlave(slave_id)
 
             if slave: # only if slave id is valid
-                job, frames = self.server.newDispatch(slave)
+                # with a wait timeout, the request is held until there's something to dispatch
+                wait_timeout = self.getWaitTimeout()
+                start_time = time.time()
+                job, frames = self.server.waitDispatch(slave, wait_timeout)
 
                 if job and frames:
-                    for f in frames:
-                        print("dispatch", f.number)
-                        f.status = netrender.model.FRAME_DISPATCHED
-                        f.slave = slave
-
-                    slave.job = job
-                    slave.job_frames = [f.number for f in frames]
-
                     self.send_head(headers={"job-id": job.id})
 
                     message = job.serialize(frames)
@@ -505,7 +647,12 @@ class RenderHandler(http.server.BaseHTTPRequestHandler):
                     slave.job = None
                     slave.job_frames = []
 
-                    self.send_head(http.client.ACCEPTED)
+                    # tell the slave it can ask again right away only when the request was really held
+                    headers = {}
+                    if wait_timeout and time.time() - start_time >= wait_timeout:
+                        headers["job-waited"] = str(wait_timeout)
+
+                    self.send_head(http.client.ACCEPTED, headers=headers)
             else: # invalid slave id
                 self.send_head(http.client.NO_CONTENT)
         # =-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
@@ -530,12 +677,7 @@ class RenderHandler(http.server.BaseHTTPRequestHandler):
 
                     if render_file:
                         self.server.stats("", "Sending file to slave")
-                        f = open(render_file.filepath, 'rb')
-
-                        self.send_head()
-                        shutil.copyfileobj(f, self.wfile)
-
-                        f.close()
+                        self.send_file(render_file.filepath)
                     else:
                         # no such file
                         self.send_head(http.client.NO_CONTENT)
@@ -550,8 +692,9 @@ class RenderHandler(http.server.BaseHTTPRequestHandler):
 
             self.server.stats("", "Sending slaves status")
 
-            for slave in self.server.slaves:
-                message.append(slave.serialize())
+            with self.server.lock:
+                for slave in self.server.slaves:
+                    message.append(slave.serialize())
 
             self.send_head()
 
@@ -583,11 +726,16 @@ class RenderHandler(http.server.BaseHTTPRequestHandler):
             for frame in job_info.frames:
                 frame = job.addFrame(frame.number, frame.command)
 
-            self.server.addJob(job)
+            # files are tested before the job is added, nothing else can see it yet
+            started = job.testStart()
+
+            with self.server.lock:
+                self.server.addJob(job)
+                self.server.journalJob(job)
 
             headers={"job-id": job_id}
 
-            if job.testStart():
+            if started:
                 self.server.stats("", "New job, started")
                 self.send_head(headers=headers, content = None)
             else:
@@ -599,13 +747,17 @@ class RenderHandler(http.server.BaseHTTPRequestHandler):
 
             if match:
                 job_id = match.groups()[0]
+                info_map = self.getInfoMap()
 
-                job = self.server.getJobID(job_id)
+                with self.server.lock:
+                    job = self.server.getJobID(job_id)
 
-                if job:
-                    info_map = self.getInfoMap()
+                    if job:
+                        job.edit(info_map)
+                        self.server.balancer.invalidate() # priority or category may have changed
+                        self.server.journalJob(job)
 
-                    job.edit(info_map)
+                if job:
                     self.send_head(content = None)
                 else:
                     # no such job id
@@ -616,22 +768,28 @@ class RenderHandler(http.server.BaseHTTPRequestHandler):
         # =-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
         elif self.path == "/balance_limit":
             info_map = self.getInfoMap()
-            for rule_id, limit in info_map.items():
-                try:
-                    rule = self.server.balancer.ruleByID(rule_id)
-                    if rule:
-                        rule.setLimit(limit)
-                except:
-                    pass # invalid type
+            with self.server.lock:
+                for rule_id, limit in info_map.items():
+                    try:
+                        rule = self.server.balancer.ruleByID(rule_id)
+                        if rule:
+                            rule.setLimit(limit)
+                    except:
+                        pass # invalid type
+
+                self.server.balancer.invalidate()
 
             self.send_head(content = None)
         # =-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
         elif self.path == "/balance_enable":
             info_map = self.getInfoMap()
-            for rule_id, enabled in info_map.items():
-                rule = self.server.balancer.ruleByID(rule_id)
-                if rule:
-                    rule.enabled = enabled
+            with self.server.lock:
+                for rule_id, enabled in info_map.items():
+                    rule = self.server.balancer.ruleByID(rule_id)
+                    if rule:
+                        rule.enabled = enabled
+
+                self.server.balancer.invalidate()
 
             self.send_head(content = None)
         # =-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
@@ -644,11 +802,14 @@ class RenderHandler(http.server.BaseHTTPRequestHandler):
 
                 job_id = match.groups()[0]
 
-                job = self.server.getJobID(job_id)
+                with self.server.lock:
+                    job = self.server.getJobID(job_id)
+
+                    if job:
+                        self.server.removeJob(job, clear)
 
                 if job:
                     self.server.stats("", "Cancelling job")
-                    self.server.removeJob(job, clear)
                     self.send_head(content = None)
                 else:
                     # no such job id
@@ -666,11 +827,15 @@ class RenderHandler(http.server.BaseHTTPRequestHandler):
 
                 job_id = match.groups()[0]
 
-                job = self.server.getJobID(job_id)
+                with self.server.lock:
+                    job = self.server.getJobID(job_id)
+
+                    if job:
+                        job.pause(status)
+                        self.server.journalJob(job)
 
                 if job:
                     self.server.stats("", "Pausing job")
-                    job.pause(status)
                     self.send_head(content = None)
                 else:
                     # no such job id
@@ -697,15 +862,24 @@ class RenderHandler(http.server.BaseHTTPRequestHandler):
                 job_id = match.groups()[1]
                 job_frame = int(match.groups()[2])
 
-                job = self.server.getJobID(job_id)
+                with self.server.lock:
+                    job = self.server.getJobID(job_id)
+                    frame = None
+
+                    if job:
+                        if job_frame != 0:
+                            frame = job[job_frame]
+                            if frame:
+                                frame.reset(all)
+                                self.server.journalJob(job, [frame])
+                        else:
+                            job.reset(all)
+                            self.server.journalJob(job, job.frames)
 
                 if job:
                     if job_frame != 0:
-
-                        frame = job[job_frame]
                         if frame:
                             self.server.stats("", "Reset job frame")
-                            frame.reset(all)
                             self.send_head(content = None)
                         else:
                             # no such frame
@@ -713,7 +887,6 @@ class RenderHandler(http.server.BaseHTTPRequestHandler):
 
                     else:
                         self.server.stats("", "Reset job")
-                        job.reset(all)
                         self.send_head(content = None)
 
                 else: # job not found
@@ -745,11 +918,15 @@ class RenderHandler(http.server.BaseHTTPRequestHandler):
             slave = self.server.getSeenSlave(slave_id)
 
             if slave: # only if slave id is valid
-                job = self.server.getJobID(log_info.job_id)
+                with self.server.lock:
+                    job = self.server.getJobID(log_info.job_id)
+
+                    if job:
+                        job.addLog(log_info.frames)
+                        self.server.journalJob(job, [job[number] for number in log_info.frames if number in job])
 
                 if job:
                     self.server.stats("", "Log announcement")
-                    job.addLog(log_info.frames)
                     self.send_head(content = None)
                 else:
                     # no such job id
@@ -791,15 +968,28 @@ class RenderHandler(http.server.BaseHTTPRequestHandler):
 
                         # add same temp file + renames as slave
                         
-                        self.write_file(file_path)
+                        signature = self.write_file(file_path)
                         
                         rfile.filepath = file_path # set the new path
-                        found = rfile.updateStatus() # make sure we have the right file
+                        found = rfile.updateStatus(signature) # make sure we have the right file
+
+                        # testing the other files can hash them, only starting the job needs the lock
+                        started = found and job.testFiles()
+
+                        if started:
+                            job.initInfo()
+
+                            with self.server.lock:
+                                job.start()
+                                self.server.journalJob(job)
+                        elif found:
+                            with self.server.lock:
+                                self.server.journalJob(job)
                         
                         if not found: # checksum mismatch
                             self.server.stats("", "File upload but checksum mismatch, this shouldn't happen")
                             self.send_head(http.client.CONFLICT)
-                        elif job.testStart(): # started correctly
+                        elif started: # started correctly
                             self.server.stats("", "File upload, starting job")
                             self.send_head(content = None)
                         else:
@@ -837,23 +1027,33 @@ class RenderHandler(http.server.BaseHTTPRequestHandler):
                     if frame:
                         self.send_head(content = None)
 
-                        if job.hasRenderResult():
-                            if job_result == netrender.model.FRAME_DONE:
-                                frame.addDefaultRenderResult()
-                                self.write_file(job.getResultPath(frame.getRenderFilename()))
+                        if job.hasRenderResult() and job_result == netrender.model.FRAME_DONE:
+                            self.write_file(job.getResultPath(frame.getRenderFilename()))
+
+                        with self.server.lock:
+                            slave.finishedFrame(job_frame)
+
+                            # the job may have been cancelled while the result was uploaded
+                            if self.server.getJobID(job_id) is job:
+                                if job.hasRenderResult():
+                                    if job_result == netrender.model.FRAME_DONE:
+                                        frame.addDefaultRenderResult()
+
+                                    elif job_result == netrender.model.FRAME_ERROR:
+                                        # blacklist slave on this job on error
+                                        # slaves might already be in blacklist if errors on the whole chunk
+                                        if not slave.id in job.blacklist:
+                                            job.blacklist.append(slave.id)
 
-                            elif job_result == netrender.model.FRAME_ERROR:
-                                # blacklist slave on this job on error
-                                # slaves might already be in blacklist if errors on the whole chunk
-                                if not slave.id in job.blacklist:
-                                    job.blacklist.append(slave.id)
+                                frame.status = job_result
+                                frame.time = job_time
 
-                        slave.finishedFrame(job_frame)
+                                if job_result == netrender.model.FRAME_DONE:
+                                    job.addFrameTime(slave.id, job_time)
 
-                        frame.status = job_result
-                        frame.time = job_time
+                                job.testFinished()
 
-                        job.testFinished()
+                                self.server.journalJob(job, [frame])
 
                     else: # frame not found
                         self.send_head(http.client.NO_CONTENT)
@@ -888,17 +1088,29 @@ class RenderHandler(http.server.BaseHTTPRequestHandler):
                         if job_result == netrender.model.FRAME_DONE:
                             result_filename = self.headers['result-filename']
                             
-                            frame.results.append(result_filename)
                             self.write_file(job.getResultPath(result_filename))
                             
-                        if job_finished:
-                            job_time = float(self.headers['job-time'])
-                            slave.finishedFrame(job_frame)
-    
-                            frame.status = job_result
-                            frame.time = job_time
+                        with self.server.lock:
+                            if job_finished:
+                                slave.finishedFrame(job_frame)
+
+                            # the job may have been cancelled while the result was uploaded
+                            if self.server.getJobID(job_id) is job:
+                                if job_result == netrender.model.FRAME_DONE:
+                                    frame.results.append(result_filename)
+
+                                if job_finished:
+                                    job_time = float(self.headers['job-time'])
+
+                                    frame.status = job_result
+                                    frame.time = job_time
 
-                            job.testFinished()
+                                    if job_result == netrender.model.FRAME_DONE:
+                                        job.addFrameTime(slave.id, job_time)
+
+                                    job.testFinished()
+
+                                self.server.journalJob(job, [frame])
                     else: # frame not found
                         self.send_head(http.client.NO_CONTENT)
                 else: # job not found
@@ -966,13 +1178,26 @@ class RenderHandler(http.server.BaseHTTPRequestHandler):
                 self.send_head(http.client.NO_CONTENT)
 
 class RenderMasterServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    # each request is handled in its own thread, allow many slaves to connect at once
+    daemon_threads = True
+    request_queue_size = 256
+
+    # seconds between housekeeping tasks (slaves timeout, usage update, broadcast)
+    housekeeping_interval = 2
+
     def __init__(self, address, handler_class, path, force=False, subdir=True):
+        # protects jobs and slaves state between request threads and housekeeping
+        self.lock = threading.RLock()
+        # signaled when jobs or frames change, wakes up waiting slave requests
+        self.changed = threading.Condition(self.lock)
+        self.stopping = False
         self.jobs = []
         self.jobs_map = {}
         self.slaves = []
         self.slaves_map = {}
         self.job_id = 0
         self.force = force
+        self.journal = None
 
         if subdir:
             self.path = os.path.join(path, "master_" + str(os.getpid()))
@@ -991,6 +1216,11 @@ class RenderMasterServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
         self.balancer.addPriority(netrender.balancing.NewJobPriority())
         self.balancer.addPriority(netrender.balancing.MinimumTimeBetweenDispatchPriority(limit = 2))
 
+        # off by default, the job chunks setting is used as is
+        adaptive_chunks = netrender.balancing.AdaptiveChunks(self.countSlaves, limit = 5)
+        adaptive_chunks.enabled = False
+        self.balancer.addChunking(adaptive_chunks)
+
         super().__init__(address, handler_class)
 
     def restore(self, jobs, slaves, balancer = None):
@@ -1000,6 +1230,7 @@ class RenderMasterServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
         for job in self.jobs:
             self.jobs_map[job.id] = job
             self.job_id = max(self.job_id, int(job.id))
+            job.indexFrameTimes()
 
         self.slaves = slaves
         for slave in self.slaves:
@@ -1007,22 +1238,101 @@ class RenderMasterServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
         
         if balancer:
             self.balancer = balancer
+
+        self.balancer.invalidate()
         
 
+    def journalRecord(self, record):
+        if self.journal:
+            self.journal.append(record)
+
+    def journalJob(self, job, frames = None):
+        record = job.journalInfo()
+        record["type"] = netrender.journal.RECORD_JOB_INFO
+        self.journalRecord(record)
+
+        if frames:
+            self.journalRecord({
+                                "type": netrender.journal.RECORD_FRAMES,
+                                "id": job.id,
+                                "frames": [frame.journalState() for frame in frames]
+                                })
+
+    def journalSnapshot(self):
+        with self.lock:
+            records = [{"type": netrender.journal.RECORD_MASTER, "path": self.path, "job_id": self.job_id}]
+            records += [{"type": netrender.journal.RECORD_SLAVE, "slave": slave.serialize()} for slave in self.slaves]
+            records += [{"type": netrender.journal.RECORD_JOB, "job": job.journalState()} for job in self.jobs]
+
+        self.journal.write(records)
+
+    def journalReplay(self, records):
+        jobs = []
+        jobs_map = {}
+        slaves_map = {}
+
+        for record in records:
+            record_type = record["type"]
+
+            if record_type == netrender.journal.RECORD_MASTER:
+                self.job_id = max(self.job_id, record["job_id"])
+            elif record_type == netrender.journal.RECORD_SLAVE:
+                slave = MRenderSlave.journalMaterialize(record["slave"])
+                slaves_map[slave.id] = slave
+            elif record_type == netrender.journal.RECORD_SLAVE_REMOVE:
+                slaves_map.pop(record["id"], None)
+            elif record_type == netrender.journal.RECORD_JOB:
+                job = MRenderJob.journalMaterialize(record["job"], slaves_map)
+                jobs.append(job)
+                jobs_map[job.id] = job
+            elif record_type == netrender.journal.RECORD_JOB_REMOVE:
+                job = jobs_map.pop(record["id"], None)
+                if job:
+                    jobs.remove(job)
+            elif record_type == netrender.journal.RECORD_JOB_INFO:
+                job = jobs_map.get(record["id"])
+                if job:
+                    job.journalRestoreInfo(record)
+            elif record_type == netrender.journal.RECORD_FRAMES:
+                job = jobs_map.get(record["id"])
+                if job:
+                    for state in record["frames"]:
+                        frame = job[state[0]]
+                        if frame:
+                            frame.journalRestore(state, slaves_map)
+
+        # slaves still own the frames they were rendering, they'll time out if they don't come back
+        for job in jobs:
+            for frame in job.frames:
+                if frame.status == netrender.model.FRAME_DISPATCHED and frame.slave and frame.slave.id in slaves_map:
+                    slave = slaves_map[frame.slave.id]
+                    slave.job = job
+                    slave.job_frames.append(frame.number)
+
+        self.restore(jobs, list(slaves_map.values()))
+
     def nextJobID(self):
-        self.job_id += 1
-        return str(self.job_id)
+        with self.lock:
+            self.job_id += 1
+            return str(self.job_id)
 
     def addSlave(self, slave_info):
         slave = MRenderSlave(slave_info)
-        self.slaves.append(slave)
-        self.slaves_map[slave.id] = slave
+
+        with self.lock:
+            self.slaves.append(slave)
+            self.slaves_map[slave.id] = slave
+
+            self.journalRecord({"type": netrender.journal.RECORD_SLAVE, "slave": slave.serialize()})
 
         return slave.id
 
     def removeSlave(self, slave):
-        self.slaves.remove(slave)
-        self.slaves_map.pop(slave.id)
+        with self.lock:
+            self.slaves.remove(slave)
+            self.slaves_map.pop(slave.id)
+
+            self.journalRecord({"type": netrender.journal.RECORD_SLAVE_REMOVE, "id": slave.id})
 
     def getSlave(self, slave_id):
         return self.slaves_map.get(slave_id)
@@ -1047,9 +1357,84 @@ class RenderMasterServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
                     for f in slave.job_frames:
                         slave.job[f].status = netrender.model.FRAME_ERROR
 
+                    self.journalJob(slave.job, [slave.job[f] for f in slave.job_frames])
+
         for slave in removed:
             self.removeSlave(slave)
 
+    def housekeeping(self):
+        with self.lock:
+            self.timeoutSlaves()
+            self.updateUsage()
+
+            if self.journal and self.journal.needsCompaction():
+                self.journalSnapshot()
+
+            # time based balancing rules may have changed their mind
+            self.changed.notify_all()
+
+    def notifyChange(self):
+        with self.lock:
+            self.changed.notify_all()
+
+    def stopWaiting(self):
+        with self.lock:
+            self.stopping = True
+            self.changed.notify_all()
+
+    def dispatch(self, slave):
+        with self.lock:
+            self.balance()
+
+            job, frames = self.newDispatch(slave)
+
+            if job and frames:
+                for f in frames:
+                    print("dispatch", f.number)
+                    f.status = netrender.model.FRAME_DISPATCHED
+                    f.slave = slave
+
+                slave.job = job
+                slave.job_frames = [f.number for f in frames]
+
+                self.journalJob(job, frames)
+
+            return job, frames
+
+    def waitDispatch(self, slave, timeout):
+        end_time = time.time() + timeout
+
+        with self.lock:
+            job, frames = self.dispatch(slave)
+
+            while not (job and frames) and not self.stopping and slave.id in self.slaves_map:
+                remaining = end_time - time.time()
+                if remaining <= 0:
+                    break
+
+                self.changed.wait(remaining)
+                slave.seen()
+                job, frames = self.dispatch(slave)
+
+            return job, frames
+
+    def waitCancel(self, job_id, frame_number, timeout):
+        end_time = time.time() + timeout
+
+        with self.lock:
+            while True:
+                job = self.getJobID(job_id)
+                frame = job[frame_number] if job else None
+
+                if not frame:
+                    return True # canceled
+
+                remaining = end_time - time.time()
+                if remaining <= 0 or self.stopping:
+                    return False
+
+                self.changed.wait(remaining)
+
     def updateUsage(self):
         blend = 0.5
         for job in self.jobs:
@@ -1062,15 +1447,19 @@ class RenderMasterServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
                 if slave.job:
                     slave.job.usage += slave_usage
 
+        # usage based ratings changed, jobs are sorted again on next dispatch
+        self.balancer.invalidate()
 
     def clear(self, clear_files = False):
-        removed = self.jobs[:]
+        with self.lock:
+            removed = self.jobs[:]
 
-        for job in removed:
-            self.removeJob(job, clear_files)
+            for job in removed:
+                self.removeJob(job, clear_files)
 
     def balance(self):
-        self.balancer.balance(self.jobs)
+        with self.lock:
+            self.balancer.balance(self.jobs)
 
     def getJobs(self):
         return self.jobs
@@ -1087,27 +1476,35 @@ class RenderMasterServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
         return len(self.slaves)
 
     def removeJob(self, job, clear_files = False):
-        self.jobs.remove(job)
-        self.jobs_map.pop(job.id)
+        with self.lock:
+            self.jobs.remove(job)
+            self.jobs_map.pop(job.id)
+            self.balancer.invalidate()
+
+            self.journalRecord({"type": netrender.journal.RECORD_JOB_REMOVE, "id": job.id})
+
+            for slave in self.slaves:
+                if slave.job == job:
+                    slave.job = None
+                    slave.job_frames = []
 
         if clear_files:
             shutil.rmtree(job.save_path)
 
-        for slave in self.slaves:
-            if slave.job == job:
-                slave.job = None
-                slave.job_frames = []
-
     def addJob(self, job):
-        self.jobs.append(job)
-        self.jobs_map[job.id] = job
-
         # create job directory
         job.save_path = os.path.join(self.path, "job_" + job.id)
         verifyCreateDir(job.save_path)
 
         job.save()
 
+        with self.lock:
+            self.jobs.append(job)
+            self.jobs_map[job.id] = job
+            self.balancer.invalidate()
+
+            self.journalRecord({"type": netrender.journal.RECORD_JOB, "job": job.journalState()})
+
     def getJobID(self, id):
         return self.jobs_map.get(id)
 
@@ -1116,15 +1513,16 @@ class RenderMasterServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
             yield job
 
     def newDispatch(self, slave):
-        if self.jobs:
-            for job in self.jobs:
-                if (
-                    not self.balancer.applyExceptions(job)      # No exceptions
-                    and slave.id not in job.blacklist           # slave is not blacklisted
+        def accept(job):
+            return (
+                    slave.id not in job.blacklist           # slave is not blacklisted
                     and (not slave.tags or job.tags.issubset(slave.tags))  # slave doesn't use tags or slave has all job tags
-                         ):
-                    
-                    return job, job.getFrames()
+                    )
+
+        job = self.balancer.select(self.jobs, accept)
+
+        if job:
+            return job, job.getFrames(self.balancer.applyChunking(job, slave))
 
         return None, None
 
@@ -1132,29 +1530,49 @@ def clearMaster(path):
     shutil.rmtree(path)
 
 def createMaster(address, clear, force, path):
-    filepath = os.path.join(path, "blender_master.data")
+    journal = netrender.journal.Journal(path)
+    filepath = os.path.join(path, "blender_master.data") # saved by older versions
+
+    httpd = None
+
+    if not clear and journal.exists():
+        print("loading master journal:", journal.filepath)
+        try:
+            records = journal.read()
+        except (OSError, ValueError) as err:
+            print("Warning: can't read master journal (%s)" % err)
+            records = None
+
+        if records and isinstance(records[0], dict) and records[0].get("type") == netrender.journal.RECORD_MASTER:
+            httpd = RenderMasterServer(address, RenderHandler, records[0]["path"], force=force, subdir=False)
+            httpd.journalReplay(records)
+        else:
+            # the snapshot of the new master would write over it
+            print("Warning: unusable master journal, moved to", journal.moveAside())
 
-    if not clear and os.path.exists(filepath):
+    if not httpd and not clear and os.path.exists(filepath):
         print("loading saved master:", filepath)
         with open(filepath, 'rb') as f:
-            path, jobs, slaves = pickle.load(f)
+            master_path, jobs, slaves = pickle.load(f)
             
-            httpd = RenderMasterServer(address, RenderHandler, path, force=force, subdir=False)
+            httpd = RenderMasterServer(address, RenderHandler, master_path, force=force, subdir=False)
             httpd.restore(jobs, slaves)
-            
-            return httpd
 
-    return RenderMasterServer(address, RenderHandler, path, force=force)
+    if not httpd:
+        httpd = RenderMasterServer(address, RenderHandler, path, force=force)
+
+    # start the log with a snapshot of the restored state
+    httpd.journal = journal
+    httpd.journalSnapshot()
+
+    return httpd
 
 def saveMaster(path, httpd):
-    filepath = os.path.join(path, "blender_master.data")
-    
-    with open(filepath, 'wb') as f:
-        pickle.dump((httpd.path, httpd.jobs, httpd.slaves), f, pickle.HIGHEST_PROTOCOL)
+    httpd.journalSnapshot()
+    httpd.journal.close()
 
 def runMaster(address, broadcast, clear, force, path, update_stats, test_break,use_ssl=False,cert_path="",key_path=""):
     httpd = createMaster(address, clear, force, path)
-    httpd.timeout = 1
     httpd.stats = update_stats
     if use_ssl:
         import ssl
@@ -1163,26 +1581,32 @@ def runMaster(address, broadcast, clear, force, path, update_stats, test_break,u
         s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         s.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
 
-    start_time = time.time() - 2
+    # requests are accepted by the server's own selector loop (each one then handled in its thread),
+    # housekeeping runs here, on its own schedule, whatever the request traffic is.
+    server_thread = threading.Thread(target = httpd.serve_forever, kwargs = {"poll_interval": 0.5})
+    server_thread.daemon = True
+    server_thread.start()
 
-    while not test_break():
-        try:
-            httpd.handle_request()
-        except select.error:
-            pass
+    next_housekeeping = time.time()
 
-        if time.time() - start_time >= 2: # need constant here
-            httpd.timeoutSlaves()
+    while not test_break():
+        if time.time() >= next_housekeeping:
+            next_housekeeping = time.time() + httpd.housekeeping_interval
 
-            httpd.updateUsage()
+            httpd.housekeeping()
 
             if broadcast:
                 print("broadcasting address")
                 s.sendto(bytes("%i" % address[1], encoding='utf8'), 0, ('<broadcast>', 8000))
-                start_time = time.time()
 
+        time.sleep(0.1)
+
+    httpd.stopWaiting()
+    httpd.shutdown()
+    server_thread.join()
     httpd.server_close()
     if clear:
+        httpd.journal.remove()
         clearMaster(httpd.path)
     else:
         saveMaster(path, httpd)
@@ -204,6 +204,8 @@ def get(handler):
             message.append(rule.serialize())  
          for rule in handler.server.balancer.exceptions:
             message.append(rule.serialize())
+         for rule in handler.server.balancer.chunking:
+            message.append(rule.serialize())
          sendjson(message)
     #return all slaves list     
     elif handler.path == "/html/slaves":
@@ -419,6 +421,15 @@ def get(handler):
                         """<button title="edit limit" onclick="balance_edit('%s', '%s');">edit</button>""" % (rule.id(), str(rule.limit)) if hasattr(rule, "limit") else "&nbsp;"
                     )
 
+        for rule in handler.server.balancer.chunking:
+            rowTable(
+                        "chunking",
+                        checkbox("", rule.enabled, "balance_enable('%s', '%s')" % (rule.id(), str(not rule.enabled).lower())),
+                        rule,
+                        rule.str_limit() +
+                        """<button title="edit limit" onclick="balance_edit('%s', '%s');">edit</button>""" % (rule.id(), str(rule.limit)) if hasattr(rule, "limit") else "&nbsp;"
+                    )
+
         endTable()
         output("</body></html>")
 
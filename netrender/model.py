@@ -20,6 +20,8 @@ import netrender.versioning as versioning
 from netrender.utils import *
 
 import time
+import heapq
+import threading
 
 # Jobs status
 JOB_WAITING = 0 # before all data has been entered
@@ -266,10 +268,13 @@ class RenderJob:
         self.last_dispatched = 0.0
         self.frames = []
         self.transitions = []
+        self.unsigned_files = [] # files waiting for their signature, see signFiles
+
+        self._indexFrames()
         
         self._status = None
         
-        if info:
+        if info is not None: # jobs without frames are falsy
             self.type = info.type
             self.subtype = info.subtype
             self.name = info.name
@@ -309,6 +314,73 @@ class RenderJob:
             
         self._status = value
 
+    # Frame index, kept up to date by the frames on status change:
+    # number -> frame map, number of frames per status and a heap of queued frames (by position)
+    # frames can change status from several request threads on the master, the index has its own lock
+    def _indexFrames(self):
+        self._frames_lock = threading.Lock()
+        self._frames_map = {}
+        self._frames_position = {}
+        self._frames_count = {status: 0 for status in FRAME_STATUS_TEXT}
+        self._frames_queue = []
+
+        for frame in self.frames:
+            self._indexFrame(frame)
+
+    def _indexFrame(self, frame):
+        with self._frames_lock:
+            frame._job = self
+            self._frames_map[frame.number] = frame
+            self._frames_position[frame.number] = position = len(self._frames_position)
+            self._frames_count[frame.status] = self._frames_count.get(frame.status, 0) + 1
+            if frame.status == FRAME_QUEUED:
+                heapq.heappush(self._frames_queue, (position, frame.number))
+
+    def _frameStatusChanged(self, frame, old_status, new_status):
+        # called with _frames_lock held, see RenderFrame.status
+        self._frames_count[old_status] -= 1
+        self._frames_count[new_status] = self._frames_count.get(new_status, 0) + 1
+        if new_status == FRAME_QUEUED:
+            heapq.heappush(self._frames_queue, (self._frames_position[frame.number], frame.number))
+
+    def _appendFrame(self, frame):
+        self.frames.append(frame)
+        self._indexFrame(frame)
+        return frame
+
+    def queuedFrames(self, count):
+        """First queued frames (in job order), at most count of them"""
+        queue = self._frames_queue
+        frames = []
+        entries = []
+
+        with self._frames_lock:
+            while queue and len(frames) < count:
+                entry = heapq.heappop(queue)
+                frame = self._frames_map[entry[1]]
+
+                # skip entries of frames that were dispatched since they were queued, or queued twice
+                if frame.status == FRAME_QUEUED and (not entries or entry != entries[-1]):
+                    entries.append(entry)
+                    frames.append(frame)
+
+            # frames are only taken out of the queue when their status changes
+            for entry in entries:
+                heapq.heappush(queue, entry)
+
+        return frames
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for key in ("_frames_lock", "_frames_map", "_frames_position", "_frames_count", "_frames_queue"):
+            state.pop(key, None)
+        return state
+
+    def __setstate__(self, state):
+        state.setdefault("unsigned_files", [])
+        self.__dict__.update(state)
+        self._indexFrames()
+
     @property
     def time_started(self):
         started_time = None
@@ -348,27 +420,32 @@ class RenderJob:
             
             
         if isFileInFrames(): 
+            rfile = RenderFile(file_path, len(self.files), start, end, None)
+            self.files.append(rfile)
+
+            # signatures are computed all at once, when needed
             if signed:
-                signature = hashFile(file_path)
-            else:
-                signature = None
-            self.files.append(RenderFile(file_path, len(self.files), start, end, signature))
+                self.unsigned_files.append(rfile)
+
+    def signFiles(self, cache = None):
+        if self.unsigned_files:
+            signatures = hashFiles([rfile.filepath for rfile in self.unsigned_files], cache)
+            for rfile, signature in zip(self.unsigned_files, signatures):
+                rfile.signature = signature
+
+            self.unsigned_files = []
+
+            if cache:
+                cache.save()
 
     def addFrame(self, frame_number, command = ""):
-        frame = RenderFrame(frame_number, command)
-        self.frames.append(frame)
-        return frame
+        return self._appendFrame(RenderFrame(frame_number, command))
 
     def __len__(self):
         return len(self.frames)
 
     def countFrames(self, status=FRAME_QUEUED):
-        total = 0
-        for f in self.frames:
-            if f.status == status:
-                total += 1
-
-        return total
+        return self._frames_count.get(status, 0)
 
     def countSlaves(self):
         return len(set((frame.slave for frame in self.frames if frame.status == FRAME_DISPATCHED)))
@@ -377,33 +454,17 @@ class RenderJob:
         return JOB_STATUS_TEXT[self.status]
 
     def framesStatus(self):
-        results = {
-                                FRAME_QUEUED: 0,
-                                FRAME_DISPATCHED: 0,
-                                FRAME_DONE: 0,
-                                FRAME_ERROR: 0
-                            }
-
-        for frame in self.frames:
-            results[frame.status] += 1
-
-        return results
+        with self._frames_lock:
+            return self._frames_count.copy()
 
     def __contains__(self, frame_number):
-        for f in self.frames:
-            if f.number == frame_number:
-                return True
-        else:
-            return False
+        return frame_number in self._frames_map
 
     def __getitem__(self, frame_number):
-        for f in self.frames:
-            if f.number == frame_number:
-                return f
-        else:
-            return None
+        return self._frames_map.get(frame_number)
 
     def serialize(self, frames = None,withFiles=True,withFrames=True):
+        self.signFiles()
         min_frame = min((f.number for f in frames)) if frames else -1
         max_frame = max((f.number for f in frames)) if frames else -1
         data={
@@ -428,7 +489,10 @@ class RenderJob:
            data["files"]=[f.serialize() for f in self.files if f.start == -1 or not frames or (f.start <= max_frame and f.end >= min_frame)]
           
         if (withFrames):
-           data["frames"]=[f.serialize() for f in self.frames if not frames or f in frames]
+           if frames:
+               data["frames"]=[f.serialize() for f in frames]
+           else:
+               data["frames"]=[f.serialize() for f in self.frames]
            
         return data
     @staticmethod
@@ -447,6 +511,7 @@ class RenderJob:
         job.transitions = data["transitions"]
         job.files = [RenderFile.materialize(f) for f in data["files"]]
         job.frames = [RenderFrame.materialize(f) for f in data["frames"]]
+        job._indexFrames()
         job.chunks = data["chunks"]
         job.priority = data["priority"]
         job.usage = data["usage"]
@@ -463,13 +528,47 @@ class RenderJob:
 
 class RenderFrame:
     def __init__(self, number = 0, command = ""):
+        self._job = None # job indexing this frame
+        self._status = FRAME_QUEUED
         self.number = number
         self.time = 0
-        self.status = FRAME_QUEUED
         self.slave = None
         self.command = command
         self.results = []   # List of filename of result files associated with this frame
 
+    @property
+    def status(self):
+        """Status of the frame (queued, dispatched, done or error)"""
+        return self._status
+
+    @status.setter
+    def status(self, value):
+        job = self._job
+
+        if job:
+            # old status and index update must not interleave with another change
+            with job._frames_lock:
+                old_status = self._status
+                self._status = value
+
+                if old_status != value:
+                    job._frameStatusChanged(self, old_status, value)
+        else:
+            self._status = value
+
+    def __getstate__(self):
+        # the job indexes its frames again when restored
+        state = self.__dict__.copy()
+        state.pop("_job", None)
+        return state
+
+    def __setstate__(self, state):
+        # frames saved before status was a property
+        if "status" in state:
+            state["_status"] = state.pop("status")
+        state.setdefault("_job", None)
+        self.__dict__.update(state)
+
     def statusText(self):
         return FRAME_STATUS_TEXT[self.status]
 
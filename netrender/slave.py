@@ -16,8 +16,8 @@
 #
 # ##### END GPL LICENSE BLOCK #####
 
-import sys, os, platform, shutil
-import http, http.client, http.server
+import sys, os, platform, shutil, hashlib
+import http, http.client, http.server, socket
 import subprocess, time, threading
 import json
 
@@ -35,6 +35,14 @@ CANCEL_POLL_SPEED = 2
 MAX_TIMEOUT = 10
 INCREMENT_TIMEOUT = 1
 MAX_CONNECT_TRY = 10
+MAX_DOWNLOAD_TRY = 3
+
+# seconds the master can hold job and cancel requests before answering
+JOB_WAIT_TIMEOUT = MAX_TIMEOUT
+CANCEL_WAIT_TIMEOUT = MAX_TIMEOUT
+
+# seconds before a partial download left in the files cache (by a slave which stopped) is removed
+PARTIAL_EXPIRE = 24 * 60 * 60
 
 def clearSlave(path):
     shutil.rmtree(path)
@@ -55,9 +63,14 @@ def slave_Info(netsettings):
         
     return slave
 
-def testCancel(conn, job_id, frame_number):
+def waitTimeout(conn, wait_timeout):
+    # socket timeout has to outlast the time the master holds the request
+    if conn.timeout is not None and conn.timeout != socket._GLOBAL_DEFAULT_TIMEOUT:
+        conn.timeout = max(conn.timeout, wait_timeout + 5)
+
+def testCancel(conn, job_id, frame_number, wait_timeout = 0):
         with ConnectionContext():
-            conn.request("HEAD", "/status", headers={"job-id":job_id, "job-frame": str(frame_number)})
+            conn.request("HEAD", "/status", headers={"job-id":job_id, "job-frame": str(frame_number), "wait-timeout": str(wait_timeout)})
 
         # canceled if job isn't found anymore
         if responseStatus(conn) == http.client.NO_CONTENT:
@@ -65,14 +78,178 @@ def testCancel(conn, job_id, frame_number):
         else:
             return False
 
-def testFile(conn, job_id, slave_id, rfile, job_prefix, main_path=None):
+class FileCache:
+    """
+    Job files shared between jobs, stored by signature. Least recently used files are removed first.
+    The cache can be shared by several slaves, any file can be removed by another slave at any time.
+    """
+    def __init__(self, path, size_limit):
+        self.path = path
+        self.size_limit = size_limit
+        verifyCreateDir(path)
+
+    def filepath(self, signature):
+        return os.path.join(self.path, signature)
+
+    def partialPath(self, signature, slave_id):
+        # partial downloads are kept to be resumed, one per slave so they don't write to the same file
+        return self.filepath(signature) + "." + slave_id + ".part"
+
+    def get(self, signature):
+        filepath = self.filepath(signature)
+        try:
+            os.utime(filepath) # mark as recently used
+        except FileNotFoundError:
+            return None
+
+        return filepath
+
+    def add(self, signature, temp_path):
+        filepath = self.filepath(signature)
+        os.replace(temp_path, filepath)
+        self.trim(filepath)
+        return filepath
+
+    def trim(self, keep_path):
+        entries = []
+        total_size = 0
+
+        for filename in os.listdir(self.path):
+            filepath = os.path.join(self.path, filename)
+            try:
+                stat = os.stat(filepath)
+            except FileNotFoundError:
+                continue # removed by another slave
+
+            # downloads in progress (possibly by other slaves) aren't entries yet, unless they were abandoned
+            if filename.endswith(".part"):
+                if time.time() - stat.st_mtime > PARTIAL_EXPIRE:
+                    self.remove(filepath)
+                continue
+
+            total_size += stat.st_size
+            if filepath != keep_path:
+                entries.append((stat.st_mtime, stat.st_size, filepath))
+
+        entries.sort()
+
+        for mtime, size, filepath in entries:
+            if total_size <= self.size_limit:
+                break
+
+            self.remove(filepath)
+            total_size -= size
+
+    def remove(self, filepath):
+        try:
+            os.remove(filepath)
+        except FileNotFoundError:
+            pass # removed by another slave
+
+    def link(self, filepath, job_full_path):
+        verifyCreateDir(os.path.dirname(job_full_path))
+
+        if os.path.exists(job_full_path):
+            os.remove(job_full_path)
+
+        # job files are never modified in place (repathing writes a new file), a hard link is safe
+        # returns False when the file was removed from the cache in the meantime
+        try:
+            os.link(filepath, job_full_path)
+        except FileNotFoundError:
+            return False
+        except OSError:
+            try:
+                shutil.copyfile(filepath, job_full_path)
+            except FileNotFoundError:
+                return False
+
+        return True
+
+def sameFile(path, other_path):
+    try:
+        return os.path.samefile(path, other_path)
+    except FileNotFoundError:
+        return False # removed from the cache by another slave
+
+def downloadFile(conn, url, slave_id, temp_path, signature = None):
+    """Download to temp_path, resuming from what's already in it. Returns False on error or signature mismatch"""
+    offset = os.path.getsize(temp_path) if os.path.exists(temp_path) else 0
+
+    headers = {"slave-id":slave_id}
+    if offset:
+        headers["range"] = "bytes=%i-" % offset
+
+    with ConnectionContext():
+        conn.request("GET", url, headers=headers)
+    response = conn.getresponse()
+
+    if response.status == http.client.PARTIAL_CONTENT:
+        mode = "ab"
+    elif response.status == http.client.OK:
+        mode = "wb"
+        offset = 0
+    else:
+        response.read()
+        return False # file for job not returned by server
+
+    length = response.getheader("content-length")
+    length = int(length) if length else None
+    received = 0
+
+    m = hashlib.md5() if signature else None
+
+    if m and offset:
+        with open(temp_path, "rb") as f:
+            buf = f.read(FILE_BUFFER_SIZE)
+            while buf:
+                m.update(buf)
+                buf = f.read(FILE_BUFFER_SIZE)
+
+    with open(temp_path, mode) as f:
+        buf = response.read(FILE_BUFFER_SIZE)
+
+        while buf:
+            f.write(buf)
+            received += len(buf)
+            if m:
+                m.update(buf)
+            buf = response.read(FILE_BUFFER_SIZE)
+
+    if length is not None and received < length:
+        # connection closed before the end, keep what was received for the retry to resume from
+        raise http.client.IncompleteRead(b"", length - received)
+
+    if m and m.hexdigest() != signature:
+        print("Downloaded file signature mismatch!")
+        os.remove(temp_path)
+        return False
+
+    return True
+
+def downloadFileRetry(conn, url, slave_id, temp_path, signature = None):
+    for i in range(MAX_DOWNLOAD_TRY):
+        try:
+            return downloadFile(conn, url, slave_id, temp_path, signature)
+        except (OSError, http.client.HTTPException) as err:
+            # connection is reopened on the next request, download resumes where it stopped
+            print("Download interrupted (%s), retrying" % err)
+            conn.close()
+
+    return False
+
+def testFile(conn, job_id, slave_id, rfile, job_prefix, main_path=None, cache=None):
     job_full_path = createLocalPath(rfile, job_prefix, main_path, rfile.force)
     
     found = os.path.exists(job_full_path)
     
     if found and rfile.signature != None:
-        found_signature = hashFile(job_full_path)
-        found = found_signature == rfile.signature
+        cache_path = cache.get(rfile.signature) if cache else None
+
+        # no need to hash files linked from the cache
+        if not cache_path or not sameFile(cache_path, job_full_path):
+            found_signature = hashFile(job_full_path)
+            found = found_signature == rfile.signature
         
         if not found:
             print("Found file %s at %s but signature mismatch!" % (rfile.filepath, job_full_path))
@@ -81,30 +258,60 @@ def testFile(conn, job_id, slave_id, rfile, job_prefix, main_path=None):
     if not found:
         # Force prefix path if not found
         job_full_path = createLocalPath(rfile, job_prefix, main_path, True)
-        print("Downloading", job_full_path)
-        temp_path = os.path.join(job_prefix, "slave.temp")
-        with ConnectionContext():
-            conn.request("GET", fileURL(job_id, rfile.index), headers={"slave-id":slave_id})
-        response = conn.getresponse()
 
-        if response.status != http.client.OK:
-            return None # file for job not returned by server, need to return an error code to server
+        if cache and rfile.signature != None:
+            # another slave sharing the cache can remove the file before it's linked, get it again then
+            for i in range(MAX_DOWNLOAD_TRY):
+                cache_path = cache.get(rfile.signature)
 
-        f = open(temp_path, "wb")
-        buf = response.read(1024)
+                if cache_path:
+                    print("Using cached", job_full_path)
+                else:
+                    print("Downloading", job_full_path)
+                    temp_path = cache.partialPath(rfile.signature, slave_id)
+                    if not downloadFileRetry(conn, fileURL(job_id, rfile.index), slave_id, temp_path, rfile.signature):
+                        return None # need to return an error code to server
 
-        while buf:
-            f.write(buf)
-            buf = response.read(1024)
+                    cache_path = cache.add(rfile.signature, temp_path)
 
-        f.close()
+                if cache.link(cache_path, job_full_path):
+                    break
+            else:
+                return None # need to return an error code to server
+        else:
+            print("Downloading", job_full_path)
+            temp_path = os.path.join(job_prefix, "slave.temp")
+
+            # without signature, there's no telling what a leftover temp file belongs to
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
 
-        os.renames(temp_path, job_full_path)
+            if not downloadFileRetry(conn, fileURL(job_id, rfile.index), slave_id, temp_path, rfile.signature):
+                return None # need to return an error code to server
+
+            os.renames(temp_path, job_full_path)
         
     rfile.filepath = job_full_path
 
     return job_full_path
 
+def watchCancel(conn, job_id, frame_number, data):
+    # the master answers when the job is cancelled (or the wait timed out), no need to poll
+    HTTPConnection = type(conn)
+    watch_conn = HTTPConnection(conn.host, conn.port, timeout = CANCEL_WAIT_TIMEOUT + 5)
+
+    try:
+        while not data.cancelled and not data.finished:
+            try:
+                if testCancel(watch_conn, job_id, frame_number, CANCEL_WAIT_TIMEOUT):
+                    data.master_cancelled = True
+                    data.cancelled = True
+            except (OSError, http.client.HTTPException):
+                watch_conn.close()
+                time.sleep(CANCEL_POLL_SPEED)
+    finally:
+        watch_conn.close()
+
 def breakable_timeout(timeout):
     for i in range(timeout):
         time.sleep(1)
@@ -150,14 +357,22 @@ def render_slave(engine, netsettings, threads):
 
         slave_id = response.getheader("slave-id")
 
+        waitTimeout(conn, JOB_WAIT_TIMEOUT)
+
         NODE_PREFIX = os.path.join(slave_path, "slave_" + slave_id)
         verifyCreateDir(NODE_PREFIX)
 
+        # files cache is kept between sessions, its size is limited instead
+        if netsettings.slave_cache_size:
+            cache = FileCache(os.path.join(slave_path, "cache"), netsettings.slave_cache_size * 1024 * 1024)
+        else:
+            cache = None
+
         engine.update_stats("", "Network render connected to master, waiting for jobs")
 
         while not engine.test_break():
             with ConnectionContext():
-                conn.request("GET", "/job", headers={"slave-id":slave_id})
+                conn.request("GET", "/job", headers={"slave-id":slave_id, "wait-timeout": str(JOB_WAIT_TIMEOUT)})
             response = conn.getresponse()
 
             if response.status == http.client.OK:
@@ -178,12 +393,12 @@ def render_slave(engine, netsettings, threads):
                     job_path = job.files[0].original_path # original path of the first file
                     main_path, main_file = os.path.split(job_path)
 
-                    job_full_path = testFile(conn, job.id, slave_id, job.files[0], job_prefix)
+                    job_full_path = testFile(conn, job.id, slave_id, job.files[0], job_prefix, cache=cache)
                     print("Fullpath", job_full_path)
                     print("File:", main_file, "and %i other files" % (len(job.files) - 1,))
 
                     for rfile in job.files[1:]:
-                        testFile(conn, job.id, slave_id, rfile, job_prefix, main_path)
+                        testFile(conn, job.id, slave_id, rfile, job_prefix, main_path, cache=cache)
                         print("\t", rfile.filepath)
                         
                     netrender.repath.update(job)
@@ -251,6 +466,8 @@ def render_slave(engine, netsettings, threads):
                         self.lock = threading.Lock()
                         self.stdout = bytes()
                         self.cancelled = False
+                        self.master_cancelled = False
+                        self.finished = False
                         self.start_time = time.time()
                         self.last_time = time.time()
                         
@@ -267,11 +484,16 @@ def render_slave(engine, netsettings, threads):
                 process_thread = threading.Thread(target=run_process, args=(process, data))
                 
                 process_thread.start()
+
+                cancel_thread = threading.Thread(target=watchCancel, args=(conn, job.id, first_frame, data))
+                cancel_thread.daemon = True
+                cancel_thread.start()
                 
                 while not data.cancelled and process_thread.is_alive():
                     time.sleep(CANCEL_POLL_SPEED / 2)
                     current_time = time.time()
-                    data.cancelled = engine.test_break()
+                    # don't lose a cancel pushed by the master in the meantime
+                    data.cancelled = data.cancelled or engine.test_break()
                     if current_time - data.last_time > CANCEL_POLL_SPEED:
 
                         data.lock.acquire()
@@ -300,13 +522,17 @@ def render_slave(engine, netsettings, threads):
                         data.lock.release()
 
                         data.last_time = current_time
-                        if testCancel(conn, job.id, first_frame):
-                            engine.update_stats("", "Job canceled by Master")
-                            data.cancelled = True
+
+                if data.master_cancelled:
+                    engine.update_stats("", "Job canceled by Master")
                 
                 process_thread.join()
                 del process_thread
 
+                # cancel watcher exits on its own once the master answers
+                data.finished = True
+                del cancel_thread
+
                 if job.type == netrender.model.JOB_BLENDER:
                     netrender.repath.reset(job)
 
@@ -413,6 +639,15 @@ def render_slave(engine, netsettings, threads):
                             continue
 
                 engine.update_stats("", "Network render connected to master, waiting for jobs")
+            elif response.status == http.client.ACCEPTED:
+                response.read()
+
+                if response.getheader("job-waited"):
+                    # master already waited for a job, ask again right away
+                    bisleep.reset()
+                else:
+                    # master answered at once (older or stopping master), back off
+                    bisleep.sleep()
             else:
                 bisleep.sleep()
 
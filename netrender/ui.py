@@ -167,6 +167,7 @@ class RENDER_PT_network_slave_settings(NetRenderButtonsPanel, bpy.types.Panel):
         layout.prop(netsettings, "slave_render")
         layout.prop(netsettings, "slave_bake")
         layout.prop(netsettings, "use_slave_clear")
+        layout.prop(netsettings, "slave_cache_size")
         layout.prop(netsettings, "use_slave_thumb")
         layout.prop(netsettings, "use_slave_output_log")
         layout.label(text="Threads:")
@@ -438,6 +439,13 @@ class NetRenderSettings(bpy.types.PropertyGroup):
                         description="delete downloaded files on exit",
                         default = True)
         
+        NetRenderSettings.slave_cache_size = IntProperty(
+                        name="Cache size (MB)",
+                        description="Size limit of the files cache shared between jobs, least recently used files are removed first (0 for no cache)",
+                        default = 10240,
+                        min=0,
+                        max=1048576)
+        
         NetRenderSettings.use_slave_thumb = BoolProperty(
                         name="Generate thumbnails",
                         description="Generate thumbnails on slaves instead of master",
@@ -19,6 +19,8 @@
 import sys, os, re, platform
 import http, http.client, http.server, socket
 import subprocess, time, hashlib
+import json
+import concurrent.futures
 
 import netrender, netrender.model
 
@@ -222,8 +224,36 @@ def fileURL(job_id, file_index):
 def logURL(job_id, frame_number):
     return "/log_%s_%i.log" % (job_id, frame_number)
 
-def resultURL(job_id):
-    return "/result_%s.zip" % job_id
+def resultURL(job_id, frame_ranges = None):
+    if frame_ranges:
+        return "/result_%s.zip?frames=%s" % (job_id, formatFrameRanges(frame_ranges))
+    else:
+        return "/result_%s.zip" % job_id
+
+def formatFrameRanges(frame_ranges):
+    # frame ranges are (first, last) or (frame,) tuples, as "1-10,12"
+    return ",".join("-".join(str(n) for n in r) for r in frame_ranges)
+
+def parseFrameRanges(text):
+    frame_ranges = []
+    for part in text.split(","):
+        try:
+            frame_ranges.append(tuple(int(n) for n in part.split("-", 1)))
+        except ValueError:
+            pass # invalid or empty range
+
+    return frame_ranges
+
+def frameInRanges(frame_number, frame_ranges):
+    # no ranges means all frames
+    if not frame_ranges:
+        return True
+
+    for r in frame_ranges:
+        if r[0] <= frame_number <= r[-1]:
+            return True
+
+    return False
 
 def renderURL(job_id, frame_number):
     return "/render_%s_%i.exr" % (job_id, frame_number)
@@ -231,12 +261,73 @@ def renderURL(job_id, frame_number):
 def cancelURL(job_id):
     return "/cancel_%s" % (job_id)
 
+# read size when hashing or copying files
+FILE_BUFFER_SIZE = 1024 * 1024
+
 def hashFile(path):
-    f = open(path, "rb")
-    value = hashData(f.read())
-    f.close()
-    return value
+    # hash by blocks, files can be much larger than memory
+    m = hashlib.md5()
+    with open(path, "rb") as f:
+        buf = f.read(FILE_BUFFER_SIZE)
+        while buf:
+            m.update(buf)
+            buf = f.read(FILE_BUFFER_SIZE)
+    return m.hexdigest()
     
+class SignatureCache:
+    """Signatures of files, stored on disk and keyed by path, valid as long as size and modification time match"""
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.signatures = {}
+        self.modified = False
+
+        if os.path.exists(filepath):
+            try:
+                with open(filepath, "r", encoding="utf8") as f:
+                    self.signatures = json.load(f)
+            except ValueError:
+                print("Invalid signature cache, ignoring", filepath)
+
+    @staticmethod
+    def fileKey(path):
+        stat = os.stat(path)
+        return [stat.st_size, stat.st_mtime]
+
+    def get(self, path):
+        entry = self.signatures.get(path)
+        if entry and entry[:2] == self.fileKey(path):
+            return entry[2]
+
+        return None
+
+    def set(self, path, signature):
+        self.signatures[path] = self.fileKey(path) + [signature]
+        self.modified = True
+
+    def save(self):
+        if self.modified:
+            temp_path = self.filepath + ".temp"
+            with open(temp_path, "w", encoding="utf8") as f:
+                json.dump(self.signatures, f)
+            os.replace(temp_path, self.filepath)
+            self.modified = False
+
+def hashFiles(paths, cache = None, threads = None):
+    """Signatures of all paths (in the same order), files not in the cache are hashed in parallel"""
+    signatures = [cache.get(path) if cache else None for path in paths]
+    missing = [i for i, signature in enumerate(signatures) if signature is None]
+
+    if missing:
+        # hashing releases the GIL on large buffers, threads are enough to use all cores and disks
+        with concurrent.futures.ThreadPoolExecutor(max_workers = threads or os.cpu_count() or 1) as executor:
+            for i, signature in zip(missing, executor.map(hashFile, [paths[i] for i in missing])):
+                signatures[i] = signature
+
+                if cache:
+                    cache.set(paths[i], signature)
+
+    return signatures
+
 def hashData(data):
     m = hashlib.md5()
     m.update(data)
@@ -21,7 +21,7 @@
 bl_info = {
     "name": "3D Print Toolbox",
     "author": "Campbell Barton",
-    "blender": (2, 65, 0),
+    "blender": (2, 75, 0),
     "location": "3D View > Toolbox",
     "description": "Utilities for 3D printing",
     "warning": "",
@@ -59,6 +59,89 @@ def bmesh_copy_from_object(obj, transform=True, triangulate=True, apply_modifier
     return bm
 
 
+class MeshAnalysis:
+    """
+    Mesh data shared by the checks run on an object,
+    the BMesh copies are made once, when first needed.
+    """
+    def __init__(self, obj):
+        self.obj = obj
+        self._bm_local = None
+        self._bm_world = None
+        self._data_hash = None
+
+    def bmesh_local(self):
+        """
+        Copy of the mesh (not transformed, not triangulated), don't modify.
+        """
+        if self._bm_local is None:
+            self._bm_local = bmesh_copy_from_object(self.obj, transform=False, triangulate=False)
+        return self._bm_local
+
+    def bmesh_world(self):
+        """
+        Transformed copy of the mesh with normals (not triangulated), don't modify.
+        """
+        if self._bm_world is None:
+            self._bm_world = bmesh_copy_from_object(self.obj, transform=True, triangulate=False)
+            self._bm_world.normal_update()
+        return self._bm_world
+
+    def _calc_data_hash(self):
+        import hashlib
+
+        obj = self.obj
+        if obj.mode == 'EDIT':
+            obj.update_from_editmode()
+        me = obj.data
+
+        co = array.array('f', [0.0]) * (len(me.vertices) * 3)
+        me.vertices.foreach_get("co", co)
+        edges = array.array('i', [0]) * (len(me.edges) * 2)
+        me.edges.foreach_get("vertices", edges)
+        loops = array.array('i', [0]) * len(me.loops)
+        me.loops.foreach_get("vertex_index", loops)
+        faces = array.array('i', [0]) * len(me.polygons)
+        me.polygons.foreach_get("loop_total", faces)
+        matrix = array.array('f', [value for row in obj.matrix_world for value in row])
+
+        data_hash = hashlib.md5()
+        for data in (co, edges, loops, faces, matrix):
+            data_hash.update(data.tobytes())
+        return data_hash.hexdigest()
+
+    def data_hash(self):
+        """
+        Hash of the mesh geometry and transform, check results can be reused while it doesn't change.
+        """
+        if self._data_hash is None:
+            self._data_hash = self._calc_data_hash()
+        return self._data_hash
+
+    def prepare(self):
+        """
+        Make the hash and both copies now, so they all match the same mesh.
+        """
+        self.data_hash()
+        self.bmesh_local()
+        self.bmesh_world()
+
+    def is_current(self):
+        """
+        False when the object was removed, or its mesh changed since the hash was made.
+        """
+        try:
+            return self._calc_data_hash() == self.data_hash()
+        except ReferenceError:
+            return False
+
+    def free(self):
+        for bm in (self._bm_local, self._bm_world):
+            if bm is not None:
+                bm.free()
+        self._bm_local = self._bm_world = None
+
+
 def bmesh_from_object(obj):
     """
     Object/Edit Mode get mesh, use bmesh_to_object() to write back.
@@ -95,73 +178,31 @@ def bmesh_calc_area(bm):
     return sum(f.calc_area() for f in bm.faces)
 
 
-def bmesh_check_self_intersect_object(obj):
+def bmesh_check_self_intersect_object(obj, bm=None):
     """
     Check if any faces self intersect
 
     returns an array of edge index values.
+    bm: untransformed copy of the mesh to use (see MeshAnalysis), left unchanged.
     """
-    import bpy
+    from mathutils.bvhtree import BVHTree
 
     if not obj.data.polygons:
         return array.array('i', ())
 
-    # Heres what we do!
-    #
-    # * Take original Mesh.
-    # * Copy it and triangulate it (keeping list of original edge index values)
-    # * Move the BMesh into a temp Mesh.
-    # * Make a temp Object in the scene and assign the temp Mesh.
-    # * For every original edge - ray-cast on the object to find which intersect.
-    # * Report all edge intersections.
-
-    # Triangulate
-    bm = bmesh_copy_from_object(obj, transform=False, triangulate=False)
-    face_map_index_org = {f: i for i, f in enumerate(bm.faces)}
-    ret = bmesh.ops.triangulate(bm, faces=bm.faces)
-    face_map = ret["face_map"]
-    # map new index to original index
-    face_map_index = {i: face_map_index_org[face_map.get(f, f)] for i, f in enumerate(bm.faces)}
-    del face_map_index_org
-    del ret
-
-    # Create a real mesh (lame!)
-    scene = bpy.context.scene
-    me_tmp = bpy.data.meshes.new(name="~temp~")
-    bm.to_mesh(me_tmp)
-    bm.free()
-    obj_tmp = bpy.data.objects.new(name=me_tmp.name, object_data=me_tmp)
-    scene.objects.link(obj_tmp)
-    scene.update()
-    ray_cast = obj_tmp.ray_cast
-
-    faces_error = set()
-
-    EPS_NORMAL = 0.000001
-    EPS_CENTER = 0.01  # should always be bigger
-
-    for ed in me_tmp.edges:
-        v1i, v2i = ed.vertices
-        v1 = me_tmp.vertices[v1i]
-        v2 = me_tmp.vertices[v2i]
-
-        # setup the edge with an offset
-        co_1 = v1.co.copy()
-        co_2 = v2.co.copy()
-        co_mid = (co_1 + co_2) * 0.5
-        no_mid = (v1.normal + v2.normal).normalized() * EPS_NORMAL
-        co_1 = co_1.lerp(co_mid, EPS_CENTER) + no_mid
-        co_2 = co_2.lerp(co_mid, EPS_CENTER) + no_mid
-
-        co, no, index = ray_cast(co_1, co_2)
-        if index != -1:
-            faces_error.add(face_map_index[index])
+    # The tree is built from the faces (triangulated internally),
+    # overlapping it with itself finds the intersecting faces in one query,
+    # faces sharing vertices are not reported.
+    if bm is None:
+        bm = bmesh_copy_from_object(obj, transform=False, triangulate=False)
+        tree = BVHTree.FromBMesh(bm, epsilon=0.00001)
+        bm.free()
+    else:
+        tree = BVHTree.FromBMesh(bm, epsilon=0.00001)
 
-    scene.objects.unlink(obj_tmp)
-    bpy.data.objects.remove(obj_tmp)
-    bpy.data.meshes.remove(me_tmp)
+    overlap = tree.overlap(tree)
 
-    scene.update()
+    faces_error = {i for i_pair in overlap for i in i_pair}
 
     return array.array('i', faces_error)
 
@@ -191,12 +232,17 @@ def bmesh_face_points_random(f, num_points=1, margin=0.05):
         yield vecs[0] + u1 * side1 + u2 * side2
 
 
-def bmesh_check_thick_object(obj, thickness):
-
-    import bpy
+def bmesh_check_thick_object(obj, thickness, bm=None):
+    """
+    bm: transformed copy of the mesh to use (see MeshAnalysis), left unchanged.
+    """
+    from mathutils.bvhtree import BVHTree
 
     # Triangulate
-    bm = bmesh_copy_from_object(obj, transform=True, triangulate=False)
+    if bm is None:
+        bm = bmesh_copy_from_object(obj, transform=True, triangulate=False)
+    else:
+        bm = bm.copy()
     # map original faces to their index.
     face_index_map_org = {f: i for i, f in enumerate(bm.faces)}
     ret = bmesh.ops.triangulate(bm, faces=bm.faces)
@@ -206,15 +252,10 @@ def bmesh_check_thick_object(obj, thickness):
 
     # Convert new/old map to index dict.
 
-    # Create a real mesh (lame!)
-    scene = bpy.context.scene
-    me_tmp = bpy.data.meshes.new(name="~temp~")
-    bm.to_mesh(me_tmp)
-    # bm.free()  # delay free
-    obj_tmp = bpy.data.objects.new(name=me_tmp.name, object_data=me_tmp)
-    scene.objects.link(obj_tmp)
-    scene.update()
-    ray_cast = obj_tmp.ray_cast
+    # Ray cast on a tree of the triangles, no need for a real mesh
+    bm.faces.index_update()
+    tree = BVHTree.FromBMesh(bm)
+    ray_cast = tree.ray_cast
 
     EPS_BIAS = 0.0001
 
@@ -230,10 +271,11 @@ def bmesh_check_thick_object(obj, thickness):
             # Cast the ray backwards
             p_a = p - no_sta
             p_b = p - no_end
+            p_dir = p_b - p_a
 
-            co, no, index = ray_cast(p_a, p_b)
+            co, no, index, distance = ray_cast(p_a, p_dir, p_dir.length)
 
-            if index != -1:
+            if index is not None:
                 # Add the face we hit
                 for f_iter in (f, bm_faces_new[index]):
                     # if the face wasn't triangulated, just use existing
@@ -244,16 +286,9 @@ def bmesh_check_thick_object(obj, thickness):
     # finished with bm
     bm.free()
 
-    scene.objects.unlink(obj_tmp)
-    bpy.data.objects.remove(obj_tmp)
-    bpy.data.meshes.remove(me_tmp)
-
-    scene.update()
-
     return array.array('i', faces_error)
 
 
-
 def object_merge(context, objects):
     """
     Caller must remove.
@@ -110,11 +110,37 @@ class Print3DInfoArea(Operator):
 # ---------------
 # Geometry Checks
 
+# last result of each check: {bl_idname: (key, info)}
+_check_cache = {}
+
+
+def run_check(cls, analysis, info):
+    """
+    Append the results of a check to info,
+    reusing the last ones when the mesh and the settings the check uses didn't change.
+    """
+    print_3d = bpy.context.scene.print_3d
+    key = (analysis.obj.name,
+           analysis.data_hash(),
+           tuple(getattr(print_3d, attr) for attr in cls.check_settings))
+
+    cache = _check_cache.get(cls.bl_idname)
+    if cache is not None and cache[0] == key:
+        info.extend(cache[1])
+        return
+
+    info_check = []
+    cls.main_check(analysis.obj, info_check, analysis)
+    _check_cache[cls.bl_idname] = key, info_check
+    info.extend(info_check)
+
+
 def execute_check(self, context):
-    obj = context.active_object
+    analysis = mesh_helpers.MeshAnalysis(context.active_object)
 
     info = []
-    self.main_check(obj, info)
+    run_check(type(self), analysis, info)
+    analysis.free()
     report.update(*info)
 
     return {'FINISHED'}
@@ -124,12 +150,13 @@ class Print3DCheckSolid(Operator):
     """Check for geometry is solid (has valid inside/outside) and correct normals"""
     bl_idname = "mesh.print3d_check_solid"
     bl_label = "Print3D Check Solid"
+    check_settings = ()
 
     @staticmethod
-    def main_check(obj, info):
+    def main_check(obj, info, analysis):
         import array
 
-        bm = mesh_helpers.bmesh_copy_from_object(obj, transform=False, triangulate=False)
+        bm = analysis.bmesh_local()
 
         edges_non_manifold = array.array('i', (i for i, ele in enumerate(bm.edges)
                 if not ele.is_manifold))
@@ -142,8 +169,6 @@ class Print3DCheckSolid(Operator):
         info.append(("Bad Contig. Edges: %d" % len(edges_non_contig),
                     (bmesh.types.BMEdge, edges_non_contig)))
 
-        bm.free()
-
     def execute(self, context):
         return execute_check(self, context)
 
@@ -152,10 +177,11 @@ class Print3DCheckIntersections(Operator):
     """Check geometry for self intersections"""
     bl_idname = "mesh.print3d_check_intersect"
     bl_label = "Print3D Check Intersections"
+    check_settings = ()
 
     @staticmethod
-    def main_check(obj, info):
-        faces_intersect = mesh_helpers.bmesh_check_self_intersect_object(obj)
+    def main_check(obj, info, analysis):
+        faces_intersect = mesh_helpers.bmesh_check_self_intersect_object(obj, analysis.bmesh_local())
         info.append(("Intersect Face: %d" % len(faces_intersect),
                     (bmesh.types.BMFace, faces_intersect)))
 
@@ -168,15 +194,16 @@ class Print3DCheckDegenerate(Operator):
     """(zero area faces, zero length edges)"""
     bl_idname = "mesh.print3d_check_degenerate"
     bl_label = "Print3D Check Degenerate"
+    check_settings = ("threshold_zero",)
 
     @staticmethod
-    def main_check(obj, info):
+    def main_check(obj, info, analysis):
         import array
         scene = bpy.context.scene
         print_3d = scene.print_3d
         threshold = print_3d.threshold_zero
 
-        bm = mesh_helpers.bmesh_copy_from_object(obj, transform=False, triangulate=False)
+        bm = analysis.bmesh_local()
 
         faces_zero = array.array('i', (i for i, ele in enumerate(bm.faces) if ele.calc_area() <= threshold))
         edges_zero = array.array('i', (i for i, ele in enumerate(bm.edges) if ele.calc_length() <= threshold))
@@ -187,8 +214,6 @@ class Print3DCheckDegenerate(Operator):
         info.append(("Zero Edges: %d" % len(edges_zero),
                     (bmesh.types.BMEdge, edges_zero)))
 
-        bm.free()
-
     def execute(self, context):
         return execute_check(self, context)
 
@@ -197,9 +222,10 @@ class Print3DCheckDistorted(Operator):
     """Check for non-flat faces """
     bl_idname = "mesh.print3d_check_distort"
     bl_label = "Print3D Check Distorted Faces"
+    check_settings = ("angle_distort",)
 
     @staticmethod
-    def main_check(obj, info):
+    def main_check(obj, info, analysis):
         import array
 
         scene = bpy.context.scene
@@ -214,16 +240,13 @@ class Print3DCheckDistorted(Operator):
                     return True
             return False
 
-        bm = mesh_helpers.bmesh_copy_from_object(obj, transform=True, triangulate=False)
-        bm.normal_update()
+        bm = analysis.bmesh_world()
 
         faces_distort = array.array('i', (i for i, ele in enumerate(bm.faces) if face_is_distorted(ele)))
 
         info.append(("Non-Flat Faces: %d" % len(faces_distort),
                     (bmesh.types.BMFace, faces_distort)))
 
-        bm.free()
-
     def execute(self, context):
         return execute_check(self, context)
 
@@ -233,13 +256,14 @@ class Print3DCheckThick(Operator):
     """(relies on correct normals)"""
     bl_idname = "mesh.print3d_check_thick"
     bl_label = "Print3D Check Thickness"
+    check_settings = ("thickness_min",)
 
     @staticmethod
-    def main_check(obj, info):
+    def main_check(obj, info, analysis):
         scene = bpy.context.scene
         print_3d = scene.print_3d
 
-        faces_error = mesh_helpers.bmesh_check_thick_object(obj, print_3d.thickness_min)
+        faces_error = mesh_helpers.bmesh_check_thick_object(obj, print_3d.thickness_min, analysis.bmesh_world())
 
         info.append(("Thin Faces: %d" % len(faces_error),
                     (bmesh.types.BMFace, faces_error)))
@@ -252,22 +276,21 @@ class Print3DCheckSharp(Operator):
     """Check edges are below the sharpness preference"""
     bl_idname = "mesh.print3d_check_sharp"
     bl_label = "Print3D Check Sharp"
+    check_settings = ("angle_sharp",)
 
     @staticmethod
-    def main_check(obj, info):
+    def main_check(obj, info, analysis):
         scene = bpy.context.scene
         print_3d = scene.print_3d
         angle_sharp = print_3d.angle_sharp
 
-        bm = mesh_helpers.bmesh_copy_from_object(obj, transform=True, triangulate=False)
-        bm.normal_update()
+        bm = analysis.bmesh_world()
 
         edges_sharp = [ele.index for ele in bm.edges
                        if ele.is_manifold and ele.calc_face_angle_signed() > angle_sharp]
 
         info.append(("Sharp Edge: %d" % len(edges_sharp),
                     (bmesh.types.BMEdge, edges_sharp)))
-        bm.free()
 
     def execute(self, context):
         return execute_check(self, context)
@@ -277,9 +300,10 @@ class Print3DCheckOverhang(Operator):
     """Check faces don't overhang past a certain angle"""
     bl_idname = "mesh.print3d_check_overhang"
     bl_label = "Print3D Check Overhang"
+    check_settings = ("angle_overhang",)
 
     @staticmethod
-    def main_check(obj, info):
+    def main_check(obj, info, analysis):
         import math
         from mathutils import Vector
 
@@ -291,8 +315,7 @@ class Print3DCheckOverhang(Operator):
             info.append(("Skipping Overhang", ()))
             return
 
-        bm = mesh_helpers.bmesh_copy_from_object(obj, transform=True, triangulate=False)
-        bm.normal_update()
+        bm = analysis.bmesh_world()
 
         z_down = Vector((0, 0, -1.0))
         z_down_angle = z_down.angle
@@ -303,7 +326,6 @@ class Print3DCheckOverhang(Operator):
 
         info.append(("Overhang Face: %d" % len(faces_overhang),
                     (bmesh.types.BMFace, faces_overhang)))
-        bm.free()
 
     def execute(self, context):
         return execute_check(self, context)
@@ -324,17 +346,77 @@ class Print3DCheckAll(Operator):
         Print3DCheckOverhang,
         )
 
+    _timer = None
+
     def execute(self, context):
-        obj = context.active_object
+        analysis = mesh_helpers.MeshAnalysis(context.active_object)
 
         info = []
         for cls in self.check_cls:
-            cls.main_check(obj, info)
+            run_check(cls, analysis, info)
+        analysis.free()
 
         report.update(*info)
 
         return {'FINISHED'}
 
+    # From the UI the checks run one per timer event,
+    # the report fills in as they finish and the interface stays responsive.
+
+    def invoke(self, context, event):
+        # the mesh can be edited between checks, everything they use is made up front
+        analysis = mesh_helpers.MeshAnalysis(context.active_object)
+        try:
+            analysis.prepare()
+        except:
+            analysis.free()
+            raise
+
+        self._analysis = analysis
+        self._checks = list(self.check_cls)
+        self._info = []
+        self.report_progress(context)
+
+        wm = context.window_manager
+        self._timer = wm.event_timer_add(0.0, context.window)
+        wm.modal_handler_add(self)
+        return {'RUNNING_MODAL'}
+
+    def modal(self, context, event):
+        if event.type not in {'TIMER', 'ESC'}:
+            return {'PASS_THROUGH'}
+
+        finished = True
+        try:
+            if event.type == 'ESC':
+                self._checks.clear()
+            elif not self._analysis.is_current():
+                # results wouldn't match the cached mesh hash
+                self._checks.clear()
+                self._info.append(("Mesh changed, checks stopped", None))
+            else:
+                run_check(self._checks.pop(0), self._analysis, self._info)
+
+            self.report_progress(context)
+            finished = not self._checks
+        finally:
+            if finished:
+                context.window_manager.event_timer_remove(self._timer)
+                self._analysis.free()
+
+        return {'FINISHED'} if finished else {'RUNNING_MODAL'}
+
+    def report_progress(self, context):
+        info = self._info[:]
+        if self._checks:
+            info.append(("Checking... (%d of %d)" % (len(self.check_cls) - len(self._checks) + 1, len(self.check_cls)),
+                         None))
+        report.update(*info)
+
+        for area in context.screen.areas:
+            if area.type == 'VIEW_3D':
+                area.tag_redraw()
+
 
 class Print3DCleanIsolated(Operator):
     """Cleanup isolated vertices and edges"""